@@ -0,0 +1,25 @@
+'''
+Expansion of large sweeps by the loop control (data_container), without field evaluation.
+'''
+from micromagnet_simulator.loop_control.looping import linspace
+
+from .common import slanting_magnet
+
+class loop_expansion():
+	def setup(self):
+		self.w_slant = linspace(20, 80, 50, axis=0, name='w_slant', unit='nm')
+		self.h_slant = linspace(100, 300, 50, axis=1, name='h_slant', unit='nm')
+		self.umag = slanting_magnet(250, self.h_slant, self.w_slant)
+
+	def time_define_grid(self):
+		slanting_magnet(linspace(200, 300, 100, axis=2, name='d_magnet_magnet', unit='nm'),
+			linspace(100, 300, 100, axis=1, name='h_slant', unit='nm'), linspace(20, 80, 100, axis=0, name='w_slant', unit='nm'))
+
+	def time_expand_grid(self):
+		for data in self.umag.data.flat:
+			data.magnets
+
+	def time_random_access(self):
+		data = self.umag.data
+		for i in range(0, data.size, 25):
+			data[i].make_collection()
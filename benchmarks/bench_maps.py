@@ -0,0 +1,44 @@
+'''
+Field maps and their gradients of the slanting magnet design (plot_view/fields.field).
+'''
+from micromagnet_simulator.fields import field
+
+from .common import backends, slanting_magnet, setup_backend
+
+class field_maps():
+	params = backends
+	param_names = ['backend']
+
+	def setup(self, backend):
+		setup_backend(backend)
+		self.view = slanting_magnet().generate_view()
+		self.view.backend = backend
+
+	def time_slice_1d(self, backend):
+		self.view.set_slice('y', -1000, 1000, 2000, 0, -30)
+		self.view.field.field
+
+	def time_image_2d(self, backend):
+		self.view.set_image('xy', -500,500,200,-500,500,200, -30)
+		self.view.field.field
+
+	def time_grid_3d(self, backend):
+		self.view.field = field(self.view.collection, ((-500,500,40),(-500,500,40),(-60,0,10)), backend=backend)
+		self.view.field.field
+
+class gradients():
+	params = backends
+	param_names = ['backend']
+
+	def setup(self, backend):
+		setup_backend(backend)
+		self.view = slanting_magnet().generate_view()
+		self.view.backend = backend
+
+	def time_slice_1d(self, backend):
+		self.view.set_slice('y', -1000, 1000, 2000, 0, -30)
+		self.view.field.d_field
+
+	def time_image_2d(self, backend):
+		self.view.set_image('xy', -500,500,100,-500,500,100, -30)
+		self.view.field.d_field
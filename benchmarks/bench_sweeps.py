@@ -0,0 +1,26 @@
+'''
+Parameter sweeps of the slanting magnet design (umag_creator.generate_qubit_prop/fields.field_qubits).
+'''
+from micromagnet_simulator.loop_control.looping import linspace
+
+from .common import backends, slanting_magnet, setup_backend
+
+class sweeps():
+	params = backends
+	param_names = ['backend']
+
+	def setup(self, backend):
+		setup_backend(backend)
+		self.backend = backend
+
+	def _evaluate(self, umag):
+		view = umag.generate_qubit_prop()
+		view.backend = self.backend
+		view.field.d_field
+
+	def time_sweep_1d(self, backend):
+		self._evaluate(slanting_magnet(250, 200, linspace(20, 80, 20, axis=0, name='w_slant', unit='nm')))
+
+	def time_sweep_2d(self, backend):
+		self._evaluate(slanting_magnet(250, linspace(100, 300, 10, axis=1, name='h_slant', unit='nm'),
+			linspace(20, 80, 10, axis=0, name='w_slant', unit='nm')))
@@ -0,0 +1,57 @@
+'''
+Designs and helpers shared by the benchmarks.
+'''
+from micromagnet_simulator.magnet_creator import umag_creator
+from micromagnet_simulator.engine import set_field_cache, set_incremental_cache
+from micromagnet_simulator.engine import compiled
+
+backends = ['magpylib', 'numpy', 'compiled']
+
+def slanting_magnet(d_magnet_magnet=250, h_slant=200, w_slant=50, h_2deg=70, h_magnet=200):
+	'''
+	slanting magnet design of docs/source/examples/view_MM_qubit.py, the arguments can be loop objects.
+	'''
+	w_magnet = 5000
+	l_magnet = 2000
+
+	umag = umag_creator()
+	umag.set_magnetisation(1,0,0)
+
+	for y in (-200, -120, -40, 40, 120, 200):
+		umag.add_electron_position(0, y, -30)
+
+	# the big slabs
+	umag.add_cube(-w_magnet/2-d_magnet_magnet/2-w_slant/2, 0, h_2deg+h_magnet/2,
+		w_magnet,l_magnet,h_magnet)
+	umag.add_cube( w_magnet/2+d_magnet_magnet/2+w_slant/2, 0, h_2deg+h_magnet/2,
+		w_magnet,l_magnet,h_magnet)
+
+	# the small pieces above the rectangle
+	umag.add_cube(-d_magnet_magnet/2, h_magnet/4+h_slant/4, h_2deg+h_magnet/2,
+		w_slant,l_magnet/2-h_slant/2,h_magnet)
+	umag.add_cube( d_magnet_magnet/2, h_magnet/4+h_slant/4, h_2deg+h_magnet/2,
+		w_slant,l_magnet/2-h_slant/2,h_magnet)
+
+	# the slanted pieces.
+	p_2 = (-d_magnet_magnet/2-w_slant/2, -h_slant/2, h_2deg+h_magnet/2)
+	p_1 = (-d_magnet_magnet/2-w_slant/2,  h_slant/2, h_2deg+h_magnet/2)
+	p_3 = (-d_magnet_magnet/2+w_slant/2,  h_slant/2, h_2deg+h_magnet/2)
+	umag.add_triangle(*p_1, *p_2, *p_3, 'z',200, n_magnets=10)
+
+	p_2 = (d_magnet_magnet/2+w_slant/2, -h_slant/2, h_2deg+h_magnet/2)
+	p_1 = (d_magnet_magnet/2+w_slant/2,  h_slant/2, h_2deg+h_magnet/2)
+	p_3 = (d_magnet_magnet/2-w_slant/2,  h_slant/2, h_2deg+h_magnet/2)
+	umag.add_triangle(*p_1, *p_2, *p_3, 'z',200, n_magnets=10)
+
+	return umag
+
+def setup_backend(backend):
+	'''
+	check that a backend can be benchmarked and disable the caches, such that every call calculates the fields.
+	'''
+	if backend == 'compiled' and not compiled.available:
+		# asv convention : NotImplementedError in setup skips the benchmark.
+		raise NotImplementedError('numba is not installed')
+
+	set_field_cache(None)
+	set_incremental_cache(None)
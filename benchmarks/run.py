@@ -0,0 +1,194 @@
+'''
+Runner for the benchmarks of this directory.
+
+The benchmarks are written in the style of asv : classes in bench_*.py modules with a setup method and time_* methods,
+parametrised with params/param_names. Every benchmark is run once to warm up (imports, compilation), once with tracemalloc
+to measure the peak memory that is allocated during the call, and repeat times to measure the (best) wall time.
+The results can be stored as a baseline, such that later runs (e.g. after a magpylib upgrade) can be compared to it :
+
+	python benchmarks/run.py --save benchmarks/baseline.json
+	python benchmarks/run.py --compare benchmarks/baseline.json
+	python benchmarks/run.py --bench "maps.*numpy" --repeat 5
+'''
+import argparse
+import importlib
+import importlib.metadata
+import inspect
+import itertools
+import json
+import os
+import platform
+import re
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(_directory))
+
+def discover(pattern=None):
+	'''
+	benchmarks of the bench_*.py modules, as (name, class, method, params) tuples.
+
+	Args:
+		pattern (str) : regular expression, only the benchmarks of which the name matches are returned (None : all)
+	'''
+	for filename in sorted(os.listdir(_directory)):
+		if not (filename.startswith('bench_') and filename.endswith('.py')):
+			continue
+
+		module = importlib.import_module('benchmarks.' + filename[:-3])
+		for class_name, cls in inspect.getmembers(module, inspect.isclass):
+			if cls.__module__ != module.__name__:
+				continue
+
+			params = getattr(cls, 'params', None)
+			if params is None:
+				combinations = [()]
+			elif len(params) and isinstance(params[0], (list, tuple)):
+				combinations = list(itertools.product(*params))
+			else:
+				combinations = [(p,) for p in params]
+
+			for method in sorted(m for m in dir(cls) if m.startswith('time_')):
+				for combination in combinations:
+					name = '{}.{}.{}'.format(filename[:-3], class_name, method)
+					if combination:
+						name += '({})'.format(', '.join(str(p) for p in combination))
+					if pattern is None or re.search(pattern, name):
+						yield name, cls, method, combination
+
+def measure(cls, method, params, repeat=3):
+	'''
+	time and peak memory of a benchmark.
+
+	Returns:
+		result (dict) : best and median wall time (s) and peak memory allocated during a call (bytes), None if the benchmark is skipped
+	'''
+	instance = cls()
+	try:
+		if hasattr(instance, 'setup'):
+			instance.setup(*params)
+	except NotImplementedError:
+		return None
+
+	function = getattr(instance, method)
+	try:
+		function(*params)
+
+		tracemalloc.start()
+		tracemalloc.reset_peak()
+		try:
+			function(*params)
+			peak = tracemalloc.get_traced_memory()[1]
+		finally:
+			tracemalloc.stop()
+
+		times = []
+		for i in range(repeat):
+			start = time.perf_counter()
+			function(*params)
+			times.append(time.perf_counter() - start)
+	finally:
+		if hasattr(instance, 'teardown'):
+			instance.teardown(*params)
+
+	return {'time' : min(times), 'time_median' : float(np.median(times)), 'peak_memory' : peak}
+
+def machine_info():
+	info = {'python' : platform.python_version(), 'platform' : platform.platform(), 'processor' : platform.processor(),
+		'cpu_count' : os.cpu_count()}
+	for package in ('numpy', 'magpylib', 'numba'):
+		try:
+			info[package] = importlib.metadata.version(package)
+		except importlib.metadata.PackageNotFoundError:
+			info[package] = None
+	return info
+
+def _format_time(value):
+	for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+		if value >= scale:
+			return '{:.3g} {}'.format(value/scale, unit)
+	return '{:.3g} us'.format(value/1e-6)
+
+def _format_memory(value):
+	for unit, scale in (('GB', 2**30), ('MB', 2**20), ('kB', 2**10)):
+		if value >= scale:
+			return '{:.3g} {}'.format(value/scale, unit)
+	return '{} B'.format(value)
+
+def compare(results, baseline, threshold=1.5):
+	'''
+	ratios of the time and peak memory of results to a baseline.
+
+	Returns:
+		ratios (dict) : (time ratio, memory ratio) per benchmark that is in both
+		regressions (list<str>) : benchmarks of which the time or the peak memory grew by more than threshold
+	'''
+	ratios = {}
+	regressions = []
+	for name, result in results.items():
+		reference = baseline.get(name)
+		if result is None or reference is None:
+			continue
+		ratios[name] = (result['time']/reference['time'], (result['peak_memory'] + 1)/(reference['peak_memory'] + 1))
+		if max(ratios[name]) > threshold:
+			regressions.append(name)
+
+	return ratios, regressions
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='run the micromagnet_simulator benchmarks')
+	parser.add_argument('--bench', '-b', default=None, help='regular expression to select benchmarks by name')
+	parser.add_argument('--repeat', type=int, default=3, help='number of timed runs of every benchmark')
+	parser.add_argument('--save', default=None, help='store the results in this JSON file')
+	parser.add_argument('--compare', default=None, help='compare the results to a baseline JSON file')
+	parser.add_argument('--threshold', type=float, default=1.5, help='ratio to the baseline that is reported as a regression')
+	parser.add_argument('--list', action='store_true', help='only list the benchmarks')
+	args = parser.parse_args(argv)
+
+	benchmarks = list(discover(args.bench))
+	if args.list:
+		print('\n'.join(b[0] for b in benchmarks))
+		return 0
+
+	baseline = None
+	if args.compare is not None:
+		with open(args.compare) as f:
+			baseline = json.load(f)
+		if baseline['machine'] != machine_info():
+			print('note : the baseline was recorded on a different machine/software versions ({}).'.format(baseline['machine']))
+
+	width = max([len(b[0]) for b in benchmarks] + [10])
+	results = {}
+	for name, cls, method, params in benchmarks:
+		result = measure(cls, method, params, args.repeat)
+		results[name] = result
+
+		if result is None:
+			print('{:<{}}  skipped'.format(name, width))
+			continue
+
+		line = '{:<{}}  {:>10}  {:>10}'.format(name, width, _format_time(result['time']), _format_memory(result['peak_memory']))
+		if baseline is not None and name in baseline['results'] and baseline['results'][name] is not None:
+			ratios = compare({name : result}, baseline['results'], args.threshold)[0][name]
+			line += '  x{:.2f} time  x{:.2f} memory'.format(*ratios)
+		print(line, flush=True)
+
+	if args.save is not None:
+		with open(args.save, 'w') as f:
+			json.dump({'machine' : machine_info(), 'results' : results}, f, indent=1, sort_keys=True)
+
+	if baseline is not None:
+		regressions = compare(results, baseline['results'], args.threshold)[1]
+		if regressions:
+			print('\n{} regression(s) beyond x{} of the baseline :'.format(len(regressions), args.threshold))
+			print('\n'.join('\t' + name for name in regressions))
+			return 1
+
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,11 @@
+from micromagnet_simulator.engine.adaptive import quadtree
+from micromagnet_simulator.engine.box import box_field
+from micromagnet_simulator.engine.prism import prism_field, prisms_field
+from micromagnet_simulator.engine.sources import box_sources, prism_sources
+from micromagnet_simulator.engine.backends import get_backend, set_default_backend
+from micromagnet_simulator.engine.multipole import octree
+from micromagnet_simulator.engine.compiled import box_field_compiled
+from micromagnet_simulator.engine.cache import field_cache, set_field_cache, get_field_cache
+from micromagnet_simulator.engine.incremental import incremental_cache, set_incremental_cache, get_incremental_cache
+from micromagnet_simulator.engine.response import magnetisation_response
+from micromagnet_simulator.engine.profiling import profiler, profile, set_profiling, get_profiler
@@ -0,0 +1,279 @@
+'''
+Adaptive sampling of fields in a plane (quadtree) or along a line (bisection).
+
+The plane is covered by a coarse grid of cells, which are refined recursively (quadtree) where bilinear interpolation from the
+corners of a cell does not reproduce the values at its center and at the midpoints of its sides within a tolerance. Smooth regions are
+therefore sampled coarsely, while the sharp features close to the edges of magnets are sampled down to the finest level.
+All the samples lie on a lattice with the spacing of the finest level, samples that are shared between cells are evaluated once.
+The line is sampled in the same way, with intervals that are halved where linear interpolation does not reproduce the midpoint.
+'''
+import numpy as np
+
+# points of a cell (in units of half the cell size) : corners (0, 2, 6, 8), midpoints of the sides (1, 3, 5, 7) and center (4).
+_cell_points = np.array([(i, j) for j in range(3) for i in range(3)])
+_midpoints = [1, 3, 4, 5, 7]
+_interpolation = np.array([
+	[0.5, 0.5, 0, 0],
+	[0.5, 0, 0.5, 0],
+	[0.25, 0.25, 0.25, 0.25],
+	[0, 0.5, 0, 0.5],
+	[0, 0, 0.5, 0.5]])
+
+class quadtree():
+	def __init__(self, evaluate, bounds, n_cells=(8,8), max_depth=6, tolerance=1e-3, groups=None):
+		'''
+		sample a function adaptively on a rectangle.
+
+		Args:
+			evaluate (function) : evaluate(u, v) returns the values of the function at the points (u, v), shape (n, n_values)
+			bounds (tuple) : ((u_min, u_max), (v_min, v_max)) of the rectangle
+			n_cells (tuple) : number of cells of the coarse grid along u and v
+			max_depth (int) : maximal number of refinements of a coarse cell
+			tolerance (float) : maximal interpolation error of a cell, relative to the largest value of its group on the coarse grid
+			groups (list<list<int>>) : groups of values that share a scale for the tolerance, e.g. the components of the field (None : all values)
+		'''
+		self.evaluate = evaluate
+		self.bounds = np.asarray(bounds, dtype=float)
+		self.n_cells = tuple(n_cells)
+		self.max_depth = max_depth
+		self.tolerance = tolerance
+		self.groups = groups
+
+		# number of cells of the finest level, the samples are stored by their (integer) lattice coordinates.
+		self.shape = (self.n_cells[0]*2**max_depth, self.n_cells[1]*2**max_depth)
+		self._keys = np.zeros(0, dtype=np.int64)
+		self._values = None
+		self.n_evaluations = 0
+
+		self._build()
+
+	def _coordinates(self, i, j):
+		(u_min, u_max), (v_min, v_max) = self.bounds
+		return u_min + (u_max - u_min)*i/self.shape[0], v_min + (v_max - v_min)*j/self.shape[1]
+
+	def _sample(self, i, j):
+		'''
+		values at the lattice points (i, j), only the points that were not sampled before are evaluated.
+		'''
+		keys = i.astype(np.int64)*(self.shape[1] + 1) + j
+		new = np.unique(keys)
+		new = new[~np.isin(new, self._keys)]
+
+		if len(new):
+			values = np.asarray(self.evaluate(*self._coordinates(new//(self.shape[1] + 1), new%(self.shape[1] + 1))))
+			values = values.reshape(len(new), -1)
+			self.n_evaluations += len(new)
+
+			keys_all = np.concatenate([self._keys, new])
+			values_all = values if self._values is None else np.concatenate([self._values, values])
+			order = np.argsort(keys_all)
+			self._keys, self._values = keys_all[order], values_all[order]
+
+		return self._values[np.searchsorted(self._keys, keys)]
+
+	def _build(self):
+		size = 2**self.max_depth
+		i, j = np.meshgrid(np.arange(self.n_cells[0])*size, np.arange(self.n_cells[1])*size, indexing='ij')
+		i, j = i.ravel(), j.ravel()
+
+		self._sample(np.add.outer(i, [0, size, 0, size]), np.add.outer(j, [0, 0, size, size]))
+		finite = np.where(np.isfinite(self._values), np.abs(self._values), 0)
+		groups = [list(range(self._values.shape[1]))] if self.groups is None else self.groups
+		self.scale = np.ones(self._values.shape[1])
+		for group in groups:
+			self.scale[group] = max(np.max(finite[:,group]), np.finfo(float).tiny)
+
+		leaves = []
+		for level in range(self.max_depth + 1):
+			size = 2**(self.max_depth - level)
+			if level == self.max_depth or len(i) == 0:
+				leaves.append((i, j, np.full(len(i), size)))
+				break
+
+			half = size//2
+			values = self._sample(np.add.outer(i, _cell_points[:,0]*half), np.add.outer(j, _cell_points[:,1]*half))
+			expected = np.einsum('pc,ncv->npv', _interpolation, values[:,[0,2,6,8]])
+			error = np.abs(values[:,_midpoints] - expected)/self.scale
+			# cells with points on the surface of a magnet (NaN) are refined as well.
+			refine = ~np.all(error <= self.tolerance, axis=(1,2))
+
+			# all the points of the cells that are not refined are known, their four children are leaves.
+			child_i = np.add.outer(i, [0, half, 0, half])
+			child_j = np.add.outer(j, [0, 0, half, half])
+			leaves.append((child_i[~refine].ravel(), child_j[~refine].ravel(), np.full(4*np.sum(~refine), half)))
+			i, j = child_i[refine].ravel(), child_j[refine].ravel()
+
+		self.leaves = tuple(np.concatenate(leaf) for leaf in zip(*leaves))
+		i, j, size = self.leaves
+		self._corners = self._sample(i[:,np.newaxis] + np.outer(size, [0, 1, 0, 1]), j[:,np.newaxis] + np.outer(size, [0, 0, 1, 1]))
+
+	@property
+	def n_leaves(self):
+		return len(self.leaves[0])
+
+	def samples(self):
+		'''
+		all the points that were evaluated.
+
+		Returns:
+			u, v (np.ndarray) : coordinates of the points, shape (n,)
+			values (np.ndarray) : values at the points, shape (n, n_values)
+		'''
+		u, v = self._coordinates(self._keys//(self.shape[1] + 1), self._keys%(self.shape[1] + 1))
+		return u, v, self._values
+
+	def interpolate(self, u, v):
+		'''
+		bilinear interpolation of the values in the leaf cells that contain the points (u, v), NaN outside of the rectangle.
+
+		Returns:
+			values (np.ndarray) : shape (n, n_values)
+		'''
+		(u_min, u_max), (v_min, v_max) = self.bounds
+		fu = np.asarray(u, dtype=float).ravel()
+		fv = np.asarray(v, dtype=float).ravel()
+		fu = (fu - u_min)/(u_max - u_min)*self.shape[0] if u_max != u_min else np.zeros(fu.shape)
+		fv = (fv - v_min)/(v_max - v_min)*self.shape[1] if v_max != v_min else np.zeros(fv.shape)
+
+		eps = 1e-9
+		outside = (fu < -eps*self.shape[0]) | (fu > (1 + eps)*self.shape[0]) | (fv < -eps*self.shape[1]) | (fv > (1 + eps)*self.shape[1])
+		fu = np.clip(fu, 0, self.shape[0])
+		fv = np.clip(fv, 0, self.shape[1])
+		cell_i = np.minimum(fu.astype(np.int64), self.shape[0] - 1)
+		cell_j = np.minimum(fv.astype(np.int64), self.shape[1] - 1)
+
+		# find the leaf of every point, level by level.
+		i, j, size = self.leaves
+		leaf = np.full(len(fu), -1)
+		for s in np.unique(size):
+			at_level = np.flatnonzero(size == s)
+			n_j = self.shape[1]//s
+			keys = (i[at_level]//s)*n_j + j[at_level]//s
+			order = np.argsort(keys)
+			keys = keys[order]
+
+			query = (cell_i//s)*n_j + cell_j//s
+			position = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+			found = keys[position] == query
+			leaf[found] = at_level[order[position[found]]]
+
+		tu = (fu - i[leaf])/size[leaf]
+		tv = (fv - j[leaf])/size[leaf]
+		weights = np.stack([(1 - tu)*(1 - tv), tu*(1 - tv), (1 - tu)*tv, tu*tv], axis=-1)
+		# corners without weight are skipped, such that a point on a sample (e.g. of the grid) is not affected by a NaN in another corner.
+		values = np.einsum('nc,ncv->nv', weights, np.where(weights[...,np.newaxis] == 0, 0, self._corners[leaf]))
+		values[outside] = np.nan
+		return values
+
+class bisection():
+	def __init__(self, evaluate, bounds, n_cells=8, max_depth=6, tolerance=1e-3, groups=None):
+		'''
+		sample a function adaptively on an interval (see quadtree).
+
+		Args:
+			evaluate (function) : evaluate(u) returns the values of the function at the points u, shape (n, n_values)
+			bounds (tuple) : (u_min, u_max) of the interval
+			n_cells (int) : number of intervals of the coarse grid
+			max_depth (int) : maximal number of times an interval of the coarse grid is halved
+			tolerance (float) : maximal interpolation error of an interval, relative to the largest value of its group on the coarse grid
+			groups (list<list<int>>) : groups of values that share a scale for the tolerance (None : all values)
+		'''
+		self.evaluate = evaluate
+		self.bounds = np.asarray(bounds, dtype=float)
+		self.n_cells = n_cells
+		self.max_depth = max_depth
+		self.tolerance = tolerance
+		self.groups = groups
+
+		self.shape = n_cells*2**max_depth
+		self._keys = np.zeros(0, dtype=np.int64)
+		self._values = None
+		self.n_evaluations = 0
+
+		self._build()
+
+	def _coordinates(self, i):
+		u_min, u_max = self.bounds
+		return u_min + (u_max - u_min)*i/self.shape
+
+	def _sample(self, keys):
+		new = np.unique(keys)
+		new = new[~np.isin(new, self._keys)]
+
+		if len(new):
+			values = np.asarray(self.evaluate(self._coordinates(new))).reshape(len(new), -1)
+			self.n_evaluations += len(new)
+
+			keys_all = np.concatenate([self._keys, new])
+			values_all = values if self._values is None else np.concatenate([self._values, values])
+			order = np.argsort(keys_all)
+			self._keys, self._values = keys_all[order], values_all[order]
+
+		return self._values[np.searchsorted(self._keys, keys)]
+
+	def _build(self):
+		size = 2**self.max_depth
+		i = np.arange(self.n_cells)*size
+
+		self._sample(np.add.outer(i, [0, size]))
+		finite = np.where(np.isfinite(self._values), np.abs(self._values), 0)
+		groups = [list(range(self._values.shape[1]))] if self.groups is None else self.groups
+		self.scale = np.ones(self._values.shape[1])
+		for group in groups:
+			self.scale[group] = max(np.max(finite[:,group]), np.finfo(float).tiny)
+
+		leaves = []
+		for level in range(self.max_depth + 1):
+			size = 2**(self.max_depth - level)
+			if level == self.max_depth or len(i) == 0:
+				leaves.append((i, np.full(len(i), size)))
+				break
+
+			half = size//2
+			values = self._sample(np.add.outer(i, [0, half, size]))
+			error = np.abs(values[:,1] - (values[:,0] + values[:,2])/2)/self.scale
+			refine = ~np.all(error <= self.tolerance, axis=1)
+
+			children = np.add.outer(i, [0, half])
+			leaves.append((children[~refine].ravel(), np.full(2*np.sum(~refine), half)))
+			i = children[refine].ravel()
+
+		self.leaves = tuple(np.concatenate(leaf) for leaf in zip(*leaves))
+		order = np.argsort(self.leaves[0])
+		self.leaves = tuple(leaf[order] for leaf in self.leaves)
+		i, size = self.leaves
+		self._corners = self._sample(i[:,np.newaxis] + np.outer(size, [0, 1]))
+
+	@property
+	def n_leaves(self):
+		return len(self.leaves[0])
+
+	def samples(self):
+		'''
+		all the points that were evaluated, as coordinates u (shape (n,)) and values (shape (n, n_values)).
+		'''
+		return self._coordinates(self._keys), self._values
+
+	def interpolate(self, u):
+		'''
+		linear interpolation of the values in the leaf intervals that contain the points u, NaN outside of the interval.
+
+		Returns:
+			values (np.ndarray) : shape (n, n_values)
+		'''
+		u_min, u_max = self.bounds
+		fu = (np.asarray(u, dtype=float).ravel() - u_min)/(u_max - u_min)*self.shape
+
+		eps = 1e-9
+		outside = (fu < -eps*self.shape) | (fu > (1 + eps)*self.shape)
+		fu = np.clip(fu, 0, self.shape)
+
+		# the leaves are sorted and cover the interval.
+		i, size = self.leaves
+		leaf = np.clip(np.searchsorted(i, fu, side='right') - 1, 0, len(i) - 1)
+
+		t = (fu - i[leaf])/size[leaf]
+		weights = np.stack([1 - t, t], axis=-1)
+		values = np.einsum('nc,ncv->nv', weights, np.where(weights[...,np.newaxis] == 0, 0, self._corners[leaf]))
+		values[outside] = np.nan
+		return values
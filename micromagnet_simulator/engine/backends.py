@@ -0,0 +1,240 @@
+'''
+Backends that can be used to calculate the field of a magnet_collection.
+
+All backends take and return magpylib units (positions in mm, field in mT), such that they can be swapped freely.
+None of the backends modify the collection (e.g. by moving it), such that a collection can be shared between views/threads.
+'''
+import warnings
+
+import numpy as np
+
+from micromagnet_simulator.engine import compiled
+from micromagnet_simulator.engine.box import box_field_batched
+from micromagnet_simulator.engine.cache import field_cache
+from micromagnet_simulator.engine.multipole import default_tolerance, octree
+
+class magpylib_backend():
+	'''
+	field evaluation by magpylib (loop over the sources in python).
+	'''
+	name = 'magpylib'
+
+	def __init__(self, h=0.5e-6):
+		'''
+		Args:
+			h (float) : step used for the finite difference derivatives (unit in mm)
+		'''
+		self.h = h
+
+	def key(self):
+		'''
+		identifier of the backend and the settings that change its results (for the caches of the fields).
+		'''
+		return (self.name, self.h)
+
+	def getB(self, collection, positions):
+		B = collection.coll.getB(positions)
+		# magpylib has no prisms, these are evaluated with the closed form expressions of engine.prism.
+		prisms = collection.sources.prisms
+		if len(prisms):
+			B = B + prisms.getB(positions)
+		return B
+
+	def getB_jacobian(self, collection, positions):
+		'''
+		field and the derivatives J[n,i,j] = dB_i/dx_j (mT/mm), by central differences with shifted observer positions.
+		The points and their six shifted copies are evaluated in a single call.
+		'''
+		positions = np.asarray(positions, dtype=float).reshape(-1,3)
+		steps = np.concatenate([np.zeros((1,3)), self.h*np.eye(3), -self.h*np.eye(3)])
+		B_shifted = self.getB(collection, (positions[np.newaxis] + steps[:,np.newaxis]).reshape(-1,3)).reshape(7, -1, 3)
+
+		B = B_shifted[0]
+		J = np.moveaxis((B_shifted[1:4] - B_shifted[4:7])/(2*self.h), 0, -1)
+		return B, J
+
+class numpy_backend():
+	'''
+	field evaluation by the closed form box expressions, evaluated for all sources and points in batched array operations.
+	'''
+	name = 'numpy'
+
+	def __init__(self, chunk_size=2**18):
+		self.chunk_size = chunk_size
+
+	def key(self):
+		return self.name
+
+	def getB(self, collection, positions):
+		return collection.sources.getB(positions, self.chunk_size)
+
+	def getB_jacobian(self, collection, positions):
+		'''
+		field and the exact derivatives J[n,i,j] = dB_i/dx_j (mT/mm), calculated in the same pass.
+		'''
+		return collection.sources.getB_jacobian(positions, self.chunk_size)
+
+	def getB_batched(self, centers, dims, magnetisation, positions, jacobian=False):
+		'''
+		field of many sets of boxes (e.g. the points of a sweep) with the same number of boxes, in one vectorized call.
+		See box_field_batched for the shapes of the arguments.
+		'''
+		return box_field_batched(centers, dims, magnetisation, positions, self.chunk_size, jacobian)
+
+class multipole_backend():
+	'''
+	field evaluation with a Barnes-Hut octree over the boxes (see engine.multipole) : groups of boxes that are far from an observation
+	point are replaced by their dipole and quadrupole moments, the boxes close to the point are evaluated in closed form.
+	For designs with many boxes and many observation points. Prisms are evaluated in closed form.
+	'''
+	name = 'multipole'
+
+	def __init__(self, tolerance=default_tolerance, leaf_size=16, chunk_size=2**18):
+		'''
+		Args:
+			tolerance (float) : error of the field relative to the largest field is about tolerance/2 (0 evaluates all the boxes exactly)
+			leaf_size (int) : maximal number of boxes in a leaf of the octree
+			chunk_size (int) : maximal number of box-point pairs that are evaluated in one array operation
+		'''
+		self.tolerance = tolerance
+		self.leaf_size = leaf_size
+		self.chunk_size = chunk_size
+		# (key, octree) of the last sources, the tiles of a map (or chunks of a sweep) of the same magnets share the octree.
+		self._tree = (None, None)
+
+	def key(self):
+		# the expansions depend on the tolerance and on how the boxes are grouped in the octree.
+		return (self.name, self.tolerance, self.leaf_size)
+
+	def _octree(self, sources):
+		'''
+		octree of the boxes of the sources, built again only when the boxes (or the leaf size) change.
+		'''
+		key = field_cache.key(sources.centers, sources.dims, sources.magnetisation, self.leaf_size)
+		tree_key, tree = self._tree
+		if tree_key != key:
+			tree = octree(sources.centers, sources.dims, sources.magnetisation, self.leaf_size)
+			# a single assignment, such that threads that share the backend always see a matching key and octree.
+			self._tree = (key, tree)
+		return tree
+
+	def getB(self, collection, positions):
+		sources = collection.sources
+		B = self._octree(sources).field(positions, self.tolerance, chunk_size=self.chunk_size)
+		if len(sources.prisms):
+			B += sources.prisms.getB(positions)
+		return B
+
+	def getB_jacobian(self, collection, positions):
+		'''
+		field and the derivatives J[n,i,j] = dB_i/dx_j (mT/mm) of the multipole expansions (and of the boxes close to the points).
+		'''
+		sources = collection.sources
+		B, J = self._octree(sources).field(positions, self.tolerance, True, self.chunk_size)
+		if len(sources.prisms):
+			B_prisms, J_prisms = sources.prisms.getB_jacobian(positions)
+			B += B_prisms
+			J += J_prisms
+		return B, J
+
+class compiled_backend():
+	'''
+	field evaluation by the closed form box expressions compiled with numba (see engine.compiled), the observation points are
+	spread over threads. Gives the same results as the numpy backend without its temporary arrays. Prisms are evaluated with numpy.
+	'''
+	name = 'compiled'
+
+	def __init__(self, n_threads=None):
+		'''
+		Args:
+			n_threads (int) : number of threads used for the loop over the observation points (None : numba default, all cores)
+		'''
+		self.n_threads = n_threads
+
+	def key(self):
+		return self.name
+
+	def _set_threads(self):
+		if self.n_threads is not None:
+			compiled.numba.set_num_threads(self.n_threads)
+
+	def getB(self, collection, positions):
+		self._set_threads()
+		sources = collection.sources
+		B = compiled.box_field_compiled(sources.centers, sources.dims, sources.magnetisation, positions)
+		if len(sources.prisms):
+			B += sources.prisms.getB(positions)
+		return B
+
+	def getB_jacobian(self, collection, positions):
+		'''
+		field and the exact derivatives J[n,i,j] = dB_i/dx_j (mT/mm), calculated in the same pass.
+		'''
+		self._set_threads()
+		sources = collection.sources
+		B, J = compiled.box_field_compiled(sources.centers, sources.dims, sources.magnetisation, positions, True)
+		if len(sources.prisms):
+			B_prisms, J_prisms = sources.prisms.getB_jacobian(positions)
+			B += B_prisms
+			J += J_prisms
+		return B, J
+
+	def getB_batched(self, centers, dims, magnetisation, positions, jacobian=False):
+		'''
+		field of many sets of boxes (e.g. the points of a sweep) with the same number of boxes, the sets and points are spread over threads.
+		See box_field_batched for the shapes of the arguments.
+		'''
+		self._set_threads()
+		return compiled.box_field_batched_compiled(centers, dims, magnetisation, positions, jacobian)
+
+_backends = {
+	'magpylib' : magpylib_backend(),
+	'numpy' : numpy_backend(),
+	'multipole' : multipole_backend(),
+}
+# numba is optional, without it the compiled backend falls back to numpy (the results are the same).
+_backends['compiled'] = compiled_backend() if compiled.available else _backends['numpy']
+_backends['auto'] = _backends['compiled']
+
+# the closed form expressions give the field of magpylib (up to rounding errors), and are also finite on the extensions of the edges of the boxes.
+_default_backend = 'auto'
+
+def set_default_backend(name):
+	'''
+	set the backend that is used when no backend is specified (options : 'magpylib', 'numpy', 'multipole', 'compiled', 'auto').
+	'auto' (the default) selects the fastest exact backend that is installed ('compiled' if numba is available, else 'numpy').
+	'''
+	global _default_backend
+	get_backend(name)
+	_default_backend = name
+
+def get_backend_name(name=None):
+	'''
+	name of the backend that is used for name (None is the default backend), 'auto' and 'compiled' are resolved to the backend they select.
+	'''
+	if name is None:
+		name = _default_backend
+	if name in ('auto', 'compiled'):
+		return _backends[name].name
+	return name
+
+def get_backend_key(name=None):
+	'''
+	identifier of the backend that is used for name and of its settings (see the key method of the backends),
+	cached fields are only reused for the same key.
+	'''
+	return get_backend(name).key()
+
+def get_backend(name=None):
+	'''
+	get a field backend by name, if None the default backend is returned.
+	'''
+	if name is None:
+		name = _default_backend
+
+	if name not in _backends:
+		raise ValueError("invalid backend selected, options : {}".format(", ".join("'{}'".format(i) for i in _backends)))
+	if name == 'compiled' and not compiled.available:
+		warnings.warn("numba is not installed, the 'compiled' backend falls back to the numpy backend.")
+
+	return _backends[name]
@@ -0,0 +1,245 @@
+import numpy as np
+
+'''
+Closed form field of uniformly magnetised boxes (cuboids).
+
+The expressions are the ones used by magpylib (Bfield_Box), rewritten as a sum over the 8 corners of the box
+such that they can be evaluated for many boxes and many observation points in a single array operation.
+Units follow magpylib : positions/dimensions in mm and magnetisation/field in mT.
+'''
+
+# corners of a box as (x,y,z) offsets in units of the half dimensions, with their sign in the corner sum.
+_corners = [(i,j,k) for i in (-1,1) for j in (-1,1) for k in (-1,1)]
+
+def _corner_sign(corner):
+	return (-1)**(corner.count(1))
+
+def _corner_pair(w, rho2):
+	'''
+	(w_1/r_1 - w_2/r_2)/rho2, with r_i = sqrt(rho2 + w_i^2), for the two corners w = (w_1, w_2) along an edge.
+	'''
+	w1, w2 = w
+	r1 = np.sqrt(rho2 + w1*w1)
+	r2 = np.sqrt(rho2 + w2*w2)
+
+	# when w_1 and w_2 have the same sign, the direct difference cancels close to the edge.
+	same_side = w1*w2 > 0
+	stable = (w1 - w2)*(w1 + w2)/(r1*r2*(w1*r2 + w2*r1))
+	direct = (w1/r1 - w2/r2)/rho2
+
+	return np.where(same_side, stable, direct)
+
+def _box_field_local(rel, half, mag, jacobian=False):
+	'''
+	field of boxes without summation over the sources.
+
+	Args:
+		rel (np.ndarray) : observation points relative to the center of the boxes, shape (..., 3)
+		half (np.ndarray) : half of the dimensions of the boxes, shape broadcastable with rel
+		mag (np.ndarray) : magnetisation of the boxes, shape broadcastable with rel
+		jacobian (bool) : also return the analytic derivatives of the field
+	Returns:
+		B (np.ndarray) : field of every box at every point, shape of the broadcast of the inputs
+		J (np.ndarray) : (only if jacobian) J[...,i,j] = dB_i/dx_j, shape (..., 3, 3) (unit in mT/mm)
+	'''
+	rel, half, mag = np.broadcast_arrays(rel, half, mag)
+	x, y, z = rel[...,0], rel[...,1], rel[...,2]
+	a, b, c = half[...,0], half[...,1], half[...,2]
+
+	# mirror the log terms to the side where they do not suffer from cancellation (see magpylib edge cases).
+	tx = np.where(x < 0, -1., 1.)
+	ty = np.where(y > 0, -1., 1.)
+	tz = np.where(z > 0, -1., 1.)
+
+	LOGx = np.zeros(x.shape)
+	LOGy = np.zeros(x.shape)
+	LOGz = np.zeros(x.shape)
+	ATANx = np.zeros(x.shape)
+	ATANy = np.zeros(x.shape)
+	ATANz = np.zeros(x.shape)
+
+	if jacobian:
+		# gradients (d/dx, d/dy, d/dz) of the six terms above.
+		dLOGx = np.zeros(x.shape + (3,))
+		dLOGy = np.zeros(x.shape + (3,))
+		dLOGz = np.zeros(x.shape + (3,))
+		dATANx = np.zeros(x.shape + (3,))
+		dATANy = np.zeros(x.shape + (3,))
+		dATANz = np.zeros(x.shape + (3,))
+
+	with np.errstate(divide='ignore', invalid='ignore'):
+		for corner in _corners:
+			s = _corner_sign(corner)
+			u = x + corner[0]*a
+			v = y + corner[1]*b
+			w = z + corner[2]*c
+			r = np.sqrt(u*u + v*v + w*w)
+
+			LOGx += s*np.log(r + tx*u)
+			LOGy += s*np.log(r - ty*v)
+			LOGz += s*np.log(r - tz*w)
+
+			# 0/0 only happens on the extension of an edge of the box, where the limit of the term is 0.
+			ATANx += s*np.nan_to_num(np.arctan(v*w/(u*r)), nan=0)
+			ATANy += s*np.nan_to_num(np.arctan(u*w/(v*r)), nan=0)
+			ATANz += s*np.nan_to_num(np.arctan(u*v/(w*r)), nan=0)
+
+			if jacobian:
+				d_x = s/(r*(r + tx*u))
+				d_y = s/(r*(r - ty*v))
+				d_z = s/(r*(r - tz*w))
+
+				dLOGx[...,0] += s/r
+				dLOGx[...,1] += np.nan_to_num(tx*v*d_x, nan=0)
+				dLOGx[...,2] += np.nan_to_num(tx*w*d_x, nan=0)
+				dLOGy[...,0] += np.nan_to_num(ty*u*d_y, nan=0)
+				dLOGy[...,1] -= s/r
+				dLOGy[...,2] += np.nan_to_num(ty*w*d_y, nan=0)
+				dLOGz[...,0] += np.nan_to_num(tz*u*d_z, nan=0)
+				dLOGz[...,1] += np.nan_to_num(tz*v*d_z, nan=0)
+				dLOGz[...,2] -= s/r
+
+		if jacobian:
+			# the derivatives of the arctan terms diverge on the extensions of the edges of the box for the single corners,
+			# but not for the sum of the two corners along the edge, hence they are evaluated per pair of corners.
+			U, V, W = (x - a, x + a), (y - b, y + b), (z - c, z + c)
+			for i in (0,1):
+				for j in (0,1):
+					Q = (-1)**(i+j)*_corner_pair(W, U[i]**2 + V[j]**2)
+					dATANx[...,0] -= V[j]*Q
+					dATANx[...,1] += U[i]*Q
+					dATANy[...,0] += V[j]*Q
+					dATANy[...,1] -= U[i]*Q
+
+					Q = (-1)**(i+j)*_corner_pair(V, U[i]**2 + W[j]**2)
+					dATANx[...,0] -= W[j]*Q
+					dATANx[...,2] += U[i]*Q
+					dATANz[...,0] += W[j]*Q
+					dATANz[...,2] -= U[i]*Q
+
+					Q = (-1)**(i+j)*_corner_pair(U, V[i]**2 + W[j]**2)
+					dATANy[...,1] -= W[j]*Q
+					dATANy[...,2] += V[i]*Q
+					dATANz[...,1] += W[j]*Q
+					dATANz[...,2] -= V[i]*Q
+
+	LOGx *= tx
+	LOGy *= ty
+	LOGz *= tz
+
+	Mx, My, Mz = mag[...,0]/4/np.pi, mag[...,1]/4/np.pi, mag[...,2]/4/np.pi
+
+	B = np.empty(rel.shape)
+	B[...,0] = Mx*ATANx + My*LOGz + Mz*LOGy
+	B[...,1] = Mx*LOGz + My*ATANy - Mz*LOGx
+	B[...,2] = Mx*LOGy - My*LOGx + Mz*ATANz
+
+	# add M when inside the box to make B out of H, points on the surface have no physical solution.
+	inside = (np.abs(x) < a) & (np.abs(y) < b) & (np.abs(z) < c)
+	on_surface = (np.abs(x) <= a) & (np.abs(y) <= b) & (np.abs(z) <= c) & ~inside
+	B[inside] += mag[inside]
+	B[on_surface] = np.nan
+
+	if not jacobian:
+		return B
+
+	Mx, My, Mz = Mx[...,np.newaxis], My[...,np.newaxis], Mz[...,np.newaxis]
+
+	J = np.empty(rel.shape + (3,))
+	J[...,0,:] = Mx*dATANx + My*dLOGz + Mz*dLOGy
+	J[...,1,:] = Mx*dLOGz + My*dATANy - Mz*dLOGx
+	J[...,2,:] = Mx*dLOGy - My*dLOGx + Mz*dATANz
+	J[on_surface] = np.nan
+
+	return B, J
+
+def _chunks(n_sources, n_points, chunk_size):
+	'''
+	split sources x points into blocks with at most chunk_size pairs each.
+	'''
+	src_step = max(1, min(n_sources, chunk_size))
+	pts_step = max(1, chunk_size//src_step)
+
+	for i in range(0, n_sources, src_step):
+		for j in range(0, n_points, pts_step):
+			yield slice(i, i+src_step), slice(j, j+pts_step)
+
+def box_field(centers, dims, magnetisation, positions, chunk_size=2**18, jacobian=False):
+	'''
+	field of a set of boxes, summed over all the boxes.
+
+	Args:
+		centers (np.ndarray) : centers of the boxes, shape (n_boxes, 3) (unit in mm)
+		dims (np.ndarray) : full side lengths of the boxes, shape (n_boxes, 3) (unit in mm)
+		magnetisation (np.ndarray) : magnetisation of the boxes, shape (n_boxes, 3) (unit in mT)
+		positions (np.ndarray) : observation points, shape (n_points, 3) (unit in mm)
+		chunk_size (int) : maximal number of box-point pairs that are evaluated in one array operation
+		jacobian (bool) : also return the derivatives of the field, calculated in the same pass
+	Returns:
+		B (np.ndarray) : field at the observation points, shape (n_points, 3) (unit in mT)
+		J (np.ndarray) : (only if jacobian) J[n,i,j] = dB_i/dx_j at point n, shape (n_points, 3, 3) (unit in mT/mm)
+	'''
+	positions = np.asarray(positions, dtype=float).reshape(-1,3)
+	B = np.zeros(positions.shape)
+	if jacobian:
+		J = np.zeros(positions.shape + (3,))
+
+	for src, pts in _chunks(len(centers), len(positions), chunk_size):
+		rel = positions[np.newaxis,pts,:] - centers[src,np.newaxis,:]
+		result = _box_field_local(rel, dims[src,np.newaxis,:]/2, magnetisation[src,np.newaxis,:], jacobian)
+
+		if jacobian:
+			B[pts] += result[0].sum(axis=0)
+			J[pts] += result[1].sum(axis=0)
+		else:
+			B[pts] += result.sum(axis=0)
+
+	if jacobian:
+		return B, J
+	return B
+
+def box_field_batched(centers, dims, magnetisation, positions, chunk_size=2**18, jacobian=False):
+	'''
+	field of many independent sets of boxes (e.g. all the points of a sweep) with the same number of boxes each.
+
+	Args:
+		centers (np.ndarray) : centers of the boxes, shape (n_sets, n_boxes, 3) (unit in mm)
+		dims (np.ndarray) : full side lengths of the boxes, shape (n_sets, n_boxes, 3) (unit in mm)
+		magnetisation (np.ndarray) : magnetisation of the boxes, shape (n_sets, n_boxes, 3) (unit in mT)
+		positions (np.ndarray) : observation points of every set, shape (n_sets, n_points, 3) (unit in mm)
+		chunk_size (int) : maximal number of box-point pairs that are evaluated in one array operation
+		jacobian (bool) : also return the derivatives of the field, calculated in the same pass
+	Returns:
+		B (np.ndarray) : field of every set at its observation points, shape (n_sets, n_points, 3) (unit in mT)
+		J (np.ndarray) : (only if jacobian) J[s,n,i,j] = dB_i/dx_j, shape (n_sets, n_points, 3, 3) (unit in mT/mm)
+	'''
+	n_sets, n_boxes, _ = centers.shape
+	n_points = positions.shape[1]
+	B = np.zeros(positions.shape)
+	if jacobian:
+		J = np.zeros(positions.shape + (3,))
+
+	n_pairs = max(1, n_boxes*n_points)
+	if n_pairs > chunk_size:
+		# a single set does not fit in a chunk, its boxes and points are chunked as well.
+		for i in range(n_sets):
+			if jacobian:
+				B[i], J[i] = box_field(centers[i], dims[i], magnetisation[i], positions[i], chunk_size, True)
+			else:
+				B[i] = box_field(centers[i], dims[i], magnetisation[i], positions[i], chunk_size)
+	else:
+		step = chunk_size//n_pairs
+		for i in range(0, n_sets, step):
+			sets = slice(i, i+step)
+			rel = positions[sets,np.newaxis,:,:] - centers[sets,:,np.newaxis,:]
+			result = _box_field_local(rel, dims[sets,:,np.newaxis,:]/2, magnetisation[sets,:,np.newaxis,:], jacobian)
+
+			if jacobian:
+				B[sets] = result[0].sum(axis=1)
+				J[sets] = result[1].sum(axis=1)
+			else:
+				B[sets] = result.sum(axis=1)
+
+	if jacobian:
+		return B, J
+	return B
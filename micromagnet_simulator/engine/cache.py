@@ -0,0 +1,124 @@
+'''
+Persistent cache of evaluated fields.
+
+The fields are stored as .npy files in a cache directory, under a key that is a hash of everything that determines the result
+(the sources, the observation points, the backend and its settings, and the precision). Cached fields are opened memory mapped, such that reopening
+a view does not recalculate (or even read) the full field. When the cache exceeds its size limit, the least recently used files are removed.
+'''
+import hashlib
+import os
+
+import numpy as np
+
+class field_cache():
+	def __init__(self, directory, max_size=2**32):
+		'''
+		Args:
+			directory (str) : directory where the cached fields are stored
+			max_size (int) : maximal size of the cache in bytes
+		'''
+		self.directory = os.path.expanduser(directory)
+		self.max_size = max_size
+		os.makedirs(self.directory, exist_ok=True)
+
+	@staticmethod
+	def key(*items):
+		'''
+		stable hash of a set of arrays, numbers and strings.
+		'''
+		h = hashlib.sha256()
+		for item in items:
+			if isinstance(item, np.ndarray):
+				item = np.ascontiguousarray(item)
+				h.update('{}{}'.format(item.dtype.str, item.shape).encode())
+				h.update(item.tobytes())
+			else:
+				h.update(repr(item).encode())
+			h.update(b'|')
+
+		return h.hexdigest()
+
+	def _path(self, key, name):
+		return os.path.join(self.directory, '{}_{}.npy'.format(key, name))
+
+	def _files(self):
+		return [os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith('.npy')]
+
+	def load(self, key, name):
+		'''
+		open a cached array (memory mapped, copy on write), None if it is not in the cache.
+		'''
+		path = self._path(key, name)
+		try:
+			data = np.load(path, mmap_mode='c')
+		except (OSError, ValueError):
+			return None
+
+		# the modification time keeps track of the last use of an entry.
+		os.utime(path)
+		return data
+
+	def store(self, key, name, data):
+		'''
+		add an array to the cache and remove the least recently used entries if the cache is too large.
+		'''
+		path = self._path(key, name)
+		# write to a temporary file first, such that other sessions never open a partially written entry.
+		tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+		with open(tmp_path, 'wb') as f:
+			np.save(f, data)
+		os.replace(tmp_path, path)
+
+		self.evict()
+
+	@property
+	def size(self):
+		'''
+		size of the cache in bytes.
+		'''
+		return sum(os.path.getsize(f) for f in self._files())
+
+	def evict(self):
+		'''
+		remove the least recently used entries until the cache is not larger than max_size.
+		'''
+		files = sorted(((os.stat(f), f) for f in self._files()), key=lambda i : i[0].st_mtime)
+		size = sum(stat.st_size for stat, _ in files)
+
+		for stat, f in files:
+			if size <= self.max_size:
+				break
+			try:
+				os.remove(f)
+				size -= stat.st_size
+			except OSError:
+				pass
+
+	def clear(self):
+		'''
+		remove all the entries of the cache.
+		'''
+		for f in self._files():
+			os.remove(f)
+
+_field_cache = None
+
+def set_field_cache(directory='~/.cache/micromagnet_simulator', max_size=2**32):
+	'''
+	enable the persistent cache for the fields of views.
+
+	Args:
+		directory (str) : directory where the fields are stored, None disables the cache
+		max_size (int) : maximal size of the cache in bytes
+	'''
+	global _field_cache
+	if directory is None:
+		_field_cache = None
+	else:
+		_field_cache = field_cache(directory, max_size)
+
+def get_field_cache():
+	'''
+	the field cache that is in use (None if disabled).
+	'''
+	return _field_cache
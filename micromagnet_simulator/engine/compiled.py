@@ -0,0 +1,208 @@
+'''
+Compiled versions of the closed form box expressions of engine.box.
+
+The expressions are the same as in engine.box, written per box and observation point in loops that numba compiles,
+with the loop over the observation points spread over threads. This avoids the temporary arrays of the numpy version,
+which dominate its run time for many points. numba is an optional dependency, without it available is False and the
+'compiled' backend falls back to the numpy backend.
+Units follow magpylib : positions/dimensions in mm and magnetisation/field in mT.
+'''
+import math
+
+import numpy as np
+
+try:
+	import numba
+except ImportError:
+	numba = None
+
+available = numba is not None
+# set once a compiled kernel ran, the threads of numba are then running in this process (they do not survive a fork, see engine.sweep).
+threads_started = False
+
+if available:
+	_jit = numba.njit(cache=True, nogil=True, error_model='numpy')
+	_jit_parallel = numba.njit(cache=True, nogil=True, error_model='numpy', parallel=True)
+	_prange = numba.prange
+else:
+	_jit = _jit_parallel = lambda function : function
+	_prange = range
+
+@_jit
+def _corner_pair(w1, w2, rho2):
+	'''
+	(w_1/r_1 - w_2/r_2)/rho2, see engine.box._corner_pair.
+	'''
+	r1 = math.sqrt(rho2 + w1*w1)
+	r2 = math.sqrt(rho2 + w2*w2)
+	if w1*w2 > 0:
+		return (w1 - w2)*(w1 + w2)/(r1*r2*(w1*r2 + w2*r1))
+	return (w1/r1 - w2/r2)/rho2
+
+@_jit
+def _no_nan(value):
+	return 0. if math.isnan(value) else value
+
+@_jit
+def _box_point(x, y, z, a, b, c, mx, my, mz, jacobian, B, J):
+	'''
+	add the field (and the derivatives) of a single box at a single point (relative to the center of the box) to B (and J).
+	'''
+	# mirror the log terms to the side where they do not suffer from cancellation (see magpylib edge cases).
+	tx = -1. if x < 0 else 1.
+	ty = -1. if y > 0 else 1.
+	tz = -1. if z > 0 else 1.
+
+	LOGx = LOGy = LOGz = ATANx = ATANy = ATANz = 0.
+	dLOGx0 = dLOGx1 = dLOGx2 = dLOGy0 = dLOGy1 = dLOGy2 = dLOGz0 = dLOGz1 = dLOGz2 = 0.
+	dATANx0 = dATANx1 = dATANx2 = dATANy0 = dATANy1 = dATANy2 = dATANz0 = dATANz1 = dATANz2 = 0.
+
+	for i in range(2):
+		u = x + (2*i - 1)*a
+		for j in range(2):
+			v = y + (2*j - 1)*b
+			for k in range(2):
+				w = z + (2*k - 1)*c
+				s = -1. if (i + j + k)%2 == 1 else 1.
+				r = math.sqrt(u*u + v*v + w*w)
+
+				LOGx += s*np.log(r + tx*u)
+				LOGy += s*np.log(r - ty*v)
+				LOGz += s*np.log(r - tz*w)
+
+				# 0/0 only happens on the extension of an edge of the box, where the limit of the term is 0.
+				ATANx += s*_no_nan(math.atan(v*w/(u*r)))
+				ATANy += s*_no_nan(math.atan(u*w/(v*r)))
+				ATANz += s*_no_nan(math.atan(u*v/(w*r)))
+
+				if jacobian:
+					d_x = s/(r*(r + tx*u))
+					d_y = s/(r*(r - ty*v))
+					d_z = s/(r*(r - tz*w))
+
+					dLOGx0 += s/r
+					dLOGx1 += _no_nan(tx*v*d_x)
+					dLOGx2 += _no_nan(tx*w*d_x)
+					dLOGy0 += _no_nan(ty*u*d_y)
+					dLOGy1 -= s/r
+					dLOGy2 += _no_nan(ty*w*d_y)
+					dLOGz0 += _no_nan(tz*u*d_z)
+					dLOGz1 += _no_nan(tz*v*d_z)
+					dLOGz2 -= s/r
+
+	if jacobian:
+		# the derivatives of the arctan terms are evaluated per pair of corners along an edge (see engine.box).
+		for i in range(2):
+			U = x + (2*i - 1)*a
+			V = y + (2*i - 1)*b
+			for j in range(2):
+				sign = -1. if (i + j)%2 == 1 else 1.
+				Vj = y + (2*j - 1)*b
+				Wj = z + (2*j - 1)*c
+
+				Q = sign*_corner_pair(z - c, z + c, U*U + Vj*Vj)
+				dATANx0 -= Vj*Q
+				dATANx1 += U*Q
+				dATANy0 += Vj*Q
+				dATANy1 -= U*Q
+
+				Q = sign*_corner_pair(y - b, y + b, U*U + Wj*Wj)
+				dATANx0 -= Wj*Q
+				dATANx2 += U*Q
+				dATANz0 += Wj*Q
+				dATANz2 -= U*Q
+
+				Q = sign*_corner_pair(x - a, x + a, V*V + Wj*Wj)
+				dATANy1 -= Wj*Q
+				dATANy2 += V*Q
+				dATANz1 += Wj*Q
+				dATANz2 -= V*Q
+
+	LOGx *= tx
+	LOGy *= ty
+	LOGz *= tz
+
+	Mx, My, Mz = mx/4/np.pi, my/4/np.pi, mz/4/np.pi
+	Bx = Mx*ATANx + My*LOGz + Mz*LOGy
+	By = Mx*LOGz + My*ATANy - Mz*LOGx
+	Bz = Mx*LOGy - My*LOGx + Mz*ATANz
+
+	# add M when inside the box to make B out of H, points on the surface have no physical solution.
+	on_surface = False
+	if abs(x) < a and abs(y) < b and abs(z) < c:
+		Bx += mx
+		By += my
+		Bz += mz
+	elif abs(x) <= a and abs(y) <= b and abs(z) <= c:
+		on_surface = True
+		Bx = By = Bz = np.nan
+
+	B[0] += Bx
+	B[1] += By
+	B[2] += Bz
+
+	if jacobian:
+		if on_surface:
+			for l in range(3):
+				for m in range(3):
+					J[l,m] = np.nan
+			return
+
+		J[0,0] += Mx*dATANx0 + My*dLOGz0 + Mz*dLOGy0
+		J[0,1] += Mx*dATANx1 + My*dLOGz1 + Mz*dLOGy1
+		J[0,2] += Mx*dATANx2 + My*dLOGz2 + Mz*dLOGy2
+		J[1,0] += Mx*dLOGz0 + My*dATANy0 - Mz*dLOGx0
+		J[1,1] += Mx*dLOGz1 + My*dATANy1 - Mz*dLOGx1
+		J[1,2] += Mx*dLOGz2 + My*dATANy2 - Mz*dLOGx2
+		J[2,0] += Mx*dLOGy0 - My*dLOGx0 + Mz*dATANz0
+		J[2,1] += Mx*dLOGy1 - My*dLOGx1 + Mz*dATANz1
+		J[2,2] += Mx*dLOGy2 - My*dLOGx2 + Mz*dATANz2
+
+@_jit_parallel
+def _box_field_sets(centers, dims, magnetisation, positions, jacobian, B, J):
+	'''
+	field of sets of boxes at the observation points of every set, summed over the boxes of the set (B and J are filled in place).
+
+	Args:
+		centers, dims, magnetisation (np.ndarray) : shape (n_sets, n_boxes, 3)
+		positions (np.ndarray) : shape (n_sets, n_points, 3)
+		B (np.ndarray) : output, shape (n_sets, n_points, 3)
+		J (np.ndarray) : output (only if jacobian), shape (n_sets, n_points, 3, 3)
+	'''
+	n_sets, n_points = positions.shape[0], positions.shape[1]
+	for index in _prange(n_sets*n_points):
+		i = index//n_points
+		n = index%n_points
+		for box in range(centers.shape[1]):
+			_box_point(positions[i,n,0] - centers[i,box,0], positions[i,n,1] - centers[i,box,1], positions[i,n,2] - centers[i,box,2],
+				dims[i,box,0]/2, dims[i,box,1]/2, dims[i,box,2]/2,
+				magnetisation[i,box,0], magnetisation[i,box,1], magnetisation[i,box,2], jacobian, B[i,n], J[i,n])
+
+def box_field_batched_compiled(centers, dims, magnetisation, positions, jacobian=False):
+	'''
+	compiled version of engine.box.box_field_batched, see there for the shapes of the arguments and results.
+	'''
+	global threads_started
+	threads_started = True
+
+	centers, dims, magnetisation, positions = [np.ascontiguousarray(data, dtype=float) for data in (centers, dims, magnetisation, positions)]
+	B = np.zeros(positions.shape)
+	# J is not written without jacobian, a placeholder of the right dimension keeps a single compiled version.
+	J = np.zeros(positions.shape + (3,)) if jacobian else np.zeros((1,1,3,3))
+	_box_field_sets(centers, dims, magnetisation, positions, jacobian, B, J)
+
+	if jacobian:
+		return B, J
+	return B
+
+def box_field_compiled(centers, dims, magnetisation, positions, jacobian=False):
+	'''
+	compiled version of engine.box.box_field, see there for the shapes of the arguments and results.
+	'''
+	positions = np.asarray(positions, dtype=float).reshape(1,-1,3)
+	centers, dims, magnetisation = [np.asarray(data, dtype=float).reshape(1,-1,3) for data in (centers, dims, magnetisation)]
+	result = box_field_batched_compiled(centers, dims, magnetisation, positions, jacobian)
+
+	if jacobian:
+		return result[0][0], result[1][0]
+	return result[0]
@@ -0,0 +1,126 @@
+'''
+Incremental evaluation of fields after edits of the geometry.
+
+The field is a linear superposition of the fields of the boxes. For a set of observation points, the total field is kept
+together with the boxes it was calculated for. When the field of a modified geometry is requested at the same points,
+only the boxes that were removed or added are evaluated, and their fields are subtracted from/added to the kept total.
+'''
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from micromagnet_simulator.engine.sources import box_sources, prism_sources
+
+class _entry():
+	def __init__(self, boxes, B, dB):
+		self.boxes = boxes
+		self.B = B
+		self.dB = dB
+
+def _boxes(sources):
+	'''
+	the boxes (and prisms) of a set of sources as a multiset of (center, dims, magnetisation) tuples
+	(('prism', axis, level, height, magnetisation, corners) tuples for the prisms).
+	'''
+	boxes = Counter(map(tuple, np.concatenate([sources.centers, sources.dims, sources.magnetisation], axis=1)))
+	for polygon, axis, level, height, magnetisation in sources.prisms:
+		boxes[('prism', axis, level, height, tuple(magnetisation), tuple(polygon.ravel()))] += 1
+
+	return boxes
+
+def _sources(boxes):
+	'''
+	inverse of _boxes.
+	'''
+	prisms = [p for p in boxes.elements() if p[0] == 'prism']
+	data = np.array([b for b in boxes.elements() if b[0] != 'prism'], dtype=float).reshape(-1,9)
+
+	return box_sources(data[:,0:3], data[:,3:6], data[:,6:9],
+		prism_sources([p[5] for p in prisms], [p[1] for p in prisms], [p[2] for p in prisms], [p[3] for p in prisms], [p[4] for p in prisms]))
+
+class incremental_cache():
+	def __init__(self, max_entries=4):
+		'''
+		Args:
+			max_entries (int) : number of sets of observation points for which the total field is kept
+		'''
+		self.max_entries = max_entries
+		self.entries = OrderedDict()
+
+	def evaluate(self, key, sources, gradient, evaluate):
+		'''
+		field of sources at a set of observation points.
+
+		Args:
+			key (str) : identifier of the observation points and of the backend with its settings (see backends.get_backend_key)
+			sources (box_sources) : boxes to evaluate
+			gradient (bool) : also calculate the derivatives of the field
+			evaluate (function) : evaluate(sources, indices, gradient) returns the field (n, 3) and the derivatives (3, n, 3) (or None)
+				of sources at the observation points with the given indices (all the points if None)
+		Returns:
+			B (np.ndarray) : field, shape (n_points, 3)
+			dB (np.ndarray) : derivatives of the field, shape (3, n_points, 3) (None if not gradient)
+		'''
+		boxes = _boxes(sources)
+		entry = self.entries.get(key)
+
+		if entry is not None and (entry.dB is not None or not gradient):
+			removed = entry.boxes - boxes
+			added = boxes - entry.boxes
+			n_changed = sum(removed.values()) + sum(added.values())
+		else:
+			n_changed = None
+
+		if n_changed is None or n_changed >= sources.size:
+			B, dB = evaluate(sources, None, gradient)
+		else:
+			B = entry.B.copy()
+			dB = entry.dB.copy() if gradient else None
+
+			for sign, changed in ((-1, removed), (1, added)):
+				if changed:
+					B_changed, dB_changed = evaluate(_sources(changed), None, gradient)
+					B += sign*B_changed
+					if gradient:
+						dB += sign*dB_changed
+
+			# points on the surface of a removed box are NaN in the kept total, these are evaluated again.
+			invalid = ~np.isfinite(B).all(axis=-1)
+			if gradient:
+				invalid |= ~np.isfinite(dB).all(axis=(0,-1))
+			if np.any(invalid):
+				indices = np.flatnonzero(invalid)
+				B[indices], dB_invalid = evaluate(sources, indices, gradient)
+				if gradient:
+					dB[:,indices] = dB_invalid
+
+		self.entries[key] = _entry(boxes, B, dB)
+		self.entries.move_to_end(key)
+		while len(self.entries) > self.max_entries:
+			self.entries.popitem(last=False)
+
+		return B, dB
+
+	def clear(self):
+		self.entries.clear()
+
+_incremental_cache = None
+
+def set_incremental_cache(max_entries=4):
+	'''
+	enable the incremental evaluation of the fields of views after edits of the geometry.
+
+	Args:
+		max_entries (int) : number of sets of observation points (e.g. images of a view) that are kept in memory, None disables the cache
+	'''
+	global _incremental_cache
+	if max_entries is None:
+		_incremental_cache = None
+	else:
+		_incremental_cache = incremental_cache(max_entries)
+
+def get_incremental_cache():
+	'''
+	the incremental cache that is in use (None if disabled).
+	'''
+	return _incremental_cache
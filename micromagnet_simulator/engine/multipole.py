@@ -0,0 +1,152 @@
+'''
+Barnes-Hut evaluation of the field of many boxes.
+
+The boxes are grouped in an octree. Far from a group, the field of its boxes is replaced by the field of the dipole and
+quadrupole moments of the group (the boxes are point dipoles m_b = M_b V_b at their centers c_b) :
+	m = sum_b m_b, Q_ij = sum_b m_b,i (c_b - c)_j
+	B_l = 1/4pi (m_i d_l d_i G - Q_ij d_l d_i d_j G), with G = 1/|r - c|.
+A group is only used for the points for which (radius/distance)^3 is below a tolerance, which bounds the error of the field
+relative to the largest field to about half the tolerance (measured for arrays of boxes). Close to the boxes, the closed form
+expressions of engine.box are used.
+Units follow magpylib : positions/dimensions in mm and magnetisation/field in mT.
+'''
+import numpy as np
+
+from micromagnet_simulator.engine.box import box_field
+
+# tolerance of the octree and of the multipole backend (error of about 5e-4 relative to the largest field).
+default_tolerance = 1e-3
+
+def _multipole_field(R, m, Q, jacobian=False):
+	'''
+	field of a dipole m and a quadrupole Q at the points R (relative to the center of the expansion), shape (n, 3).
+
+	Returns:
+		B (np.ndarray) : field, shape (n, 3)
+		J (np.ndarray) : (only if jacobian) J[n,l,k] = dB_l/dx_k, shape (n, 3, 3)
+	'''
+	r2 = np.einsum('ni,ni->n', R, R)[:,np.newaxis]
+	r = np.sqrt(r2)
+	m_R = (R @ m)[:,np.newaxis]
+	QR = R @ Q.T
+	QtR = R @ Q
+	RQR = np.einsum('ni,ni->n', R, QR)[:,np.newaxis]
+	trQ = np.trace(Q)
+
+	B = (3*R*m_R - m*r2)/r**5 + 15*R*RQR/r**7 - 3*(QR + QtR + trQ*R)/r**5
+	B /= 4*np.pi
+	if not jacobian:
+		return B
+
+	RR = R[:,:,np.newaxis]*R[:,np.newaxis,:]
+	eye = np.eye(3)
+	r2, r, m_R, RQR = r2[...,np.newaxis], r[...,np.newaxis], m_R[...,np.newaxis], RQR[...,np.newaxis]
+	outer = lambda a, b : a[:,:,np.newaxis]*b[:,np.newaxis,:]
+
+	# J[l,k] = m_i d_k d_l d_i G - Q_ij d_k d_l d_i d_j G
+	dipole = -15*RR*m_R/r**7 + 3*(eye*m_R + outer(R, np.broadcast_to(m, R.shape)) + outer(np.broadcast_to(m, R.shape), R))/r**5
+	quadrupole = (105*RR*RQR/r**9
+		- 15*(eye*RQR + outer(QR, R) + outer(QtR, R) + outer(R, QR) + outer(R, QtR) + RR*trQ)/r**7
+		+ 3*(eye*trQ + Q + Q.T)/r**5)
+	return B, (dipole - quadrupole)/(4*np.pi)
+
+class octree():
+	def __init__(self, centers, dims, magnetisation, leaf_size=16):
+		'''
+		octree of boxes with the multipole moments of every node.
+
+		Args:
+			centers (np.ndarray) : centers of the boxes, shape (n_boxes, 3) (unit in mm)
+			dims (np.ndarray) : full side lengths of the boxes, shape (n_boxes, 3) (unit in mm)
+			magnetisation (np.ndarray) : magnetisation of the boxes, shape (n_boxes, 3) (unit in mT)
+			leaf_size (int) : maximal number of boxes in a leaf
+		'''
+		self.centers = np.asarray(centers, dtype=float).reshape(-1,3)
+		self.dims = np.asarray(dims, dtype=float).reshape(-1,3)
+		self.magnetisation = np.asarray(magnetisation, dtype=float).reshape(-1,3)
+		moments = self.magnetisation*np.prod(self.dims, axis=1)[:,np.newaxis]
+
+		# the nodes are numbered breadth first, a node gets its number when it is created.
+		self.boxes = [np.arange(len(self.centers))] if len(self.centers) else []
+		self.children = []
+		center, radius, dipole, quadrupole = [], [], [], []
+
+		node = 0
+		while node < len(self.boxes):
+			boxes = self.boxes[node]
+			half = self.dims[boxes]/2
+			node_center = (np.min(self.centers[boxes] - half, axis=0) + np.max(self.centers[boxes] + half, axis=0))/2
+			offset = self.centers[boxes] - node_center
+
+			center.append(node_center)
+			radius.append(np.max(np.linalg.norm(np.abs(offset) + half, axis=1)))
+			dipole.append(moments[boxes].sum(axis=0))
+			quadrupole.append(moments[boxes].T @ offset)
+
+			# split on the octants of the box centers, nodes of which all the centers coincide are leaves as well.
+			children = []
+			if len(boxes) > leaf_size:
+				split = (np.min(self.centers[boxes], axis=0) + np.max(self.centers[boxes], axis=0))/2
+				octant = (self.centers[boxes] > split) @ np.array([1, 2, 4])
+				octants = np.unique(octant)
+				if len(octants) > 1:
+					for i in octants:
+						children.append(len(self.boxes))
+						self.boxes.append(boxes[octant == i])
+			self.children.append(children)
+			node += 1
+
+		self.center = np.array(center).reshape(-1,3)
+		self.radius = np.array(radius)
+		self.dipole = np.array(dipole).reshape(-1,3)
+		self.quadrupole = np.array(quadrupole).reshape(-1,3,3)
+
+	def field(self, positions, tolerance=default_tolerance, jacobian=False, chunk_size=2**18):
+		'''
+		field of the boxes at the given positions.
+
+		Args:
+			positions (np.ndarray) : observation points, shape (n_points, 3) (unit in mm)
+			tolerance (float) : a node is replaced by its multipole expansion for the points where (radius/distance)^3 < tolerance
+			jacobian (bool) : also return the derivatives of the field
+			chunk_size (int) : maximal number of box-point pairs that are evaluated in one array operation in the leaves
+		Returns:
+			B (np.ndarray) : field at the observation points, shape (n_points, 3) (unit in mT)
+			J (np.ndarray) : (only if jacobian) J[n,i,j] = dB_i/dx_j at point n, shape (n_points, 3, 3) (unit in mT/mm)
+		'''
+		positions = np.asarray(positions, dtype=float).reshape(-1,3)
+		B = np.zeros(positions.shape)
+		J = np.zeros(positions.shape + (3,)) if jacobian else None
+
+		theta2 = tolerance**(2/3)
+
+		stack = [(0, np.arange(len(positions)))] if len(self.boxes) else []
+		while stack:
+			node, points = stack.pop()
+			R = positions[points] - self.center[node]
+			far = self.radius[node]**2 < theta2*np.einsum('ni,ni->n', R, R)
+
+			if np.any(far):
+				result = _multipole_field(R[far], self.dipole[node], self.quadrupole[node], jacobian)
+				if jacobian:
+					B[points[far]] += result[0]
+					J[points[far]] += result[1]
+				else:
+					B[points[far]] += result
+
+			near = points[~far]
+			if len(near) == 0:
+				continue
+			if self.children[node]:
+				stack += [(child, near) for child in self.children[node]]
+				continue
+
+			boxes = self.boxes[node]
+			result = box_field(self.centers[boxes], self.dims[boxes], self.magnetisation[boxes], positions[near], chunk_size, jacobian)
+			if jacobian:
+				B[near] += result[0]
+				J[near] += result[1]
+			else:
+				B[near] += result
+
+		return (B, J) if jacobian else B
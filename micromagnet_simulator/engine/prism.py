@@ -0,0 +1,287 @@
+import numpy as np
+
+from micromagnet_simulator.engine.box import _corner_pair, _chunks
+
+'''
+Closed form field of uniformly magnetised prisms (polygons extruded along one of the axes).
+
+The field is the one of the magnetic surface charges sigma = M.n on the faces of the prism. For a planar face with
+unit charge, the field (x4pi) is G = Omega n + sum_edges m_e L_e, with Omega the solid angle under which the face is
+seen, m_e the outward normal of the edge in the plane of the face and L_e = int_e dl/|r-r'| (see e.g. Guptasarma and Singh,
+Geophysics 64, 1999). The gradient of the solid angle is the field of a current along the edges of the face (Biot-Savart),
+which gives the derivatives of the field in closed form as well.
+Units follow magpylib : positions/dimensions in mm and magnetisation/field in mT.
+'''
+
+def _edge_terms(r, a, b, jacobian=False):
+	'''
+	terms of straight edges from a to b at the points r.
+
+	The terms are calculated per coordinate, on (n_points, n_edges) arrays.
+
+	Args:
+		r (np.ndarray) : observation points, shape (n_points, 3)
+		a, b (np.ndarray) : start and end points of the edges, shape (n_edges, 3)
+	Returns:
+		L (np.ndarray) : int_a^b dl/|r-r'|, shape (n_points, n_edges)
+		dL (list<np.ndarray>) : (only if jacobian) x, y and z components of the gradient of L
+		dOmega (list<np.ndarray>) : (only if jacobian) x, y and z components of the contribution of the edge to the gradient of the
+			solid angle of a face that is bounded counter clockwise by the edge
+	'''
+	length = np.linalg.norm(b - a, axis=-1)
+	t = (b - a)/length[:,np.newaxis]
+	p = [r[:,np.newaxis,i] - a[:,i] for i in range(3)]
+	q = [p[i] - (b - a)[:,i] for i in range(3)]
+	ra = np.sqrt(p[0]*p[0] + p[1]*p[1] + p[2]*p[2])
+	rb = np.sqrt(q[0]*q[0] + q[1]*q[1] + q[2]*q[2])
+	wa = p[0]*t[:,0] + p[1]*t[:,1] + p[2]*t[:,2]
+	wb = wa - length
+	t_x_p = [t[:,(i+1)%3]*p[(i+2)%3] - t[:,(i+2)%3]*p[(i+1)%3] for i in range(3)]
+	rho2 = t_x_p[0]*t_x_p[0] + t_x_p[1]*t_x_p[1] + t_x_p[2]*t_x_p[2]
+
+	# ra + rb - length, written without cancellation on the extension of the edge.
+	ra_wa = np.where(wa > 0, rho2/(ra + wa), ra - wa)
+	rb_wb = np.where(wb < 0, rho2/(rb - wb), rb + wb)
+	S_minus = ra_wa + rb_wb
+	S_plus = ra + rb + length
+
+	L = np.log(S_plus) - np.log(S_minus)
+	if not jacobian:
+		return L
+
+	factor = -2*length/(S_minus*S_plus)
+	dL = [factor*(p[i]/ra + q[i]/rb) for i in range(3)]
+	corner_pair = _corner_pair((wa, wb), rho2)
+	dOmega = [-t_x_p[i]*corner_pair for i in range(3)]
+
+	return L, dL, dOmega
+
+def _triangle_solid_angle(r, a, b, c):
+	'''
+	signed solid angle of the triangles with corners a, b, c (shape (n_triangles, 3)) at the points r (shape (n_points, 3)),
+	see Van Oosterom and Strackee.
+
+	Returns:
+		omega (np.ndarray) : solid angles, shape (n_points, n_triangles)
+	'''
+	a, b, c = [[corner[:,i] - r[:,np.newaxis,i] for i in range(3)] for corner in (a, b, c)]
+	dot = lambda u, v : u[0]*v[0] + u[1]*v[1] + u[2]*v[2]
+	la = np.sqrt(dot(a, a))
+	lb = np.sqrt(dot(b, b))
+	lc = np.sqrt(dot(c, c))
+	b_x_c = [b[(i+1)%3]*c[(i+2)%3] - b[(i+2)%3]*c[(i+1)%3] for i in range(3)]
+	numerator = dot(a, b_x_c)
+	denominator = la*lb*lc + dot(a, b)*lc + dot(a, c)*lb + dot(b, c)*la
+
+	return -2*np.arctan2(numerator, denominator)
+
+class _surface():
+	def __init__(self, polygon, axis, level, height, magnetisation):
+		'''
+		surface charges of a prism, reduced to its edges and triangles (in the global frame).
+
+		Every edge is shared by two faces, the edge terms of both faces are combined into one coefficient per edge :
+		c_e = sum_f sigma_f m_ef for the field and d_e = sum_f sigma_f s_ef n_f for the derivatives of the solid angles
+		(s_ef = +-1 the orientation of the edge in the face). The solid angles of the faces are sums over triangles
+		with weight sigma_f n_f.
+		'''
+		self.axis = axis
+		self.level = level
+		self.height = height
+		self.magnetisation = np.asarray(magnetisation, dtype=float)
+
+		perm = _local_axes(axis)
+		inv_perm = np.argsort(perm)
+
+		polygon = np.asarray(polygon, dtype=float).reshape(-1,2)
+		if perm[0] > perm[1]:
+			polygon = polygon[:,::-1]
+		# counter clockwise in the (u, v) plane
+		area = np.sum(polygon[:,0]*np.roll(polygon[:,1], -1) - np.roll(polygon[:,0], -1)*polygon[:,1])
+		if area < 0:
+			polygon = polygon[::-1]
+		self.polygon = polygon
+
+		n = len(polygon)
+		nxt = np.roll(np.arange(n), -1)
+		prv = np.roll(np.arange(n), 1)
+		bottom = np.column_stack([polygon, np.full(n, level - height/2)])[:,inv_perm]
+		top = np.column_stack([polygon, np.full(n, level + height/2)])[:,inv_perm]
+		w = np.zeros(3)
+		w[axis] = 1
+
+		M = self.magnetisation
+		sigma_w = M[axis]
+		normals = np.cross(top[nxt] - top, w)
+		normals /= np.linalg.norm(normals, axis=-1)[:,np.newaxis]
+		sigma = normals @ M
+
+		# edges : top (t_i -> t_i+1), bottom (b_i -> b_i+1) and vertical (b_i -> t_i). The side face i is (b_i, b_i+1, t_i+1, t_i).
+		self.a = np.concatenate([top, bottom, bottom])
+		self.b = np.concatenate([top[nxt], bottom[nxt], top])
+		t = self.b - self.a
+		t /= np.linalg.norm(t, axis=-1)[:,np.newaxis]
+		t_top, t_bottom, t_vertical = t[:n], t[n:2*n], t[2*n:]
+
+		s_n = sigma[:,np.newaxis]*normals
+		self.c = np.concatenate([
+			sigma_w*np.cross(t_top, w) - np.cross(t_top, s_n),
+			-sigma_w*np.cross(t_bottom, w) + np.cross(t_bottom, s_n),
+			np.cross(t_vertical, s_n[prv]) - np.cross(t_vertical, s_n)])
+		self.d = np.concatenate([
+			sigma_w*w - s_n,
+			-sigma_w*w + s_n,
+			s_n[prv] - s_n])
+
+		# triangles : fans of the top and bottom faces and two triangles for every side face.
+		fan = np.arange(1, n-1)
+		rev = bottom[::-1]
+		corners = [
+			(top[np.zeros(n-2, dtype=int)], top[fan], top[fan+1]),
+			(rev[np.zeros(n-2, dtype=int)], rev[fan], rev[fan+1]),
+			(bottom, bottom[nxt], top[nxt]),
+			(bottom, top[nxt], top)]
+		face_normals = [np.broadcast_to(w, (n-2, 3)), np.broadcast_to(-w, (n-2, 3)), normals, normals]
+		face_sigma = [np.full(n-2, sigma_w), np.full(n-2, -sigma_w), sigma, sigma]
+
+		self.triangles = tuple(np.concatenate([c[i] for c in corners]) for i in range(3))
+		self.normals = np.concatenate(face_normals)
+		self.weights = np.concatenate(face_sigma)[:,np.newaxis]*self.normals
+
+	def inside(self, positions):
+		'''
+		indices of the points inside of the prism and on its surface.
+		'''
+		perm = _local_axes(self.axis)
+		u, v, w = positions[:,perm[0]], positions[:,perm[1]], positions[:,perm[2]] - self.level
+
+		# only the points in the bounding box of the prism are classified.
+		(u_min, v_min), (u_max, v_max) = self.polygon.min(axis=0), self.polygon.max(axis=0)
+		candidates = np.flatnonzero((np.abs(w) <= self.height/2) & (u >= u_min) & (u <= u_max) & (v >= v_min) & (v <= v_max))
+
+		in_polygon, on_polygon = _inside_polygon(u[candidates], v[candidates], self.polygon)
+		inside = in_polygon & (np.abs(w[candidates]) < self.height/2)
+		return candidates[inside], candidates[(in_polygon | on_polygon) & ~inside]
+
+def _inside_polygon(u, v, polygon):
+	'''
+	classify points (u, v) with respect to a polygon, shape (n, 2).
+
+	Returns:
+		inside (np.ndarray) : strictly inside the polygon
+		boundary (np.ndarray) : on an edge of the polygon
+	'''
+	inside = np.zeros(u.shape, dtype=bool)
+	boundary = np.zeros(u.shape, dtype=bool)
+
+	for i in range(len(polygon)):
+		(ua, va), (ub, vb) = polygon[i], polygon[(i+1)%len(polygon)]
+		cross = (ub - ua)*(v - va) - (vb - va)*(u - ua)
+		dot = (u - ua)*(ub - ua) + (v - va)*(vb - va)
+		boundary |= (cross == 0) & (dot >= 0) & (dot <= (ub - ua)**2 + (vb - va)**2)
+
+		# crossing number
+		crosses = (va > v) != (vb > v)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			u_cross = ua + (v - va)*(ub - ua)/(vb - va)
+		inside ^= crosses & (u < u_cross)
+
+	return inside & ~boundary, boundary
+
+def _local_axes(axis):
+	'''
+	permutation of the coordinates to the frame of the prism (u, v, w), with w along the extrusion axis (cyclic, such that the frame is right handed).
+	'''
+	return np.array([(axis+1)%3, (axis+2)%3, axis])
+
+def prisms_field(polygons, axes, levels, heights, magnetisation, positions, jacobian=False, chunk_size=2**16):
+	'''
+	field of a set of prisms, summed over all the prisms.
+
+	The edges and triangles of all the prisms are evaluated together, in blocks of at most chunk_size edge/triangle-point pairs.
+
+	Args:
+		polygons (list<np.ndarray>) : corners of the polygon of every prism, shape (n_corners, 2) (see prism_field) (unit in mm)
+		axes (list<int>) : extrusion axis of every prism
+		levels (list<float>) : center of every prism along its extrusion axis (unit in mm)
+		heights (list<float>) : size of every prism along its extrusion axis (unit in mm)
+		magnetisation (np.ndarray) : magnetisation of every prism, shape (n_prisms, 3) (unit in mT)
+		positions (np.ndarray) : observation points, shape (n_points, 3) (unit in mm)
+		jacobian (bool) : also return the derivatives of the field
+		chunk_size (int) : maximal number of edge-point (triangle-point) pairs that are evaluated in one array operation
+	Returns:
+		B (np.ndarray) : field at the observation points, shape (n_points, 3) (unit in mT)
+		J (np.ndarray) : (only if jacobian) J[n,i,j] = dB_i/dx_j at point n, shape (n_points, 3, 3) (unit in mT/mm)
+	'''
+	positions = np.asarray(positions, dtype=float).reshape(-1,3)
+	magnetisation = np.asarray(magnetisation, dtype=float).reshape(-1,3)
+	surfaces = [_surface(*prism) for prism in zip(polygons, axes, levels, heights, magnetisation)]
+
+	B = np.zeros(positions.shape)
+	J = np.zeros(positions.shape + (3,)) if jacobian else None
+	if len(surfaces) == 0:
+		return (B, J) if jacobian else B
+
+	# edges and triangles without charge do not contribute.
+	a, b, c, d = [np.concatenate([getattr(s, name) for s in surfaces]) for name in ('a', 'b', 'c', 'd')]
+	keep = np.any(c != 0, axis=1) | (np.any(d != 0, axis=1) if jacobian else False)
+	a, b, c, d = a[keep], b[keep], c[keep], d[keep]
+
+	corners = [np.concatenate([s.triangles[i] for s in surfaces]) for i in range(3)]
+	normals, weights = [np.concatenate([getattr(s, name) for s in surfaces]) for name in ('normals', 'weights')]
+	keep = np.any(weights != 0, axis=1)
+	corners, normals, weights = [corner[keep] for corner in corners], normals[keep], weights[keep]
+
+	with np.errstate(divide='ignore', invalid='ignore'):
+		for src, pts in _chunks(len(a), len(positions), chunk_size):
+			if jacobian:
+				L, dL, dOmega = _edge_terms(positions[pts], a[src], b[src], True)
+				for k in range(3):
+					J[pts,:,k] += dL[k] @ c[src] + dOmega[k] @ d[src]
+			else:
+				L = _edge_terms(positions[pts], a[src], b[src])
+			B[pts] += L @ c[src]
+
+		for src, pts in _chunks(len(normals), len(positions), chunk_size):
+			r = positions[pts]
+			omega = _triangle_solid_angle(r, corners[0][src], corners[1][src], corners[2][src])
+			# in the plane of the face (and outside of it) the solid angle is 0, the arctan can not tell the sign there.
+			omega[r @ normals[src].T == np.einsum('ti,ti->t', corners[0][src], normals[src])] = 0
+			B[pts] += omega @ weights[src]
+
+	B /= 4*np.pi
+	if jacobian:
+		J /= 4*np.pi
+
+	# add M when inside the prism to make B out of H, points on the surface have no physical solution.
+	on_surface = np.zeros(len(positions), dtype=bool)
+	for surface in surfaces:
+		inside, surface_points = surface.inside(positions)
+		B[inside] += surface.magnetisation
+		on_surface[surface_points] = True
+
+	B[on_surface] = np.nan
+	if not jacobian:
+		return B
+
+	J[on_surface] = np.nan
+	return B, J
+
+def prism_field(polygon, axis, level, height, magnetisation, positions, jacobian=False):
+	'''
+	field of a single prism.
+
+	Args:
+		polygon (np.ndarray) : corners of the polygon, shape (n, 2), as coordinates along the two axes other than the extrusion axis
+			(in increasing order of the axes, e.g. (x,z) for an extrusion along y) (unit in mm)
+		axis (int) : extrusion axis (0,1,2 for x,y,z)
+		level (float) : center of the prism along the extrusion axis (unit in mm)
+		height (float) : size of the prism along the extrusion axis (unit in mm)
+		magnetisation (np.ndarray) : magnetisation of the prism, shape (3,) (unit in mT)
+		positions (np.ndarray) : observation points, shape (n_points, 3) (unit in mm)
+		jacobian (bool) : also return the derivatives of the field
+	Returns:
+		B (np.ndarray) : field at the observation points, shape (n_points, 3) (unit in mT)
+		J (np.ndarray) : (only if jacobian) J[n,i,j] = dB_i/dx_j at point n, shape (n_points, 3, 3) (unit in mT/mm)
+	'''
+	return prisms_field([polygon], [axis], [level], [height], [magnetisation], positions, jacobian)
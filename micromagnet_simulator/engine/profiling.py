@@ -0,0 +1,238 @@
+'''
+Opt-in instrumentation of the evaluation pipeline.
+
+The stages of the pipeline (building the data of sweep points, making collections, field evaluations, plotting) are wrapped
+in stage(). When profiling is enabled, the profiler records per stage the number of calls, the wall time (with and without
+the time of the stages nested in it), the number of sources x points that were evaluated and optionally the peak memory
+that was allocated. When profiling is disabled, stage() does nothing.
+
+	with profile() as profiler:
+		view.plot_fields('xyz')
+	print(profiler.table())
+	profiler.save_chrome_trace('trace.json') # open in chrome://tracing or https://ui.perfetto.dev
+'''
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+class _stats():
+	def __init__(self):
+		self.calls = 0
+		self.time = 0.
+		self.self_time = 0.
+		self.n_sources = 0
+		self.n_points = 0
+		self.n_pairs = 0
+		self.peak_bytes = 0
+
+	def as_dict(self):
+		return {'calls' : self.calls, 'time' : self.time, 'self_time' : self.self_time, 'n_sources' : self.n_sources,
+			'n_points' : self.n_points, 'n_pairs' : self.n_pairs, 'peak_bytes' : self.peak_bytes}
+
+class _frame():
+	def __init__(self, name):
+		self.name = name
+		self.start = time.perf_counter()
+		self.child_time = 0.
+		self.memory = 0
+		self.peak = 0
+
+class profiler():
+	def __init__(self, trace_memory=False):
+		'''
+		recorder of the stages of the evaluation pipeline.
+
+		Args:
+			trace_memory (bool) : also record the peak memory allocated per stage with tracemalloc (slows down the evaluation)
+		'''
+		self.trace_memory = trace_memory
+		self.stages = OrderedDict()
+		self.events = []
+		self._lock = threading.Lock()
+		self._local = threading.local()
+		self._t0 = time.perf_counter()
+		self._stop_tracing = False
+
+	def _stack(self):
+		if not hasattr(self._local, 'stack'):
+			self._local.stack = []
+		return self._local.stack
+
+	@contextmanager
+	def stage(self, name, n_sources=0, n_points=0, collection=None):
+		'''
+		record a stage (see engine.profiling.stage).
+		'''
+		if collection is not None:
+			n_sources = collection.sources.size
+
+		stack = self._stack()
+		trace = self.trace_memory and tracemalloc.is_tracing()
+		if trace:
+			# tracemalloc only keeps a single peak, the peak of the enclosing stage is saved before it is reset.
+			if stack:
+				stack[-1].peak = max(stack[-1].peak, tracemalloc.get_traced_memory()[1])
+			tracemalloc.reset_peak()
+
+		frame = _frame(name)
+		if trace:
+			frame.memory = tracemalloc.get_traced_memory()[0]
+			frame.peak = frame.memory
+		stack.append(frame)
+
+		try:
+			yield
+		finally:
+			duration = time.perf_counter() - frame.start
+			stack.pop()
+
+			peak_bytes = 0
+			if trace:
+				frame.peak = max(frame.peak, tracemalloc.get_traced_memory()[1])
+				peak_bytes = frame.peak - frame.memory
+				if stack:
+					stack[-1].peak = max(stack[-1].peak, frame.peak)
+			if stack:
+				stack[-1].child_time += duration
+
+			with self._lock:
+				stats = self.stages.setdefault(name, _stats())
+				stats.calls += 1
+				stats.time += duration
+				stats.self_time += duration - frame.child_time
+				stats.n_sources = max(stats.n_sources, n_sources)
+				stats.n_points += n_points
+				stats.n_pairs += n_sources*n_points
+				stats.peak_bytes = max(stats.peak_bytes, peak_bytes)
+
+				self.events.append((name, frame.start - self._t0, duration, threading.get_ident(),
+					{'n_sources' : n_sources, 'n_points' : n_points, 'peak_bytes' : peak_bytes}))
+
+	def report(self):
+		'''
+		statistics of all the stages.
+
+		Returns:
+			report (dict) : per stage the number of calls, the total wall time (s), the wall time without nested stages (s),
+				the largest number of sources, the total number of points and of source-point pairs that were evaluated
+				and the largest peak memory allocated during a call (bytes, 0 if the memory is not traced)
+		'''
+		with self._lock:
+			return {name : stats.as_dict() for name, stats in self.stages.items()}
+
+	def table(self):
+		'''
+		the report as a table, sorted by the time spent in the stages themselves.
+		'''
+		report = sorted(self.report().items(), key=lambda item : item[1]['self_time'], reverse=True)
+		width = max([len(name) for name, _ in report] + [5])
+
+		lines = ['{:<{}}  {:>7}  {:>10}  {:>10}  {:>12}  {:>10}'.format('stage', width, 'calls', 'time (s)', 'self (s)', 'pairs', 'peak (MB)')]
+		for name, stats in report:
+			lines.append('{:<{}}  {:>7}  {:>10.4f}  {:>10.4f}  {:>12}  {:>10.2f}'.format(name, width, stats['calls'],
+				stats['time'], stats['self_time'], stats['n_pairs'], stats['peak_bytes']/2**20))
+		return '\n'.join(lines)
+
+	def save_json(self, filename):
+		'''
+		write the report (see report) to a JSON file.
+		'''
+		with open(filename, 'w') as f:
+			json.dump(self.report(), f, indent=1)
+
+	def save_chrome_trace(self, filename):
+		'''
+		write every recorded call to a file in the Chrome trace event format (chrome://tracing, https://ui.perfetto.dev).
+		'''
+		with self._lock:
+			events = [{'name' : name, 'cat' : 'micromagnet_simulator', 'ph' : 'X', 'ts' : start*1e6, 'dur' : duration*1e6,
+				'pid' : os.getpid(), 'tid' : thread, 'args' : args} for name, start, duration, thread, args in self.events]
+
+		with open(filename, 'w') as f:
+			json.dump({'traceEvents' : events, 'displayTimeUnit' : 'ms'}, f)
+
+	def clear(self):
+		with self._lock:
+			self.stages.clear()
+			self.events.clear()
+
+_profiler = None
+
+def set_profiling(enabled=True, trace_memory=False):
+	'''
+	enable or disable the recording of the stages of the evaluation pipeline (see get_profiler for the results).
+
+	Args:
+		enabled (bool) : record the stages in a new profiler, False disables the profiling
+		trace_memory (bool) : also record the peak memory per stage (starts tracemalloc, which slows down the evaluation)
+	'''
+	global _profiler
+	if _profiler is not None and _profiler._stop_tracing:
+		tracemalloc.stop()
+	_profiler = None
+	if not enabled:
+		return
+
+	tracing = tracemalloc.is_tracing()
+	if trace_memory and not tracing:
+		tracemalloc.start()
+	_profiler = profiler(trace_memory)
+	_profiler._stop_tracing = trace_memory and not tracing
+
+def get_profiler():
+	'''
+	the profiler that is recording (None if disabled).
+	'''
+	return _profiler
+
+@contextmanager
+def profile(trace_memory=False):
+	'''
+	record the stages of the evaluation pipeline that run within the context, the profiler is returned.
+	'''
+	global _profiler
+	previous = _profiler
+	tracing = tracemalloc.is_tracing()
+	if trace_memory and not tracing:
+		tracemalloc.start()
+
+	_profiler = profiler(trace_memory)
+	try:
+		yield _profiler
+	finally:
+		_profiler = previous
+		if trace_memory and not tracing:
+			tracemalloc.stop()
+
+def stage(name, n_sources=0, n_points=0, collection=None):
+	'''
+	context manager around a stage of the pipeline, recorded by the profiler if profiling is enabled.
+
+	Args:
+		name (str) : name of the stage
+		n_sources (int) : number of sources that are evaluated in the stage
+		n_points (int) : number of observation points that are evaluated in the stage
+		collection (magnet_collection) : the sources that are evaluated (only counted when profiling)
+	'''
+	if _profiler is None:
+		return nullcontext()
+	return _profiler.stage(name, n_sources, n_points, collection)
+
+def profiled(name):
+	'''
+	decorator that records every call of a function as a stage.
+	'''
+	def decorator(function):
+		@wraps(function)
+		def wrapper(*args, **kwargs):
+			if _profiler is None:
+				return function(*args, **kwargs)
+			with _profiler.stage(name):
+				return function(*args, **kwargs)
+		return wrapper
+	return decorator
@@ -0,0 +1,89 @@
+'''
+Field of boxes as a linear function of their magnetisation.
+
+The field of a box is linear in its magnetisation, B = R M, where the response R (3x3 per box and observation point) only
+depends on the geometry. Once R is known for a geometry, the field for any magnetisation of the boxes (e.g. all points of
+a magnetisation sweep) is a tensor contraction, without evaluating the closed form expressions again.
+Units follow the engine : positions/dimensions in mm and magnetisation/field in mT.
+'''
+import numpy as np
+
+from micromagnet_simulator.engine.box import _box_field_local, _chunks
+from micromagnet_simulator.engine.prism import prism_field
+
+class magnetisation_response():
+	def __init__(self, centers, dims, positions, jacobian=False, chunk_size=2**18, prisms=None):
+		'''
+		response of a set of boxes at a set of observation points, for unit magnetisation along x, y and z.
+
+		Args:
+			centers (np.ndarray) : centers of the boxes, shape (n_boxes, 3) (unit in mm)
+			dims (np.ndarray) : full side lengths of the boxes, shape (n_boxes, 3) (unit in mm)
+			positions (np.ndarray) : observation points, shape (n_points, 3) (unit in mm)
+			jacobian (bool) : also calculate the response of the derivatives of the field
+			chunk_size (int) : maximal number of box-point pairs that are evaluated in one array operation
+			prisms (prism_sources) : prisms of the geometry (their magnetisation is ignored), they follow the boxes in the response
+		'''
+		centers = np.asarray(centers, dtype=float).reshape(-1,3)
+		dims = np.asarray(dims, dtype=float).reshape(-1,3)
+		positions = np.asarray(positions, dtype=float).reshape(-1,3)
+
+		n_prisms = 0 if prisms is None else len(prisms)
+
+		# R[b,n,i,j] = B_i at point n for box b with M = e_j, dR[b,n,i,k,j] = dB_i/dx_k for M = e_j
+		self.R = np.empty((len(centers) + n_prisms, len(positions), 3, 3))
+		self.dR = np.empty((len(centers) + n_prisms, len(positions), 3, 3, 3)) if jacobian else None
+
+		for src, pts in _chunks(len(centers), len(positions), chunk_size):
+			rel = positions[np.newaxis,pts,:] - centers[src,np.newaxis,:]
+			for j, unit in enumerate(np.eye(3)):
+				result = _box_field_local(rel, dims[src,np.newaxis,:]/2, unit, jacobian)
+				if jacobian:
+					self.R[src,pts,:,j], self.dR[src,pts,...,j] = result
+				else:
+					self.R[src,pts,:,j] = result
+
+		for p in range(n_prisms):
+			b = len(centers) + p
+			for j, unit in enumerate(np.eye(3)):
+				result = prism_field(prisms.polygons[p], prisms.axes[p], prisms.levels[p], prisms.heights[p], unit, positions, jacobian)
+				if jacobian:
+					self.R[b,:,:,j], self.dR[b,...,j] = result
+				else:
+					self.R[b,:,:,j] = result
+
+	@property
+	def n_boxes(self):
+		return self.R.shape[0]
+
+	def _magnetisation(self, magnetisation):
+		magnetisation = np.asarray(magnetisation, dtype=float)
+		if magnetisation.ndim == 1:
+			magnetisation = magnetisation[np.newaxis,:]
+		return np.broadcast_to(magnetisation, magnetisation.shape[:-2] + (self.n_boxes, 3))
+
+	def getB(self, magnetisation):
+		'''
+		field for a given magnetisation.
+
+		Args:
+			magnetisation (np.ndarray) : magnetisation of the boxes and prisms (unit in mT), shape (3,) (same for all boxes), (n_boxes, 3)
+				or (..., n_boxes, 3) for many magnetisations at once (e.g. a sweep)
+		Returns:
+			B (np.ndarray) : field in mT, shape (..., n_points, 3)
+		'''
+		return np.einsum('bnij,...bj->...ni', self.R, self._magnetisation(magnetisation))
+
+	def getB_jacobian(self, magnetisation):
+		'''
+		field and its derivatives for a given magnetisation (see getB).
+
+		Returns:
+			B (np.ndarray) : field in mT, shape (..., n_points, 3)
+			J (np.ndarray) : J[...,n,i,k] = dB_i/dx_k in mT/mm, shape (..., n_points, 3, 3)
+		'''
+		if self.dR is None:
+			raise ValueError('the response of the derivatives was not calculated (jacobian=False)')
+
+		magnetisation = self._magnetisation(magnetisation)
+		return self.getB(magnetisation), np.einsum('bnikj,...bj->...nik', self.dR, magnetisation)
@@ -0,0 +1,162 @@
+import magpylib as magpy
+import numpy as np
+
+from micromagnet_simulator.engine.box import box_field
+from micromagnet_simulator.engine.prism import prisms_field
+
+class prism_sources():
+	def __init__(self, polygons=(), axes=(), levels=(), heights=(), magnetisation=()):
+		'''
+		set of prisms (polygons extruded along one of the axes, see engine.prism).
+
+		Args:
+			polygons (list<np.ndarray>) : corners of the polygon of every prism, shape (n_corners, 2) (unit in mm)
+			axes (list<int>) : extrusion axis of every prism
+			levels (list<float>) : center of every prism along its extrusion axis (unit in mm)
+			heights (list<float>) : size of every prism along its extrusion axis (unit in mm)
+			magnetisation (np.ndarray) : magnetisation of the prisms, shape (n_prisms, 3) (unit in mT)
+		'''
+		self.polygons = [np.asarray(polygon, dtype=float).reshape(-1,2) for polygon in polygons]
+		self.axes = np.asarray(axes, dtype=int).reshape(-1)
+		self.levels = np.asarray(levels, dtype=float).reshape(-1)
+		self.heights = np.asarray(heights, dtype=float).reshape(-1)
+		self.magnetisation = np.asarray(magnetisation, dtype=float).reshape(-1,3)
+
+	@classmethod
+	def from_magnets(cls, magnets, displacement=(0,0,0)):
+		'''
+		pack a list of prism objects (see magnet_creator) into arrays.
+		'''
+		prisms = cls([m.vertices for m in magnets], [m.axis for m in magnets], [m.level for m in magnets],
+			[m.height for m in magnets], [m.magnetisation for m in magnets])
+		prisms.move(displacement)
+		return prisms
+
+	def __len__(self):
+		return len(self.polygons)
+
+	def __iter__(self):
+		return iter(zip(self.polygons, self.axes, self.levels, self.heights, self.magnetisation))
+
+	def take(self, indices):
+		return prism_sources([self.polygons[i] for i in indices], self.axes[indices], self.levels[indices],
+			self.heights[indices], self.magnetisation[indices])
+
+	def move(self, displacement):
+		displacement = np.asarray(displacement, dtype=float)
+		for i, axis in enumerate(self.axes):
+			others = [j for j in range(3) if j != axis]
+			self.polygons[i] = self.polygons[i] + displacement[others]
+			self.levels[i] += displacement[axis]
+
+	def key(self, magnetisation=True):
+		'''
+		bytes that identify the prisms (e.g. for the field cache), optionally without their magnetisation.
+		'''
+		data = [self.axes.tobytes(), self.levels.tobytes(), self.heights.tobytes()] + [p.tobytes() for p in self.polygons]
+		if magnetisation:
+			data.append(self.magnetisation.tobytes())
+		return b'|'.join(data)
+
+	def getB(self, positions):
+		'''
+		field of all the prisms at the given positions (mm), in mT.
+		'''
+		return prisms_field(self.polygons, self.axes, self.levels, self.heights, self.magnetisation, positions)
+
+	def getB_jacobian(self, positions):
+		'''
+		field (mT) and its derivatives J[n,i,j] = dB_i/dx_j (mT/mm) at the given positions (mm).
+		'''
+		return prisms_field(self.polygons, self.axes, self.levels, self.heights, self.magnetisation, positions, True)
+
+class box_sources():
+	def __init__(self, centers, dims, magnetisation, prisms=None):
+		'''
+		struct of arrays representation of a set of magnet boxes.
+
+		Args:
+			centers (np.ndarray) : centers of the boxes, shape (n_boxes, 3) (unit in mm)
+			dims (np.ndarray) : side lengths of the boxes, shape (n_boxes, 3) (unit in mm)
+			magnetisation (np.ndarray) : magnetisation of the boxes, shape (n_boxes, 3) (unit in mT)
+			prisms (prism_sources) : prisms that are part of the same set of sources (None : no prisms)
+		'''
+		self.centers = np.asarray(centers, dtype=float).reshape(-1,3)
+		self.dims = np.asarray(dims, dtype=float).reshape(-1,3)
+		self.magnetisation = np.asarray(magnetisation, dtype=float).reshape(-1,3)
+		self.prisms = prism_sources() if prisms is None else prisms
+
+	@classmethod
+	def from_magnets(cls, magnets, displacement=(0,0,0)):
+		'''
+		pack a list of magnet objects (see magnet_creator) into arrays.
+
+		Args:
+			magnets (list<magnet/prism>) : magnets to pack, the prisms are packed separately in prisms
+			displacement (tuple) : extra displacement applied to all centers (unit in mm)
+		'''
+		prisms = [m for m in magnets if m.is_prism]
+		magnets = [m for m in magnets if not m.is_prism]
+
+		centers = np.array([(m.x, m.y, m.z) for m in magnets], dtype=float).reshape(-1,3)
+		dims = np.array([(m.delta_x, m.delta_y, m.delta_z) for m in magnets], dtype=float).reshape(-1,3)
+		magnetisation = np.array([m.magnetisation for m in magnets], dtype=float).reshape(-1,3)
+
+		return cls(centers + np.asarray(displacement), dims, magnetisation, prism_sources.from_magnets(prisms, displacement))
+
+	def __len__(self):
+		return len(self.centers)
+
+	@property
+	def size(self):
+		'''
+		number of sources (boxes and prisms).
+		'''
+		return len(self) + len(self.prisms)
+
+	def move(self, displacement):
+		self.centers += np.asarray(displacement)
+		self.prisms.move(displacement)
+
+	def to_magpylib(self):
+		'''
+		build a magpylib collection with the same boxes (magpylib has no prisms, these are not included).
+		'''
+		boxes = [magpy.source.magnet.Box(mag=tuple(m), dim=tuple(d), pos=tuple(c))
+			for c, d, m in zip(self.centers, self.dims, self.magnetisation)]
+		return magpy.Collection(*boxes)
+
+	def getB(self, positions, chunk_size=2**18):
+		'''
+		field of all the boxes at the given positions (mm), in mT.
+		'''
+		B = box_field(self.centers, self.dims, self.magnetisation, positions, chunk_size)
+		if len(self.prisms):
+			B += self.prisms.getB(positions)
+		return B
+
+	def getB_jacobian(self, positions, chunk_size=2**18):
+		'''
+		field (mT) and its derivatives J[n,i,j] = dB_i/dx_j (mT/mm) at the given positions (mm).
+		'''
+		B, J = box_field(self.centers, self.dims, self.magnetisation, positions, chunk_size, jacobian=True)
+		if len(self.prisms):
+			B_prisms, J_prisms = self.prisms.getB_jacobian(positions)
+			B += B_prisms
+			J += J_prisms
+		return B, J
+
+class source_collection():
+	def __init__(self, sources):
+		'''
+		minimal collection (see magnet_creator.magnet_collection) around a set of sources, as needed by the backends.
+		The magpylib collection is only built when a backend asks for it.
+		'''
+		self.sources = sources
+		self._coll = None
+
+	@property
+	def coll(self):
+		if self._coll is None:
+			self._coll = self.sources.to_magpylib()
+		return self._coll
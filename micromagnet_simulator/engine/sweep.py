@@ -0,0 +1,253 @@
+'''
+Evaluation of the field at the dot positions for all points of a sweep.
+'''
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+
+import numpy as np
+
+from micromagnet_simulator.engine import compiled
+from micromagnet_simulator.engine.backends import get_backend
+from micromagnet_simulator.engine.profiling import profiled, stage
+from micromagnet_simulator.engine.sources import box_sources, source_collection
+from micromagnet_simulator.engine.response import magnetisation_response
+
+class packed_sweep():
+	def __init__(self, offsets, centers, dims, magnetisation, dot_positions, ext_field=None, prisms=None):
+		'''
+		all the sweep points of a sweep, packed in a few flat arrays.
+
+		Args:
+			offsets (np.ndarray) : boxes of sweep point i are boxes offsets[i]:offsets[i+1], shape (n_sweep+1,)
+			centers, dims, magnetisation (np.ndarray) : concatenated box parameters of all sweep points, shape (n_boxes_total, 3)
+			dot_positions (np.ndarray) : positions where the field is evaluated, shape (n_sweep, n_dots, 3)
+			ext_field (np.ndarray) : external field of every sweep point (unit in T), shape (n_sweep, 3) (None : no external field)
+			prisms (list<prism_sources>) : prisms of every sweep point (None : no prisms)
+		'''
+		self.offsets = offsets
+		self.centers = centers
+		self.dims = dims
+		self.magnetisation = magnetisation
+		self.dot_positions = dot_positions
+		self.ext_field = np.zeros((len(dot_positions), 3)) if ext_field is None else ext_field
+		self.prisms = prisms
+
+	@classmethod
+	@profiled('sweep.pack')
+	def from_data(cls, data_items):
+		'''
+		pack the simulation data (mag_sim_data, see magnet_creator) of all the sweep points.
+		The data items are consumed one at a time, such that they can be generated lazily.
+		'''
+		sources, dot_positions, ext_field = [], [], []
+		for data in data_items:
+			sources.append(data.sources)
+			dot_positions.append(data.dot_positions)
+			ext_field.append(data.ext_field if len(data.ext_field) != 0 else (0,0,0))
+
+		offsets = np.cumsum([0] + [len(s) for s in sources])
+		prisms = [s.prisms for s in sources] if any(len(s.prisms) for s in sources) else None
+
+		return cls(offsets,
+			np.concatenate([s.centers for s in sources]).reshape(-1,3),
+			np.concatenate([s.dims for s in sources]).reshape(-1,3),
+			np.concatenate([s.magnetisation for s in sources]).reshape(-1,3),
+			np.asarray(dot_positions, dtype=float).reshape(len(sources), -1, 3),
+			np.asarray(ext_field, dtype=float).reshape(len(sources), 3), prisms)
+
+	def __len__(self):
+		return len(self.dot_positions)
+
+	@property
+	def is_regular(self):
+		'''
+		True if all the sweep points have the same number of boxes.
+		'''
+		return len(set(np.diff(self.offsets))) <= 1
+
+	def dense(self):
+		'''
+		box parameters of a regular sweep as dense arrays (centers, dims, magnetisation), each of shape (n_sweep, n_boxes, 3).
+		'''
+		shape = (len(self), -1, 3)
+		return self.centers.reshape(shape), self.dims.reshape(shape), self.magnetisation.reshape(shape)
+
+	def __getitem__(self, key):
+		'''
+		packed sweep of a contiguous range (slice) of sweep points.
+		'''
+		start, stop, _ = key.indices(len(self))
+		boxes = slice(self.offsets[start], self.offsets[stop])
+		return packed_sweep(self.offsets[start:stop+1] - self.offsets[start], self.centers[boxes], self.dims[boxes],
+			self.magnetisation[boxes], self.dot_positions[start:stop], self.ext_field[start:stop],
+			None if self.prisms is None else self.prisms[start:stop])
+
+	def take(self, indices):
+		'''
+		packed sweep of the sweep points with the given indices.
+		'''
+		indices = np.asarray(indices, dtype=int)
+		n_boxes = np.diff(self.offsets)[indices]
+		boxes = np.concatenate([np.arange(self.offsets[i], self.offsets[i+1]) for i in indices]).astype(int)
+
+		return packed_sweep(np.cumsum(np.concatenate([[0], n_boxes])), self.centers[boxes], self.dims[boxes],
+			self.magnetisation[boxes], self.dot_positions[indices], self.ext_field[indices],
+			None if self.prisms is None else [self.prisms[i] for i in indices])
+
+	def _group(self, magnetisation=True):
+		groups = dict()
+		for i in range(len(self)):
+			boxes = slice(self.offsets[i], self.offsets[i+1])
+			key = (self.centers[boxes].tobytes(), self.dims[boxes].tobytes(), self.dot_positions[i].tobytes(),
+				self.magnetisation[boxes].tobytes() if magnetisation else None,
+				None if self.prisms is None else self.prisms[i].key(magnetisation))
+			groups.setdefault(key, []).append(i)
+
+		return [np.array(group) for group in groups.values()]
+
+	def unique(self):
+		'''
+		the distinct sweep points (same boxes, magnetisation and dot positions), e.g. only one for a sweep of the external field.
+
+		Returns:
+			sweep (packed_sweep) : sweep with only the distinct sweep points
+			inverse (np.ndarray) : index in sweep of every sweep point of this sweep
+		'''
+		groups = self._group()
+		inverse = np.empty(len(self), dtype=int)
+		for i, group in enumerate(groups):
+			inverse[group] = i
+
+		return self.take([group[0] for group in groups]), inverse
+
+	def geometries(self):
+		'''
+		group the sweep points that only differ in magnetisation (same boxes and dot positions).
+
+		Returns:
+			groups (list<np.ndarray>) : indices of the sweep points of every group
+		'''
+		return self._group(magnetisation=False)
+
+	def sources(self, i):
+		boxes = slice(self.offsets[i], self.offsets[i+1])
+		return box_sources(self.centers[boxes], self.dims[boxes], self.magnetisation[boxes],
+			None if self.prisms is None else self.prisms[i])
+
+def evaluate_serial(sweep, backend=None, gradient=False):
+	'''
+	field (and derivatives) at the dot positions of every point of a packed sweep, in the current process.
+
+	When all sweep points have the same number of boxes and the backend supports it, the whole sweep is evaluated in
+	a single vectorized call on the dense (n_sweep, n_boxes, 3) box arrays. Otherwise the sweep points are evaluated one by one.
+
+	Returns:
+		B (np.ndarray) : field in mT, shape (n_sweep, n_dots, 3)
+		J (np.ndarray) : (None if not gradient) J[...,i,j] = dB_i/dx_j in mT/mm, shape (n_sweep, n_dots, 3, 3)
+	'''
+	if backend is None or isinstance(backend, str):
+		backend = get_backend(backend)
+
+	if sweep.is_regular and hasattr(backend, 'getB_batched'):
+		with stage('sweep.getB_batched', n_sources=len(sweep.centers)//max(1, len(sweep)), n_points=sweep.dot_positions[...,0].size):
+			result = backend.getB_batched(*sweep.dense(), sweep.dot_positions, gradient)
+		B, J = result if gradient else (result, None)
+
+		if sweep.prisms is not None:
+			for i, prisms in enumerate(sweep.prisms):
+				if gradient:
+					B_prisms, J_prisms = prisms.getB_jacobian(sweep.dot_positions[i])
+					B[i] += B_prisms
+					J[i] += J_prisms
+				else:
+					B[i] += prisms.getB(sweep.dot_positions[i])
+
+		return B, J
+
+	B = np.empty(sweep.dot_positions.shape)
+	J = np.empty(sweep.dot_positions.shape + (3,)) if gradient else None
+
+	for i in range(len(sweep)):
+		collection = source_collection(sweep.sources(i))
+		with stage('sweep.getB', n_points=len(sweep.dot_positions[i]), collection=collection):
+			if gradient:
+				B[i], J[i] = backend.getB_jacobian(collection, sweep.dot_positions[i])
+			else:
+				B[i] = backend.getB(collection, sweep.dot_positions[i])
+
+	return B, J
+
+def evaluate_linear(sweep, gradient=False):
+	'''
+	field (and derivatives) at the dot positions of every point of a packed sweep, using that the field is linear in the magnetisation.
+
+	The response to a unit magnetisation along x, y and z is calculated once for every distinct geometry in the sweep,
+	the fields of all the sweep points with that geometry (e.g. a magnetisation sweep) then follow from a tensor contraction.
+	The responses are calculated with the closed form expressions of the numpy backend.
+
+	Returns:
+		B (np.ndarray) : field in mT, shape (n_sweep, n_dots, 3)
+		J (np.ndarray) : (None if not gradient) J[...,i,j] = dB_i/dx_j in mT/mm, shape (n_sweep, n_dots, 3, 3)
+	'''
+	B = np.empty(sweep.dot_positions.shape)
+	J = np.empty(sweep.dot_positions.shape + (3,)) if gradient else None
+
+	for group in sweep.geometries():
+		boxes = slice(sweep.offsets[group[0]], sweep.offsets[group[0]+1])
+		prisms = None if sweep.prisms is None else sweep.prisms[group[0]]
+		with stage('sweep.response', n_sources=sweep.offsets[group[0]+1] - sweep.offsets[group[0]], n_points=len(sweep.dot_positions[group[0]])):
+			response = magnetisation_response(sweep.centers[boxes], sweep.dims[boxes], sweep.dot_positions[group[0]], gradient, prisms=prisms)
+
+		magnetisation = np.stack([sweep.magnetisation[sweep.offsets[i]:sweep.offsets[i+1]] for i in group])
+		if prisms is not None:
+			magnetisation = np.concatenate([magnetisation, np.stack([sweep.prisms[i].magnetisation for i in group])], axis=1)
+		if gradient:
+			B[group], J[group] = response.getB_jacobian(magnetisation)
+		else:
+			B[group] = response.getB(magnetisation)
+
+	return B, J
+
+def evaluate_sweep(sweep, backend=None, gradient=False, n_workers=None, chunk_size=None):
+	'''
+	evaluate the field at the dot positions for all points of a packed sweep in a process pool.
+
+	Once the compiled backend ran in this process, the workers are spawned instead of forked (a script then needs an
+	if __name__ == '__main__' guard).
+
+	Args:
+		sweep (packed_sweep) : sweep to evaluate
+		backend (str) : name of the backend to use in the workers (None : the default backend)
+		gradient (bool) : also calculate the derivatives
+		n_workers (int) : number of worker processes (None : number of cores)
+		chunk_size (int) : number of sweep points sent to a worker at once (None : spread evenly over the workers)
+	Returns:
+		B (np.ndarray) : field in mT, shape (n_sweep, n_dots, 3)
+		J (np.ndarray) : (None if not gradient) J[...,i,j] = dB_i/dx_j in mT/mm, shape (n_sweep, n_dots, 3, 3)
+	'''
+	B = np.empty(sweep.dot_positions.shape)
+	J = np.empty(sweep.dot_positions.shape + (3,)) if gradient else None
+
+	if n_workers is None:
+		n_workers = os.cpu_count()
+	if chunk_size is None:
+		chunk_size = max(1, int(np.ceil(len(sweep)/(4*n_workers))))
+
+	# the threads of the compiled backend do not survive a fork (the workers or this process hang), the workers are then spawned.
+	# The workers get the backend itself, such that its settings are the same in spawned workers.
+	context = multiprocessing.get_context('spawn') if compiled.threads_started else None
+	backend = get_backend(backend)
+
+	# the stages within the worker processes are not recorded.
+	with stage('sweep.process_pool'), ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as executor:
+		chunks = [slice(i, min(i+chunk_size, len(sweep))) for i in range(0, len(sweep), chunk_size)]
+		futures = [executor.submit(evaluate_serial, sweep[chunk], backend, gradient) for chunk in chunks]
+
+		for chunk, future in zip(chunks, futures):
+			B_chunk, J_chunk = future.result()
+			B[chunk] = B_chunk
+			if gradient:
+				J[chunk] = J_chunk
+
+	return B, J
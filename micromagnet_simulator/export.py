@@ -0,0 +1,333 @@
+'''
+Export of calculated fields to disk, and lazy loading of exported fields.
+
+The field and its derivatives are stored (in T and T/nm) in compressed chunks along their largest axis, next to the axes
+of the observation points (or the setpoints of a sweep), the geometry of the magnets and the metadata. Two formats are supported :
+	* HDF5 (a filename ending in .h5 or .hdf5), needs h5py
+	* a directory with a compressed npz file per chunk (any other filename), no extra dependencies
+The loaded field only reads the chunks that are needed for the components that are asked for (e.g. Bx or dBz/dx).
+
+	view.export('image.h5')
+
+	fields = load_field('image.h5')
+	fields.unit = 'mT'
+	print(fields.dB('x', 'y').shape)
+'''
+import json
+import os
+
+import numpy as np
+
+from micromagnet_simulator.fields import field_generic, field_qubits, field_views
+from micromagnet_simulator.loop_control.setpoint_mgr import setpoint_mgr, setpoint
+
+try:
+	import h5py
+except ImportError:
+	h5py = None
+
+def _is_hdf5(filename):
+	return os.path.splitext(filename)[1].lower() in ('.h5', '.hdf5')
+
+def _chunking(shape, itemsize, chunk_bytes):
+	'''
+	axis along which an array is chunked (the largest one) and the number of elements of that axis per chunk.
+	'''
+	axis = int(np.argmax(shape))
+	slice_bytes = itemsize*int(np.prod(shape))//max(shape[axis], 1)
+	return axis, int(min(shape[axis], max(1, chunk_bytes//max(slice_bytes, 1))))
+
+class _directory_store():
+	def __init__(self, directory, mode='r'):
+		self.directory = directory
+		if mode == 'w':
+			os.makedirs(directory, exist_ok=True)
+
+	def write_array(self, name, data, scale, chunk_bytes):
+		axis, chunk = _chunking(data.shape, data.dtype.itemsize, chunk_bytes)
+		os.makedirs(os.path.join(self.directory, name), exist_ok=True)
+		for i, start in enumerate(range(0, data.shape[axis], chunk)):
+			index = [slice(None)]*data.ndim
+			index[axis] = slice(start, start + chunk)
+			np.savez_compressed(os.path.join(self.directory, name, '{:06d}.npz'.format(i)), data=np.asarray(data[tuple(index)])*scale)
+		return {'shape' : list(data.shape), 'dtype' : data.dtype.str, 'axis' : axis, 'chunk' : chunk}
+
+	def write_group(self, name, arrays):
+		np.savez_compressed(os.path.join(self.directory, name + '.npz'), **arrays)
+
+	def write_metadata(self, metadata):
+		with open(os.path.join(self.directory, 'metadata.json'), 'w') as f:
+			json.dump(metadata, f, indent=1)
+
+	def metadata(self):
+		with open(os.path.join(self.directory, 'metadata.json')) as f:
+			return json.load(f)
+
+	def group(self, name):
+		with np.load(os.path.join(self.directory, name + '.npz')) as data:
+			return {key : data[key] for key in data.files}
+
+	def array(self, name, info):
+		return _chunked_array(os.path.join(self.directory, name), info)
+
+class _hdf5_store():
+	def __init__(self, filename, mode='r'):
+		if h5py is None:
+			raise ImportError('h5py is needed to read and write HDF5 files (pip install h5py).')
+		self.file = h5py.File(filename, mode)
+
+	def write_array(self, name, data, scale, chunk_bytes):
+		axis, chunk = _chunking(data.shape, data.dtype.itemsize, chunk_bytes)
+		chunks = list(data.shape)
+		chunks[axis] = chunk
+		dataset = self.file.create_dataset(name, shape=data.shape, dtype=data.dtype, chunks=tuple(max(c, 1) for c in chunks), compression='gzip')
+		for start in range(0, data.shape[axis], chunk):
+			index = [slice(None)]*data.ndim
+			index[axis] = slice(start, start + chunk)
+			dataset[tuple(index)] = np.asarray(data[tuple(index)])*scale
+		return {'shape' : list(data.shape), 'dtype' : data.dtype.str, 'axis' : axis, 'chunk' : chunk}
+
+	def write_group(self, name, arrays):
+		group = self.file.create_group(name)
+		for key, value in arrays.items():
+			group.create_dataset(key, data=value)
+
+	def write_metadata(self, metadata):
+		self.file.attrs['metadata'] = json.dumps(metadata)
+
+	def metadata(self):
+		return json.loads(self.file.attrs['metadata'])
+
+	def group(self, name):
+		return {key : self.file[name][key][()] for key in self.file[name]}
+
+	def array(self, name, info):
+		return self.file[name]
+
+class _chunked_array():
+	def __init__(self, directory, info):
+		'''
+		read only array of which the chunks (npz files in a directory, see _directory_store) are loaded when they are indexed.
+		'''
+		self.directory = directory
+		self.shape = tuple(info['shape'])
+		self.dtype = np.dtype(info['dtype'])
+		self.axis = info['axis']
+		self.chunk = info['chunk']
+
+	@property
+	def ndim(self):
+		return len(self.shape)
+
+	def _chunk(self, i):
+		with np.load(os.path.join(self.directory, '{:06d}.npz'.format(i))) as data:
+			return data['data']
+
+	def __getitem__(self, key):
+		key = list(key) if isinstance(key, tuple) else [key]
+		if Ellipsis in key:
+			i = key.index(Ellipsis)
+			key[i:i+1] = [slice(None)]*(self.ndim - len(key) + 1)
+		key += [slice(None)]*(self.ndim - len(key))
+
+		# only the chunks with the selected elements of the chunked axis are loaded, the other axes are indexed chunk by chunk.
+		selection = np.arange(self.shape[self.axis])[key[self.axis]]
+		if np.ndim(selection) == 0:
+			del key[self.axis]
+			return np.take(self._chunk(selection//self.chunk), selection%self.chunk, axis=self.axis)[tuple(key)]
+
+		key[self.axis] = slice(None)
+		# runs of selected elements in the same chunk, in the order of the selection.
+		chunks = selection//self.chunk
+		starts = np.flatnonzero(np.diff(chunks, prepend=-1))
+		parts = [np.take(self._chunk(chunks[start]), selection[start:stop] - chunks[start]*self.chunk, axis=self.axis)[tuple(key)]
+			for start, stop in zip(starts, list(starts[1:]) + [len(selection)])]
+
+		# axis of the result that corresponds to the chunked axis (the axes indexed with an integer are removed).
+		axis = sum(1 for k in key[:self.axis] if not isinstance(k, (int, np.integer)))
+		if not parts:
+			return np.empty(np.empty(self.shape[:self.axis] + (0,) + self.shape[self.axis+1:])[tuple(key)].shape, self.dtype)
+		return np.concatenate(parts, axis=axis)
+
+	def __array__(self, dtype=None):
+		data = self[...]
+		return data if dtype is None else data.astype(dtype)
+
+class _lazy_field():
+	def __init__(self, data, scale=1., offset=0.):
+		'''
+		field (or derivatives) that is read from an exported array when it is indexed.
+		The unit conversion (scale) and the external field (offset) are applied to the part that is read.
+		'''
+		self.data = data
+		self.scale = scale
+		self.offset = offset
+
+	@property
+	def shape(self):
+		return tuple(self.data.shape)
+
+	@property
+	def ndim(self):
+		return len(self.shape)
+
+	@property
+	def dtype(self):
+		return np.dtype(self.data.dtype)
+
+	def __getitem__(self, key):
+		values = np.asarray(self.data[key])*self.scale
+		if np.any(self.offset != 0):
+			values += np.broadcast_to(self.offset, self.shape)[key]
+		return values
+
+	def __array__(self, dtype=None):
+		data = self[...]
+		return data if dtype is None else data.astype(dtype)
+
+	# the unit and the external field of field_generic update the stored fields in place, here only the scale and the offset change.
+	def __imul__(self, value):
+		self.scale = self.scale*value
+		self.offset = self.offset*value
+		return self
+
+	def __iadd__(self, value):
+		self.offset = self.offset + value
+		return self
+
+class field_stored(field_generic):
+	def __init__(self, field, d_field, ndim, active_idx, ext_field=(0,0,0), precision='float64'):
+		'''
+		field (and derivatives) that are read from an exported file when they are indexed, see load_field.
+
+		Args:
+			field (array like) : field in T, indexable like an np.ndarray (e.g. a h5py dataset)
+			d_field (array like) : derivatives in T/nm (None if they were not exported)
+			ndim (int) : number of axes of the observation points (or the sweep, plus the dots)
+			active_idx (list<int>) : axes with more than one point
+			ext_field (np.ndarray) : external field (in T) that is included in the field
+			precision (str) : precision of the fields that are returned
+		'''
+		super().__init__(precision)
+		self._field = _lazy_field(field)
+		self._d_field = None if d_field is None else _lazy_field(d_field)
+		self._ext_field = np.asarray(ext_field, dtype=float)
+		self._ndim = ndim
+		self._active_idx = np.asarray(active_idx, dtype=int)
+		self.x = self.y = self.z = None
+		self.setpoints = None
+		self.geometry = {}
+
+	@property
+	def field(self):
+		return self._field
+
+	@property
+	def d_field(self):
+		if self._d_field is None:
+			raise ValueError('the derivatives of the field were not exported.')
+		return self._d_field
+
+	@property
+	def ndim(self):
+		return self._ndim
+
+	@property
+	def active_idx(self):
+		return self._active_idx
+
+	@property
+	def shape(self):
+		return self._field.shape[:-1]
+
+def _prism_geometry(prisms):
+	'''
+	prisms (a list of prism_sources, e.g. of every sweep point) as arrays, the corners of all the polygons are concatenated.
+	'''
+	polygons = [polygon for p in prisms for polygon in p.polygons]
+	return {'prism_vertices' : np.concatenate(polygons)*1e6, 'prism_n_vertices' : np.array([len(p) for p in polygons]),
+		'prism_axes' : np.concatenate([p.axes for p in prisms]), 'prism_levels' : np.concatenate([p.levels for p in prisms])*1e6,
+		'prism_heights' : np.concatenate([p.heights for p in prisms])*1e6,
+		'prism_magnetisation' : np.concatenate([p.magnetisation for p in prisms])*1e-3}
+
+def _geometry(field):
+	'''
+	magnets of a field as arrays, positions and dimensions in nm, magnetisation in T.
+	The boxes (and prisms) of sweep point i of a sweep are offsets[i]:offsets[i+1] (prism_offsets[i]:prism_offsets[i+1]).
+	'''
+	if isinstance(field, field_qubits):
+		if field.MM_properties is None:
+			return {}
+		sweep = field.sweep
+		geometry = {'offsets' : sweep.offsets, 'centers' : sweep.centers*1e6, 'dims' : sweep.dims*1e6,
+			'magnetisation' : sweep.magnetisation*1e-3, 'dot_positions' : sweep.dot_positions*1e6}
+		if sweep.prisms is not None:
+			geometry.update(_prism_geometry(sweep.prisms))
+			geometry['prism_offsets'] = np.cumsum([0] + [len(p) for p in sweep.prisms])
+		return geometry
+
+	sources = field.collection.sources
+	geometry = {'centers' : sources.centers*1e6, 'dims' : sources.dims*1e6, 'magnetisation' : sources.magnetisation*1e-3,
+		'dot_positions' : np.asarray(field.collection.qubit_positions, dtype=float).reshape(-1,3)*1e6}
+	if len(sources.prisms):
+		geometry.update(_prism_geometry([sources.prisms]))
+	return geometry
+
+def export_field(field, filename, gradient=True, chunk_bytes=2**24):
+	'''
+	write a field (see fields) to disk, see load_field to read it.
+
+	Args:
+		field (field_generic) : field of a view (e.g. view.field), the field is calculated if needed
+		filename (str) : .h5/.hdf5 file (needs h5py) or a directory of compressed chunks (any other name)
+		gradient (bool) : also export the derivatives of the field (calculated if needed)
+		chunk_bytes (int) : approximate size of a chunk (uncompressed)
+	'''
+	if isinstance(field, field_views):
+		raise ValueError('a group of views can not be exported at once, export the fields of the views one by one.')
+
+	metadata = {'type' : type(field).__name__, 'ndim' : int(field.ndim), 'active_idx' : [int(i) for i in field.active_idx],
+		'precision' : field.precision}
+	store = _hdf5_store(filename, 'w') if _is_hdf5(filename) else _directory_store(filename, 'w')
+
+	# the fields are stored in T (T/nm), chunk by chunk, such that memory mapped fields are not loaded as a whole.
+	metadata['field'] = store.write_array('field', field.field, 1/field.unit_conv, chunk_bytes)
+	if gradient:
+		metadata['d_field'] = store.write_array('d_field', field.d_field, 1/field.unit_conv, chunk_bytes)
+	store.write_group('ext_field', {'ext_field' : np.asarray(field.ext_field, dtype=float)})
+
+	if isinstance(field, field_qubits):
+		axes = sorted(field.setpoints._setpoints.keys())
+		metadata['setpoints'] = {'axes' : axes, 'labels' : list(field.setpoints.labels), 'units' : list(field.setpoints.units)}
+		store.write_group('axes', {'axis_{}'.format(axis) : np.asarray(values) for axis, values in zip(axes, field.setpoints.setpoints)})
+	else:
+		store.write_group('axes', {'x' : np.asarray(field.x), 'y' : np.asarray(field.y), 'z' : np.asarray(field.z)})
+
+	store.write_group('geometry', _geometry(field))
+	store.write_metadata(metadata)
+
+def load_field(filename):
+	'''
+	open an exported field (see export_field), the data is read when the field is indexed (e.g. by Bx or dB).
+
+	Returns:
+		field (field_stored) : field with the B, dB and Btot accessors, the axes of the points (x, y, z) or the setpoints
+			of the sweep (setpoints) and the magnets (geometry, dict of arrays, positions in nm, magnetisation in T)
+	'''
+	store = _hdf5_store(filename) if _is_hdf5(filename) else _directory_store(filename)
+	metadata = store.metadata()
+
+	d_field = store.array('d_field', metadata['d_field']) if 'd_field' in metadata else None
+	loaded = field_stored(store.array('field', metadata['field']), d_field, metadata['ndim'], metadata['active_idx'],
+		store.group('ext_field')['ext_field'], metadata['precision'])
+
+	axes = store.group('axes')
+	if 'setpoints' in metadata:
+		loaded.setpoints = setpoint_mgr()
+		for axis, label, unit in zip(*(metadata['setpoints'][key] for key in ('axes', 'labels', 'units'))):
+			loaded.setpoints += setpoint(axis, (label,), (unit,), (axes['axis_{}'.format(axis)],))
+	else:
+		loaded.x, loaded.y, loaded.z = axes['x'], axes['y'], axes['z']
+	loaded.geometry = store.group('geometry')
+	loaded.store = store
+	return loaded
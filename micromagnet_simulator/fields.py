@@ -1,62 +1,238 @@
+from collections import OrderedDict
+
 import numpy as np
 
+from micromagnet_simulator.engine.adaptive import bisection, quadtree
+from micromagnet_simulator.engine.backends import get_backend, get_backend_key
+from micromagnet_simulator.engine.cache import field_cache, get_field_cache
+from micromagnet_simulator.engine.incremental import get_incremental_cache
+from micromagnet_simulator.engine.profiling import profiled, stage
+from micromagnet_simulator.engine.sources import source_collection
+from micromagnet_simulator.engine.sweep import packed_sweep, evaluate_serial, evaluate_sweep, evaluate_linear
+
+def _unit_conv(unit):
+	'''
+	conversion factor of a field in T to the given unit.
+	'''
+	if unit == 'T':
+		return 1
+	elif unit == 'mT':
+		return 1e3
+	elif unit == 'GHz':
+		return 28.5714
+	elif unit == 'MHz':
+		return 28.5714*1e3
+	else:
+		raise ValueError('Invalid unit supplied.')
+
 class field_generic():
-	def __init__(self):
-		self.unit = 'T'
+	def __init__(self, precision='float64'):
+		'''
+		Args:
+			precision (str) : floating point precision used to store the fields ('float32' or 'float64')
+		'''
+		# incremented whenever the stored fields change (new values, unit or external field), e.g. for the colour scales of the plots.
+		self.version = 0
+		self._unit = 'T'
+		self.backend = None
+		self.precision = precision
 		self._field = None
 		self._d_field = None
+		self._ext_field = None
+
+	@property
+	def _field(self):
+		return self._field_data
+
+	@_field.setter
+	def _field(self, value):
+		# also the in place updates (e.g. self._field *= scale) assign the field again.
+		self._field_data = value
+		self.version += 1
+
+	@property
+	def _d_field(self):
+		return self._d_field_data
+
+	@_d_field.setter
+	def _d_field(self, value):
+		self._d_field_data = value
+		self.version += 1
+
+	@property
+	def precision(self):
+		return self._precision
+
+	@precision.setter
+	def precision(self, value):
+		if value not in ('float32', 'float64'):
+			raise ValueError("invalid precision selected, options : 'float32', 'float64'")
+		self._precision = value
+
+	@property
+	def dtype(self):
+		return np.dtype(self.precision)
+
+	@property
+	def unit(self):
+		'''
+		unit of the stored fields (the derivatives are stored in unit/nm).
+		'''
+		return self._unit
+
+	@unit.setter
+	def unit(self, value):
+		# the stored fields are kept in the selected unit, such that field components can be handed out as views.
+		scale = _unit_conv(value)/_unit_conv(self._unit)
+		if scale != 1:
+			if self._field is not None:
+				self._field *= scale
+			if self._d_field is not None:
+				self._d_field *= scale
+		self._unit = value
 
 	@property
 	def unit_conv(self):
-		if self.unit == 'T':
-			return 1
-		elif self.unit == 'mT':
-			return 1e3
-		elif self.unit == 'GHz':
-			return 28.5714
-		elif self.unit == 'MHz':
-			return 28.5714*1e3
-		else:
-			raise ValueError('Invalid unit supplied.')
-		
+		return _unit_conv(self.unit)
+
+	def _default_ext_field(self):
+		return np.zeros(3)
+
 	@property
-	def Bx(self):
-		idx = [0]*self.ndim + [0]
+	def ext_field(self):
+		'''
+		uniform external field (unit in T) that is included in the field, shape broadcastable with the field (e.g. (3,)).
+		'''
+		if self._ext_field is None:
+			self._ext_field = self._default_ext_field()
+		return self._ext_field
+
+	@ext_field.setter
+	def ext_field(self, value):
+		value = np.asarray(value, dtype=float)
+		if value.size == 0:
+			value = np.zeros(3)
+		# the field of the magnets does not depend on the external field, the stored field is updated in place.
+		if self._field is not None:
+			self._field += (value - self.ext_field)*self.unit_conv
+		self._ext_field = value
+
+	def _getB(self, collection, positions):
+		'''
+		field of a magnet_collection at positions (unit in mm), in T.
+		'''
+		with stage('fields.getB', n_points=len(positions), collection=collection):
+			return 1e-3*get_backend(self.backend).getB(collection, positions)
+
+	def gradient(self, collection, positions):
+		'''
+		field (T) and the derivatives of the field (T/nm) of a magnet_collection at positions (unit in mm).
+
+		The derivatives are calculated analytically (numpy backend) or with shifted observer positions (magpylib backend),
+		the collection itself is never moved.
+
+		Returns:
+			B (np.ndarray) : field, shape (n_points, 3)
+			dB (np.ndarray) : derivatives ordered like d_field, i.e. shape (3 (movement direction), n_points, 3 (field direction))
+		'''
+		with stage('fields.getB_jacobian', n_points=len(positions), collection=collection):
+			B, J = get_backend(self.backend).getB_jacobian(collection, positions)
+		return 1e-3*B, 1e-9*np.moveaxis(J, -1, 0)
+
+	def _store(self, B, out=None, ext_field=False):
+		'''
+		convert a field in T to the unit and precision of this object (in out, if given).
+
+		Args:
+			B (np.ndarray) : field (or derivatives) in T (T/nm)
+			out (np.ndarray) : output buffer
+			ext_field (bool) : add the external field
+		'''
+		if out is None:
+			out = np.empty(B.shape, self.dtype)
+		if ext_field:
+			np.add(B, self.ext_field, out=out, casting='same_kind')
+			out *= self.unit_conv
+		else:
+			np.multiply(B, self.unit_conv, out=out, casting='same_kind')
+		return out
+
+	def _cache_key(self):
+		'''
+		key of the field in the field cache (None if the field can not be cached).
+		'''
+		return None
+
+	def _load_cache(self, gradient):
+		'''
+		load the field (and d_field if gradient) from the field cache, returns True if they were found.
+		'''
+		cache = get_field_cache()
+		if cache is None or self._cache_key() is None:
+			return False
+
+		key = self._cache_key()
+		field = cache.load(key, 'field')
+		d_field = cache.load(key, 'd_field') if gradient else None
+		if field is None or (gradient and d_field is None):
+			return False
+
+		# the cache stores the field of the magnets in T (T/nm), the copy on write memory maps are converted in place.
+		for data in (field, d_field):
+			if data is not None and self.unit_conv != 1:
+				data *= self.unit_conv
+		field += self.ext_field*self.unit_conv
+		self._field = field
+		if gradient:
+			self._d_field = d_field
+		return True
+
+	def _store_cache(self, gradient):
+		cache = get_field_cache()
+		if cache is None or self._cache_key() is None:
+			return
+
+		key = self._cache_key()
+		cache.store(key, 'field', self._field/self.unit_conv - self.ext_field)
+		if gradient:
+			cache.store(key, 'd_field', self._d_field/self.unit_conv)
+
+	def _index(self, component=None):
+		idx = [0]*self.ndim
 		for i in self.active_idx:
 			idx[i] = slice(None)
-		return self.field[tuple(idx)]*self.unit_conv
+		if component is None:
+			return tuple(idx) + (slice(None),)
+		return tuple(idx) + (component,)
+
+	@property
+	def Bx(self):
+		return self.field[self._index(0)]
 
 	@property
 	def By(self):
-		idx = [0]*self.ndim + [1]
-		for i in self.active_idx:
-			idx[i] = slice(None)
-		return self.field[tuple(idx)]*self.unit_conv
+		return self.field[self._index(1)]
 
 	@property
 	def Bz(self):
-		idx = [0]*self.ndim + [2]
-		for i in self.active_idx:
-			idx[i] = slice(None)
-		return self.field[tuple(idx)]*self.unit_conv
+		return self.field[self._index(2)]
 
 	@property
 	def Btot(self):
-		idx = [0]*self.ndim
-		for i in self.active_idx:
-			idx[i] = slice(None)
-		return np.linalg.norm(self.field,axis=3)[tuple(idx)]*self.unit_conv
+		field = self.field[self._index()]
+		return np.sqrt(np.einsum('...i,...i->...', field, field))
 
 	def B(self, direction):
 		if len(direction) == 1:
 			return getattr(self, 'B{}'.format(direction))
 		else:
-			B = np.zeros(self.Bx.shape)
+			B = np.zeros(self.Bx.shape, self.dtype)
 
 			for i in range(len(direction)):
-				B += getattr(self, 'B{}'.format(list(direction)[i]))**2
+				component = getattr(self, 'B{}'.format(list(direction)[i]))
+				B += component*component
 
-			return np.sqrt(B)
+			return np.sqrt(B, out=B)
 
 	def dB(self, field_direction, movement_direction):
 		field_direction = list(field_direction)
@@ -67,7 +243,7 @@ class field_generic():
 			for i in self.active_idx:
 				idx[i+1] = slice(None)
 
-			return self.d_field[tuple(idx)]*self.unit_conv
+			return self.d_field[tuple(idx)]
 		else:
 			field = 0 
 			for i in list(movement_direction):
@@ -75,9 +251,9 @@ class field_generic():
 					idx = [list('xyz').index(i)]+self.ndim*[0]+[list('xyz').index(j)]
 					for k in self.active_idx:
 						idx[k+1] = slice(None)
-					field += self.d_field[tuple(idx)]**2
+					field = field + self.d_field[tuple(idx)]**2
 					
-			return np.sqrt(field)*self.unit_conv
+			return np.sqrt(field)
 
 	@property
 	def ndim(self):
@@ -88,53 +264,209 @@ class field_generic():
 		return np.where(np.array(self.field[:,:,:,0].shape)>1)[0]
 
 class field(field_generic):
-	def __init__(self, collection, views, unit='T'):
-		super().__init__()
+	def __init__(self, collection, views, unit='T', backend=None, precision='float64', chunk_size=2**16, ext_field=(0,0,0)):
+		'''
+		field on a regular grid of points.
+
+		Args:
+			collection (magnet_collection) : magnets that generate the field
+			views (tuple) : (start, stop, n_points) for the x, y and z axis (unit in nm)
+			unit (str) : unit of the field ('T', 'mT', 'GHz', 'MHz')
+			backend (str) : backend used to calculate the fields (None is the default backend)
+			precision (str) : floating point precision used to store the fields ('float32' or 'float64')
+			chunk_size (int) : number of points that are evaluated at once, the positions of all points are never stored together
+			ext_field (tuple) : uniform external field (Bx, By, Bz) (unit in T)
+		'''
+		super().__init__(precision)
+		self.collection = collection
 		self.coll = collection.coll
+		self.backend = backend
 		self.views = views
+		self.chunk_size = chunk_size
+		self.unit = unit
+		self.ext_field = ext_field
+
+	@property
+	def grid_shape(self):
+		return (self.views[0][2], self.views[1][2], self.views[2][2])
 
-		pos = np.zeros([self.x.size, self.y.size, self.z.size,3])
+	@property
+	def n_points(self):
+		return int(np.prod(self.grid_shape))
 
-		for i in range(self.x.size):
-			for j in range(self.y.size):
-				for k in range(self.z.size):
-					pos[i,j,k] = [self.x[i], self.y[j], self.z[k]]
+	def _positions(self, start, stop):
+		'''
+		positions (unit in mm) of the points with flat index start to stop, shape (stop-start, 3).
+		'''
+		return self._positions_at(np.arange(start, stop))
 
-		self.positions = pos*1e-6
-		self.unit = unit
+	def _positions_at(self, indices):
+		'''
+		positions (unit in mm) of the points with the given flat indices, shape (len(indices), 3).
+		'''
+		i, j, k = np.unravel_index(indices, self.grid_shape)
+		return np.stack([self.x[i], self.y[j], self.z[k]], axis=-1)*1e-6
+
+	@property
+	def positions(self):
+		'''
+		positions of all the points of the grid (unit in mm), shape (nx, ny, nz, 3).
+		'''
+		x, y, z = np.meshgrid(self.x*1e-6, self.y*1e-6, self.z*1e-6, indexing='ij')
+		return np.stack([x, y, z], axis=-1)
+
+	def _output(self, out, shape):
+		'''
+		buffer for the output of the evaluation : a new array (out is None), a memory mapped .npy file (out is a filename)
+		or the supplied array.
+		'''
+		if out is None:
+			return np.empty(shape, self.dtype)
+		if isinstance(out, str):
+			return np.lib.format.open_memmap(out, mode='w+', dtype=self.dtype, shape=shape)
+		if out.shape != shape or not out.flags['C_CONTIGUOUS']:
+			raise ValueError('output buffer should be a C-contiguous array of shape {}'.format(shape))
+		return out
+
+	def iter_tiles(self, gradient=False, tile_size=None, out=None, d_out=None, progress=None, cancel=None):
+		'''
+		evaluate the field tile by tile, every tile is written directly into the output before it is yielded.
+
+		When all the tiles are evaluated, the outputs are used as the field (and d_field) of this object.
+
+		Args:
+			gradient (bool) : also calculate the derivatives of the field
+			tile_size (int) : number of points per tile (default : chunk_size)
+			out (np.ndarray/str) : output of the field, array of shape (nx, ny, nz, 3) (e.g. a np.memmap) or the filename of a .npy file that is memory mapped
+			d_out (np.ndarray/str) : same as out for the derivatives of the field, shape (3, nx, ny, nz, 3)
+			progress (function) : called as progress(n_done, n_points) after every tile
+			cancel (function) : called before every tile, the evaluation stops when it returns True
+		Yields:
+			points (slice) : flat (C-order) indices of the points of the tile in the grid
+			B (np.ndarray) : field of the tile (view into out), shape (n, 3)
+			dB (np.ndarray) : derivatives of the field of the tile (view into d_out), shape (3, n, 3) (None if not gradient)
+		'''
+		tile_size = self.chunk_size if tile_size is None else tile_size
+		if tile_size < 1:
+			raise ValueError('tile_size should be at least 1')
+
+		out = self._output(out, self.grid_shape + (3,))
+		field = out.reshape(-1, 3)
+		if gradient:
+			d_out = self._output(d_out, (3,) + self.grid_shape + (3,))
+			d_field = d_out.reshape(3, -1, 3)
+
+		for start in range(0, self.n_points, tile_size):
+			if cancel is not None and cancel():
+				return
+			stop = min(start + tile_size, self.n_points)
+			positions = self._positions(start, stop)
+
+			if gradient:
+				B, dB = self.gradient(self.collection, positions)
+				dB = self._store(dB, d_field[:,start:stop])
+			else:
+				B = self._getB(self.collection, positions)
+				dB = None
+			B = self._store(B, field[start:stop], ext_field=True)
+
+			if progress is not None:
+				progress(stop, self.n_points)
+			yield slice(start, stop), B, dB
+
+		self._field = out
+		if gradient:
+			self._d_field = d_out
+
+	def evaluate(self, gradient=False, tile_size=None, out=None, d_out=None, progress=None, cancel=None):
+		'''
+		evaluate the full grid tile by tile (see iter_tiles for the arguments).
+
+		Returns:
+			field (np.ndarray) : field, shape (nx, ny, nz, 3), only partially filled if the evaluation was cancelled
+			d_field (np.ndarray) : derivatives of the field, shape (3, nx, ny, nz, 3) (None if not gradient)
+		'''
+		out = self._output(out, self.grid_shape + (3,))
+		if gradient:
+			d_out = self._output(d_out, (3,) + self.grid_shape + (3,))
+
+		for _ in self.iter_tiles(gradient, tile_size, out, d_out, progress, cancel):
+			pass
+
+		return out, d_out if gradient else None
+
+	def _points_key(self):
+		'''
+		array that identifies the points of the field (for the caches).
+		'''
+		return np.asarray(self.views, dtype=float)
+
+	def _cache_key(self):
+		sources = self.collection.sources
+		return field_cache.key('field', sources.centers, sources.dims, sources.magnetisation, sources.prisms.key(),
+			self._points_key(), get_backend_key(self.backend), self.dtype.str)
+
+	def _evaluate_sources(self, sources, indices, gradient):
+		'''
+		field (T) and derivatives (T/nm) of a subset of the sources at the points with the given flat indices (all points if None),
+		with shapes (n, 3) and (3, n, 3) (see incremental_cache).
+		'''
+		collection = source_collection(sources)
+		indices = np.arange(self.n_points) if indices is None else indices
+
+		B = np.empty((len(indices), 3))
+		dB = np.empty((3, len(indices), 3)) if gradient else None
+		for start in range(0, len(indices), self.chunk_size):
+			points = slice(start, start + self.chunk_size)
+			positions = self._positions_at(indices[points])
+			if gradient:
+				B[points], dB[:,points] = self.gradient(collection, positions)
+			else:
+				B[points] = self._getB(collection, positions)
+
+		return B, dB
+
+	@profiled('field.evaluate')
+	def _evaluate(self, gradient):
+		if self._load_cache(gradient):
+			return
+
+		cache = get_incremental_cache()
+		if cache is not None:
+			key = field_cache.key('field', self._points_key(), get_backend_key(self.backend))
+			B, dB = cache.evaluate(key, self.collection.sources, gradient, self._evaluate_sources)
+			self._field = self._store(B.reshape(self.grid_shape + (3,)), ext_field=True)
+			if gradient:
+				self._d_field = self._store(dB.reshape((3,) + self.grid_shape + (3,)))
+		else:
+			for _ in self.iter_tiles(gradient):
+				pass
+
+		self._store_cache(gradient)
 
 	@property
 	def field(self):
 		if self._field is None:
-			self._field = 1e-3*self.coll.getB(self.positions.reshape([int(self.positions.size/3),3])).reshape(self.positions.shape)
+			self._evaluate(False)
 		return self._field
 
 	@property
 	def d_field(self):
 		'''
-		unit : T/nm
+		unit : T/nm (or the selected unit/nm)
 		Bx/x By/x Bz/x
 		Bx/y By/y Bz/y
 		Bx/z By/z Bz/z
 		'''
 		if self._d_field is None:
-			h =0.5 #nm
-			self._d_field = np.empty([3]+list(self.field.shape))
-
-			for i in range(3):
-				movement_operator = [0,0,0]
-				movement_operator[i] = -h*1e-6
-				self.coll.move(movement_operator)
-				
-				field_off = 1e-3*self.coll.getB(self.positions.reshape([int(self.positions.size/3),3])).reshape(self.positions.shape)
-				
-				movement_operator[i] = h*1e-6
-				self.coll.move(movement_operator)
-				
-				self._d_field[i] = (field_off - self.field)/h
+			self._evaluate(True)
 
 		return self._d_field
 
+	@property
+	def active_idx(self):
+		return np.where(np.array(self.grid_shape)>1)[0]
+
 	@property
 	def x(self):
 		return np.linspace(self.views[0][0], self.views[0][1], self.views[0][2])
@@ -149,63 +481,362 @@ class field(field_generic):
 
 	@property
 	def shape(self):
-		return tuple(np.array(self.field.shape)[self.active_idx])
+		return tuple(np.array(self.grid_shape)[self.active_idx])
 
 	@property
 	def dim(self):
 		return len(self.shape)
 
+class field_points(field):
+	def __init__(self, collection, points, unit='T', backend=None, precision='float64', chunk_size=2**16, ext_field=(0,0,0)):
+		'''
+		field at a list of points, e.g. the positions of the dots.
+
+		Args:
+			collection (magnet_collection) : magnets that generate the field
+			points (np.ndarray) : positions of the points, shape (n_points, 3) (unit in nm)
+			unit, backend, precision, chunk_size, ext_field : see field
+		'''
+		self.points = np.asarray(points, dtype=float).reshape(-1,3)
+		super().__init__(collection, self.points, unit, backend, precision, chunk_size, ext_field)
+
+	@property
+	def grid_shape(self):
+		return (len(self.points),)
+
+	def _positions_at(self, indices):
+		return self.points[indices]*1e-6
+
+	@property
+	def positions(self):
+		return self.points*1e-6
+
+	@property
+	def ndim(self):
+		return 1
+
+	@property
+	def active_idx(self):
+		return np.array([0])
+
+	@property
+	def x(self):
+		return self.points[:,0]
+
+	@property
+	def y(self):
+		return self.points[:,1]
+
+	@property
+	def z(self):
+		return self.points[:,2]
+
+class field_views(field):
+	def __init__(self, fields, chunk_size=2**16):
+		'''
+		fields of several views (grids and point lists) of the same magnets, evaluated together in a single pass over the points of all the views.
+
+		The magnets are prepared once (e.g. packed into arrays) and the backends get large batches of points, also for small views
+		such as line cuts. After the evaluation, the field (and d_field) of every view is a slice of the buffer of this object.
+
+		Args:
+			fields (dict) : fields (field or field_points objects, not evaluated) of the views by name, with the same collection, unit, backend,
+				precision and external field
+			chunk_size (int) : number of points that are evaluated at once
+		'''
+		self.fields = OrderedDict(fields)
+		members = list(self.fields.values())
+		if len(members) == 0:
+			raise ValueError('no views to evaluate.')
+		for member in members:
+			if isinstance(member, field_adaptive) or not isinstance(member, field):
+				raise ValueError('only grids (field) and point lists (field_points) can be evaluated together.')
+
+		first = members[0]
+		super().__init__(first.collection, [member.views for member in members], first.unit, first.backend, first.precision,
+			chunk_size, first.ext_field)
+		self.offsets = np.cumsum([0] + [member.n_points for member in members])
+
+	@property
+	def grid_shape(self):
+		return (int(self.offsets[-1]),)
+
+	def _positions_at(self, indices):
+		# the positions are made per view, the positions of all the points are never stored together.
+		view = np.searchsorted(self.offsets, indices, side='right') - 1
+		positions = np.empty((len(indices), 3))
+		for i in np.unique(view):
+			selected = view == i
+			positions[selected] = list(self.fields.values())[i]._positions_at(indices[selected] - self.offsets[i])
+		return positions
+
+	@property
+	def positions(self):
+		return self._positions_at(np.arange(self.n_points))
+
+	def _points_key(self):
+		return field_cache.key(*[member._points_key() for member in self.fields.values()])
+
+	@property
+	def ndim(self):
+		return 1
+
+	@property
+	def active_idx(self):
+		return np.array([0])
+
+	def _distribute(self):
+		'''
+		hand out the slices of the buffers to the fields of the views.
+		'''
+		for member, start, stop in zip(self.fields.values(), self.offsets[:-1], self.offsets[1:]):
+			member._unit = self.unit
+			member._field = self._field[start:stop].reshape(member.grid_shape + (3,))
+			if self._d_field is not None:
+				member._d_field = self._d_field[:,start:stop].reshape((3,) + member.grid_shape + (3,))
+
+	def iter_tiles(self, gradient=False, tile_size=None, out=None, d_out=None, progress=None, cancel=None):
+		yield from super().iter_tiles(gradient, tile_size, out, d_out, progress, cancel)
+		if self._field is not None:
+			self._distribute()
+
+	def _evaluate(self, gradient):
+		super()._evaluate(gradient)
+		self._distribute()
+
+	def evaluate_views(self, gradient=False):
+		'''
+		evaluate the field (and the derivatives if gradient) of all the views.
+
+		Returns:
+			fields (dict) : the evaluated fields of the views by name
+		'''
+		if gradient:
+			self.d_field
+		else:
+			self.field
+		return self.fields
+
+class field_adaptive(field):
+	def __init__(self, collection, views, tolerance=1e-3, unit='T', backend=None, precision='float64', chunk_size=2**16, ext_field=(0,0,0), n_cells=8):
+		'''
+		field on a regular grid of points in a plane (an image), interpolated from adaptively refined samples (see engine.adaptive).
+
+		The cells of the quadtree are refined down to the spacing of the grid, where the field (and its derivatives, if requested)
+		can not be interpolated within the tolerance. The quadtree can be resampled onto other grids in the same plane without new evaluations.
+
+		Args:
+			collection (magnet_collection) : magnets that generate the field
+			views (tuple) : (start, stop, n_points) for the x, y and z axis (unit in nm), two of the axes should have more than one point
+			tolerance (float) : maximal interpolation error, relative to the largest field (and derivative) on the coarse grid
+			unit (str) : unit of the field ('T', 'mT', 'GHz', 'MHz')
+			backend (str) : backend used to calculate the fields (None is the default backend)
+			precision (str) : floating point precision used to store the fields ('float32' or 'float64')
+			chunk_size (int) : number of points that are evaluated at once
+			ext_field (tuple) : uniform external field (Bx, By, Bz) (unit in T)
+			n_cells (int) : number of cells of the coarse grid along both axes of the image
+		'''
+		super().__init__(collection, views, unit, backend, precision, chunk_size, ext_field)
+		if len(self.active_idx) != 2:
+			raise ValueError('adaptive sampling is only supported for images (2 axes with more than one point).')
+		self.tolerance = tolerance
+		self.n_cells = n_cells
+		self.tree = None
+		self._tree_key = None
+
+	@property
+	def n_evaluations(self):
+		'''
+		number of points at which the field was evaluated (0 if it is not evaluated yet).
+		'''
+		return 0 if self.tree is None else self.tree.n_evaluations
+
+	def _sample(self, gradient):
+		'''
+		quadtree of the field (T) and its derivatives (T/nm) in the plane of the image.
+		'''
+		u_axis, v_axis = self.active_idx
+		w_axis = 3 - u_axis - v_axis
+		level = self.views[w_axis][0]
+
+		def evaluate(u, v):
+			positions = np.empty((len(u), 3))
+			positions[:,u_axis], positions[:,v_axis], positions[:,w_axis] = u*1e-6, v*1e-6, level*1e-6
+
+			values = np.empty((len(u), 12 if gradient else 3))
+			for start in range(0, len(u), self.chunk_size):
+				points = slice(start, start + self.chunk_size)
+				if gradient:
+					B, dB = self.gradient(self.collection, positions[points])
+					values[points,:3], values[points,3:] = B, np.moveaxis(dB, 0, 1).reshape(-1, 9)
+				else:
+					values[points] = self._getB(self.collection, positions[points])
+			return values
+
+		# the finest cells have the spacing of the grid, such that the points of the grid are points of the quadtree.
+		# the coarse cells are a power of two larger, the quadtree can therefore extend beyond the grid.
+		n_intervals = [self.views[i][2] - 1 for i in (u_axis, v_axis)]
+		max_depth = max(0, int(np.round(np.log2(max(n_intervals)/self.n_cells))))
+		n_cells = [int(np.ceil(n/2**max_depth)) for n in n_intervals]
+		bounds = [(self.views[axis][0], self.views[axis][0] + (self.views[axis][1] - self.views[axis][0])*n_cells[i]*2**max_depth/n_intervals[i])
+			for i, axis in enumerate((u_axis, v_axis))]
+
+		return quadtree(evaluate, bounds, n_cells, max_depth, self.tolerance, [[0,1,2], list(range(3,12))] if gradient else None)
+
+	def resample(self, views):
+		'''
+		the field on another grid of points in the same plane, interpolated from the same quadtree.
+
+		Args:
+			views (tuple) : (start, stop, n_points) for the x, y and z axis (unit in nm), points outside of the original image are NaN
+		'''
+		resampled = field_adaptive(self.collection, views, self.tolerance, self.unit, self.backend, self.precision,
+			self.chunk_size, self.ext_field, self.n_cells)
+		if tuple(resampled.active_idx) != tuple(self.active_idx) or views[3 - sum(self.active_idx)][0] != self.views[3 - sum(self.active_idx)][0]:
+			raise ValueError('the grid should lie in the plane of the original image.')
+		resampled.tree, resampled._tree_key = self.tree, self._tree_key
+		return resampled
+
+	def _cache_key(self):
+		return field_cache.key(super()._cache_key(), 'adaptive', self.tolerance, self.n_cells)
+
+	@profiled('field_adaptive.evaluate')
+	def _evaluate(self, gradient):
+		if self._load_cache(gradient):
+			return
+
+		# the quadtree is made again for another backend, or when the derivatives are needed but were not sampled.
+		backend = get_backend_key(self.backend)
+		if self.tree is None or self._tree_key[0] != backend or (gradient and not self._tree_key[1]):
+			self.tree = self._sample(gradient)
+			self._tree_key = (backend, gradient)
+
+		u, v = np.meshgrid(*[[self.x, self.y, self.z][i] for i in self.active_idx], indexing='ij')
+		values = self.tree.interpolate(u, v)
+		self._field = self._store(values[:,:3].reshape(self.grid_shape + (3,)), ext_field=True)
+		if gradient:
+			self._d_field = self._store(np.moveaxis(values[:,3:].reshape(-1, 3, 3), 1, 0).reshape((3,) + self.grid_shape + (3,)))
+
+		self._store_cache(gradient)
+
 class field_qubits(field_generic):
-	def __init__(self, MM_properties, setpoints):
-		super().__init__()
+	def __init__(self, MM_properties, setpoints, backend=None, n_workers=None, chunk_size=None, precision='float64', linear=False):
+		'''
+		field at the qubit positions for every point of a sweep.
+
+		Args:
+			MM_properties (data_container) : the simulation data of every sweep point
+			setpoints (setpoint_mgr) : setpoints of the sweep
+			backend (str) : backend used to calculate the fields (None is the default backend)
+			n_workers (int) : if not None, spread the sweep points over a pool of n_workers processes (0 : number of cores)
+			chunk_size (int) : number of sweep points that are sent to a worker process at once
+			precision (str) : floating point precision used to store the fields ('float32' or 'float64')
+			linear (bool) : calculate the response to the magnetisation once per geometry and combine it for every sweep point
+				(see engine.sweep.evaluate_linear), e.g. for sweeps of the magnetisation. Uses the closed form expressions of the numpy backend.
+		'''
+		super().__init__(precision)
+		self.backend = backend
 		self.setpoints = setpoints
 		self.MM_properties = MM_properties
+		self.n_workers = n_workers
+		self.chunk_size = chunk_size
+		self.linear = linear
 		self._field = None
 		self._d_field = None
+		self._sweep = None
 
 	@property
-	def field(self):
+	def sweep(self):
+		'''
+		all sweep points packed as arrays (see engine.sweep.packed_sweep).
+		'''
+		if self._sweep is None:
+			self._sweep = packed_sweep.from_data(self.MM_properties.flat)
+		return self._sweep
+
+	def _default_ext_field(self):
+		# the external field of every sweep point, broadcast over the dots.
+		return self._sweep_grid(self.sweep.ext_field)[...,np.newaxis,:]
+
+	def _cache_key(self):
+		sweep = self.sweep
+		prisms = None if sweep.prisms is None else [p.key() for p in sweep.prisms]
+		return field_cache.key('field_qubits', sweep.offsets, sweep.centers, sweep.dims, sweep.magnetisation, prisms,
+			sweep.dot_positions, self.shape, 'numpy' if self.linear else get_backend_key(self.backend), self.dtype.str)
+
+	def _evaluate_points(self, sweep, gradient):
+		'''
+		field (mT) and derivatives (mT/mm) at the dots of the points of a packed sweep (see engine.sweep.evaluate_serial).
+		'''
+		# sweep points that only differ in external field (or are otherwise identical) are evaluated once.
+		unique, inverse = sweep.unique()
+		if self.linear:
+			B, J = evaluate_linear(unique, gradient)
+		elif self.n_workers is None:
+			B, J = evaluate_serial(unique, self.backend, gradient)
+		else:
+			B, J = evaluate_sweep(unique, self.backend, gradient, self.n_workers or None, self.chunk_size)
+
+		if len(unique) != len(sweep):
+			B = B[inverse]
+			J = J[inverse] if gradient else None
+		return B, J
+
+	def _sweep_grid(self, values):
+		'''
+		values of all the sweep points in the order of MM_properties.flat (shape (n_sweep, ...)) on the grid of the setpoints (shape (*shape, ...)).
+		'''
+		# the last loop axis is the first dimension of MM_properties, the setpoints are ordered from the first loop axis.
+		n = len(self.shape)
+		values = values.reshape(tuple(self.shape[::-1]) + values.shape[1:])
+		return values.transpose(list(range(n))[::-1] + list(range(n, values.ndim)))
+
+	def _store_sweep(self, B, J):
+		'''
+		store the field (T) and the derivatives (T/nm, None if not calculated) of all the sweep points, in the order of MM_properties.flat.
+
+		Args:
+			B (np.ndarray) : shape (n_sweep, n_dots, 3)
+			J (np.ndarray) : J[...,i,j] = dB_i/dx_j, shape (n_sweep, n_dots, 3, 3)
+		'''
 		if self._field is None:
-			self._field = np.zeros([self.size, len(self.MM_properties.flat[0].dot_positions), 3])
-			for i in range(self.MM_properties.size):
-				 self._field[i]= 1e-3*self.MM_properties.flat[i].magnet_collection.coll.getB(
-				 	self.MM_properties.flat[i].magnet_collection.qubit_positions)
+			self._field = self._store(self._sweep_grid(B), ext_field=True)
+		if J is not None:
+			self._d_field = self._store(np.moveaxis(self._sweep_grid(J), -1, 0))
+
+	@profiled('field_qubits.evaluate')
+	def _evaluate(self, gradient):
+		'''
+		evaluate the sweep, the sweep points are packed into arrays, no magpylib collections are made unless the backend needs them.
+		'''
+		if self.MM_properties is None:
+			# the stored results of a sweep (see sweep_runner.load_sweep) can not be calculated again.
+			raise ValueError('no derivatives of the field were stored for this sweep (it was run with gradient=False).' if gradient
+				else 'no field was stored for this sweep.')
+		if self._load_cache(gradient):
+			return
 
-			shape = (*self.shape, len(self.MM_properties.flat[0].dot_positions), 3)
+		B, J = self._evaluate_points(self.sweep, gradient)
+		self._store_sweep(1e-3*B, 1e-9*J if gradient else None)
+		self._store_cache(gradient)
 
-			self._field = self._field.reshape(shape)
+	@property
+	def field(self):
+		if self._field is None:
+			self._evaluate(False)
 
 		return self._field
 
 	@property
 	def d_field(self):
 		'''
-		unit : T/nm
+		unit : T/nm (or the selected unit/nm)
 		Bx/x By/x Bz/x
 		Bx/y By/y Bz/y
 		Bx/z By/z Bz/z
 		'''
 		if self._d_field is None:
-			h =0.5 #nm
-			self._d_field = np.empty([3]+list(self.field.shape))
-
-			for i in range(3):
-				movement_operator = [0,0,0]
-				movement_operator[i] = -h*1e-6
-				self.MM_properties.move(movement_operator)
-				
-				field_off = np.zeros([self.size, len(self.MM_properties.flat[0].dot_positions), 3])
-				for MM in range(self.MM_properties.size):
-					 field_off[MM]= 1e-3*self.MM_properties.flat[MM].magnet_collection.coll.getB(
-					 	self.MM_properties.flat[MM].magnet_collection.qubit_positions)
-				
-				shape = (*self.shape, len(self.MM_properties.flat[0].dot_positions), 3)
-				field_off = field_off.reshape(shape)
-
-				movement_operator[i] = h*1e-6
-				self.MM_properties.move(movement_operator)
-				
-				self._d_field[i] = (field_off - self.field)/h
+			self._evaluate(True)
 
 		return self._d_field
 
@@ -227,4 +858,168 @@ class field_qubits(field_generic):
 
 	@property
 	def active_idx(self):
-		return np.arange(self.ndim, dtype=np.int)
+		return np.arange(self.ndim, dtype=int)
+
+class field_qubits_adaptive(field_qubits):
+	def __init__(self, MM_properties, setpoints, backend=None, n_workers=None, chunk_size=None, precision='float64', linear=False):
+		'''
+		field at the qubit positions for every point of a sweep, of which the points along the adaptive loop axes
+		(see loop_control.looping.adaptive_linspace) are sampled adaptively (see engine.adaptive) and interpolated.
+		The points along the other loop axes are all evaluated, for every adaptive sample.
+
+		Args:
+			see field_qubits, MM_properties (data_container) should have one or two adaptive loop axes
+		'''
+		super().__init__(MM_properties, setpoints, backend, n_workers, chunk_size, precision, linear)
+		if len(MM_properties.adaptive) not in (1, 2):
+			raise ValueError('adaptive sampling is supported for sweeps with one or two adaptive loop axes.')
+		self.axes = sorted(MM_properties.adaptive, reverse=True)
+		self.tree = None
+		self._tree_key = None
+		self._ext_field_grid = None
+
+	@property
+	def n_evaluations(self):
+		'''
+		number of sweep points at which the field was evaluated (0 if it is not evaluated yet).
+		'''
+		return 0 if self.tree is None else self.tree.n_evaluations*self._n_other
+
+	def _cache_key(self):
+		# the points that are evaluated depend on the fields, the samples are not cached.
+		return None
+
+	def _dims(self):
+		# dimensions of MM_properties of the adaptive and the other loop axes.
+		ndim = self.MM_properties.ndim
+		dims = [ndim - 1 - axis for axis in self.axes]
+		return dims, [d for d in range(ndim) if d not in dims]
+
+	def _lattice(self):
+		'''
+		coarse cells and depth of the sampling, such that the finest level falls on the points of the sweep.
+		'''
+		shape = self.MM_properties.shape
+		dims = self._dims()[0]
+		settings = [self.MM_properties.adaptive[axis] for axis in self.axes]
+
+		depths = []
+		for dim, setting in zip(dims, settings):
+			n_intervals = shape[dim] - 1
+			depth = 0
+			while n_intervals % 2**(depth + 1) == 0 and n_intervals//2**(depth + 1) >= setting['n_cells']:
+				depth += 1
+			depths.append(depth)
+
+		depth = min(depths)
+		n_cells = [(shape[dim] - 1)//2**depth for dim in dims]
+		return n_cells, depth, min(setting['tolerance'] for setting in settings)
+
+	def _sample(self, gradient):
+		'''
+		sampler (bisection or quadtree) of the field (T), the external field (T) and the derivatives (T/nm) at the points of
+		the other loop axes, as a function of the indices along the adaptive loop axes.
+		'''
+		data = self.MM_properties
+		dims, other = self._dims()
+		other_index = np.indices([data.shape[d] for d in other]).reshape(len(other), -1).T if other else np.zeros((1, 0), dtype=int)
+		self._n_other = len(other_index)
+		n_dots = len(data[0].dot_positions)
+
+		def evaluate(*coordinates):
+			n = len(coordinates[0])
+			index = np.empty((n, self._n_other, data.ndim), dtype=int)
+			for dim, coordinate in zip(dims, coordinates):
+				index[:,:,dim] = np.rint(coordinate).astype(int)[:,np.newaxis]
+			for i, dim in enumerate(other):
+				index[:,:,dim] = other_index[:,i]
+
+			flat = np.ravel_multi_index(index.reshape(-1, data.ndim).T, data.shape)
+			sweep = packed_sweep.from_data(data[int(i)] for i in flat)
+			B, J = self._evaluate_points(sweep, gradient)
+
+			values = [1e-3*B.reshape(n, -1), sweep.ext_field.reshape(n, -1)]
+			if gradient:
+				values.append(1e-9*J.reshape(n, -1))
+			return np.concatenate(values, axis=1)
+
+		# the field, the external field and the derivatives have their own scale for the tolerance.
+		sizes = np.cumsum([0, self._n_other*n_dots*3, self._n_other*3] + ([self._n_other*n_dots*9] if gradient else []))
+		groups = [list(range(start, stop)) for start, stop in zip(sizes[:-1], sizes[1:])]
+
+		n_cells, depth, tolerance = self._lattice()
+		bounds = [(0, n*2**depth) for n in n_cells]
+		if len(dims) == 1:
+			return bisection(evaluate, bounds[0], n_cells[0], depth, tolerance, groups)
+		return quadtree(evaluate, bounds, n_cells, depth, tolerance, groups)
+
+	def _to_sweep(self, values, dims, other, shape):
+		'''
+		values of the points of the adaptive axes (shape (n_adaptive, n_other*shape)) in the order of MM_properties.flat.
+		'''
+		data_shape = self.MM_properties.shape
+		values = values.reshape([data_shape[d] for d in dims] + [data_shape[d] for d in other] + list(shape))
+		values = np.moveaxis(values, list(range(len(data_shape))), dims + other)
+		return values.reshape((-1,) + tuple(shape))
+
+	def _interpolate(self, gradient):
+		'''
+		the field, the external field and the derivatives at all the sweep points, interpolated from the samples.
+		'''
+		backend = get_backend_key(self.backend)
+		if self.tree is None or self._tree_key[0] != backend or (gradient and not self._tree_key[1]):
+			self.tree = self._sample(gradient)
+			self._tree_key = (backend, gradient)
+
+		data_shape = self.MM_properties.shape
+		dims, other = self._dims()
+		grid = np.meshgrid(*[np.arange(data_shape[d]) for d in dims], indexing='ij')
+		values = self.tree.interpolate(*[g.ravel() for g in grid])
+
+		n_dots, sizes = self._layout(values.shape[1])
+		B = self._to_sweep(values[:,:sizes[1]], dims, other, (n_dots, 3))
+		ext_field = self._to_sweep(values[:,sizes[1]:sizes[2]], dims, other, (3,))
+		J = self._to_sweep(values[:,sizes[2]:], dims, other, (n_dots, 3, 3)) if gradient else None
+		return B, ext_field, J
+
+	def _layout(self, n_values):
+		# number of dots and the start of the field, the external field and the derivatives in the sampled values.
+		n_dots = (n_values//self._n_other - 3)//(12 if self._tree_key[1] else 3)
+		return n_dots, np.cumsum([0, self._n_other*n_dots*3, self._n_other*3])
+
+	def _default_ext_field(self):
+		if self._ext_field_grid is None:
+			self._ext_field_grid = self._interpolate(False)[1]
+		return self._sweep_grid(self._ext_field_grid)[...,np.newaxis,:]
+
+	@profiled('field_qubits_adaptive.evaluate')
+	def _evaluate(self, gradient):
+		B, self._ext_field_grid, J = self._interpolate(gradient)
+		# the field is interpolated again from the samples, that can be refined when the derivatives are sampled.
+		self._field = None
+		self._store_sweep(B, J)
+
+	def samples(self):
+		'''
+		the sweep points that were evaluated (the adaptive samples), without interpolation.
+
+		Returns:
+			setpoints (np.ndarray) : setpoints of the adaptive loop axes (in the order of the axes) of every sample, shape (n_samples, n_adaptive_axes)
+			B (np.ndarray) : field (in the selected unit) at the samples, shape (n_samples, n_other, n_dots, 3), where n_other
+				are the points of the other loop axes (in the order of MM_properties.flat)
+			dB (np.ndarray) : derivatives (in the selected unit/nm) ordered like d_field (None if they were not sampled), shape (3, n_samples, n_other, n_dots, 3)
+		'''
+		if self.tree is None:
+			self._evaluate(False)
+
+		*coordinates, values = self.tree.samples()
+		index = np.rint(np.stack(coordinates, axis=1)).astype(int)
+		setpoints = np.stack([self.setpoints[axis].setpoint[0][index[:,i]] for i, axis in enumerate(self.axes)], axis=1)
+
+		n = len(values)
+		n_dots, sizes = self._layout(values.shape[1])
+		B = values[:,:sizes[1]].reshape(n, self._n_other, n_dots, 3) + values[:,sizes[1]:sizes[2]].reshape(n, self._n_other, 1, 3)
+		dB = None
+		if self._tree_key[1]:
+			dB = np.moveaxis(values[:,sizes[2]:].reshape(n, self._n_other, n_dots, 3, 3), -1, 0)
+		return (setpoints, B*self.unit_conv, None if dB is None else dB*self.unit_conv)
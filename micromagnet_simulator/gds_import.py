@@ -0,0 +1,128 @@
+'''
+Import of micromagnet geometries from GDS layouts.
+
+The polygons of a layer are read with gdspy (references to other cells are flattened) and converted to nm. To keep the number of
+prism edges of a full device layout small, overlapping polygons can be merged, corners that barely change the outline can be removed
+and small polygons can be dropped before the polygons are extruded.
+'''
+import gdspy
+import numpy as np
+
+def read_gds(filename, layer, datatype=None, cell=None):
+	'''
+	polygons of a layer of a GDS file.
+
+	Args:
+		filename (str) : GDS file to read
+		layer (int) : layer of the polygons
+		datatype (int) : datatype of the polygons (None : all datatypes of the layer)
+		cell (str) : name of the cell to read (None : the top level cell of the file)
+	Returns:
+		polygons (list<np.ndarray>) : corners of the polygons, shape (n_corners, 2) (unit in nm)
+	'''
+	library = gdspy.GdsLibrary(infile=filename)
+
+	if cell is None:
+		top_level = library.top_level()
+		if len(top_level) != 1:
+			raise ValueError('{} has {} top level cells, please specify the cell to import ({}).'.format(
+				filename, len(top_level), ', '.join(c.name for c in top_level)))
+		cell = top_level[0]
+	elif cell in library.cells:
+		cell = library.cells[cell]
+	else:
+		raise ValueError('cell {} not found in {}.'.format(cell, filename))
+
+	scale = library.unit*1e9
+	polygons = []
+	for (poly_layer, poly_datatype), layer_polygons in cell.get_polygons(by_spec=True).items():
+		if poly_layer == layer and (datatype is None or poly_datatype == datatype):
+			polygons += [np.asarray(polygon, dtype=float)*scale for polygon in layer_polygons]
+
+	return polygons
+
+def merge_polygons(polygons, precision=1e-3):
+	'''
+	union of a set of polygons, overlapping and touching polygons are merged into one polygon.
+
+	Args:
+		polygons (list<np.ndarray>) : corners of the polygons, shape (n_corners, 2) (unit in nm)
+		precision (float) : precision of the boolean operation (unit in nm)
+	Returns:
+		polygons (list<np.ndarray>) : corners of the merged polygons (holes are connected to the outline by a cut)
+	'''
+	if len(polygons) == 0:
+		return []
+
+	merged = gdspy.boolean(polygons, None, 'or', precision=precision, max_points=0)
+	return [] if merged is None else [np.asarray(polygon, dtype=float) for polygon in merged.polygons]
+
+def polygon_area(polygon):
+	'''
+	area of a polygon (shoelace formula).
+	'''
+	x, y = polygon[:,0], polygon[:,1]
+	return np.abs(np.sum(x*np.roll(y, -1) - np.roll(x, -1)*y))/2
+
+def simplify_polygon(polygon, tolerance):
+	'''
+	remove the corners of a polygon that lie within tolerance of the line through their neighbours (e.g. collinear corners,
+	or the fine discretisation of rounded corners).
+
+	Every pass removes every other candidate corner, such that the deviation of a removed corner is always measured
+	with respect to corners that are kept.
+
+	Args:
+		polygon (np.ndarray) : corners of the polygon, shape (n_corners, 2) (unit in nm)
+		tolerance (float) : maximal distance of a removed corner to the line through its neighbours (unit in nm)
+	Returns:
+		polygon (np.ndarray) : corners of the simplified polygon (at least 3)
+	'''
+	polygon = np.asarray(polygon, dtype=float)
+	n_pass = 0
+
+	while len(polygon) > 3:
+		previous = np.roll(polygon, 1, axis=0)
+		chord = np.roll(polygon, -1, axis=0) - previous
+		offset = polygon - previous
+		length = np.hypot(chord[:,0], chord[:,1])
+		with np.errstate(divide='ignore', invalid='ignore'):
+			deviation = np.where(length > 0, np.abs(chord[:,0]*offset[:,1] - chord[:,1]*offset[:,0])/length,
+				np.hypot(offset[:,0], offset[:,1]))
+
+		candidates = np.flatnonzero(deviation <= tolerance)
+		if len(candidates) == 0:
+			break
+
+		remove = candidates[(candidates + n_pass)%2 == 0]
+		# the first and the last corner are neighbours as well.
+		if len(polygon)%2 == 1 and len(remove) > 1 and remove[0] == 0 and remove[-1] == len(polygon) - 1:
+			remove = remove[:-1]
+		remove = remove[:len(polygon) - 3]
+
+		polygon = np.delete(polygon, remove, axis=0)
+		n_pass += 1
+
+	return polygon
+
+def load_gds(filename, layer, datatype=None, cell=None, merge=False, tolerance=0, min_area=0):
+	'''
+	polygons of a layer of a GDS file, prepared for extrusion into prisms.
+
+	Args:
+		filename (str) : GDS file to read
+		layer (int) : layer of the polygons
+		datatype (int) : datatype of the polygons (None : all datatypes of the layer)
+		cell (str) : name of the cell to read (None : the top level cell of the file)
+		merge (bool) : merge overlapping and touching polygons
+		tolerance (float) : remove corners that lie within tolerance of the outline without them (unit in nm, 0 only removes collinear corners)
+		min_area (float) : drop polygons with a smaller area (unit in nm^2)
+	Returns:
+		polygons (list<np.ndarray>) : corners of the polygons, shape (n_corners, 2) (unit in nm)
+	'''
+	polygons = read_gds(filename, layer, datatype, cell)
+	if merge:
+		polygons = merge_polygons(polygons)
+
+	polygons = [simplify_polygon(polygon, tolerance) for polygon in polygons]
+	return [polygon for polygon in polygons if polygon_area(polygon) > min_area]
@@ -1,5 +1,6 @@
-from micromagnet_simulator.loop_control.looping import loop_obj 
-from micromagnet_simulator.loop_control.setpoint_mgr import setpoint 
+from micromagnet_simulator.engine.profiling import profiled
+from micromagnet_simulator.loop_control.looping import loop_obj
+from micromagnet_simulator.loop_control.setpoint_mgr import setpoint
 
 from functools import wraps
 import copy
@@ -7,28 +8,122 @@ import copy
 import numpy as np
 
 
-class data_container(np.ndarray):
-    def __new__(subtype, input_type=None, shape = (1,)):
-        obj = super(data_container, subtype).__new__(subtype, shape, object)
+class data_container():
+    def __init__(self, input_type=None, shape = (1,)):
+        '''
+        lazy container of the simulation data of every point of a sweep.
 
-        if input_type is not None:
-            obj[0] = input_type
+        Instead of storing a copy of the data for every sweep point, the operations (e.g. add_cube) that are applied
+        on the data are recorded together with their loop axes. The data of a sweep point is only built when it is requested,
+        by replaying the operations on a copy of the template with the loop variables of that point filled in.
+        The memory used therefore depends on the number of operations and not on the number of sweep points.
 
-        return obj
+        Args:
+            input_type : template of the data of a single sweep point (e.g. mag_sim_data)
+            shape (tuple) : shape of the sweep
+        '''
+        self.template = input_type
+        self.shape = tuple(shape)
+        self.operations = list()
+        # sampling settings of the loop axes that are sampled adaptively (see looping.adaptive_linspace)
+        self.adaptive = dict()
 
     def __copy__(self):
-        cpy = data_container(shape = self.shape)
-
-        for i in range(self.size):
-            cpy.flat[i] = copy.copy(self.flat[i])
+        cpy = data_container(self.template, self.shape)
+        cpy.operations = copy.copy(self.operations)
+        cpy.adaptive = copy.copy(self.adaptive)
 
         return cpy
 
-    def move(self, displacement):
-        for i in range(self.size):
-            self.flat[i].move(displacement)
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def add_operation(self, func, args, args_info, kwargs, kwargs_info):
+        '''
+        record an operation that is applied on the data of every sweep point.
+        Args:
+            func : function to execute (gets the data of a sweep point in args[0].data_tmp and returns the updated data)
+            args : arguments that are provided
+            args_info : loop info of the arguments that are loop objects (see _get_loop_info)
+            kwargs : kwargs provided
+            kwargs_info : same as args_info for the kwargs
+        '''
+        self.operations.append((func, args, args_info, kwargs, kwargs_info))
+
+    def __getitem__(self, key):
+        '''
+        data of a sweep point, key can be a flat index or a tuple with an index for every dimension.
+        '''
+        if isinstance(key, tuple):
+            return self._build(key)
+        return self._build(np.unravel_index(key, self.shape))
+
+    @property
+    def flat(self):
+        return _flat_view(self)
+
+    def flatten(self):
+        '''
+        iterator over the data of all the sweep points, the points are built one at a time.
+        '''
+        return iter(self.flat)
+
+    @profiled('data_container.build')
+    def _build(self, index):
+        index = tuple(int(i) for i in index)
+        data = copy.copy(self.template)
+
+        for func, args, args_info, kwargs, kwargs_info in self.operations:
+            args_cpy = list(args)
+            kwargs_cpy = dict(kwargs)
+            for arg in args_info:
+                args_cpy[arg['nth_arg']] = _loop_value(arg, index)
+            for kwarg in kwargs_info:
+                kwargs_cpy[kwarg['nth_arg']] = _loop_value(kwarg, index)
+
+            args_cpy[0].data_tmp = data
+            data = func(*args_cpy, **kwargs_cpy)
+
+        return data
+
+class _flat_view():
+    '''
+    flat (1D) access to the sweep points of a data_container, similar to np.ndarray.flat.
+    '''
+    def __init__(self, container):
+        self.container = container
+
+    def __len__(self):
+        return self.container.size
 
-        return self
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError('index {} out of range for a sweep of size {}'.format(i, len(self)))
+        return self.container[i]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.container[i]
+
+def _loop_value(info, index):
+    '''
+    value of a loop variable at a sweep point.
+    Args:
+        info (dict) : loop info (see _get_loop_info), the axes count from the last dimension of the data.
+        index (tuple) : index of the sweep point.
+    '''
+    idx = tuple(index[len(index)-1-axis] for axis in info['axis'])
+    return info['data'][idx]
 
 def loop_ctrl(func):
     @wraps(func)
@@ -45,25 +140,22 @@ def loop_ctrl(func):
             if isinstance(kwargs[key], loop_obj):
                 loop_info_kwargs.append(_get_loop_info(kwargs[key], key))
 
-        for lp in loop_info_args:
+        for lp in loop_info_args + loop_info_kwargs:
             for i in range(len(lp['axis'])-1,-1,-1):
                 new_dim, axis = get_new_dim_loop(obj.data.shape, lp['axis'][i], lp['shape'][i])
                 lp['axis'][i] = axis
-                obj.data = update_dimension(obj.data, new_dim)
+                obj.data.shape = tuple(new_dim)
+                if lp['adaptive'] is not None:
+                    obj.data.adaptive[axis] = lp['adaptive']
 
                 if lp['setpnt'] is not None:
                     lp['setpnt'][i].axis = axis
                     obj._setpoints += lp['setpnt'][i]
 
-        # todo update : (not used atm, but just to be generaric.)
-        for lp in loop_info_kwargs:
-            new_dim = get_new_dim_loop(obj.data.shape, lp)
-            obj.data = update_dimension(obj.data, new_dim)
-
-        loop_over_data(func, obj.data, args, loop_info_args, kwargs, loop_info_kwargs)
+        obj.data.add_operation(func, args, loop_info_args, kwargs, loop_info_kwargs)
 
 
-    return wrapper 
+    return wrapper
 
 def get_new_dim_loop(current_dim, axis, shape):
     '''
@@ -108,67 +200,6 @@ def get_new_dim_loop(current_dim, axis, shape):
 
     return new_dim, axis
 
-def update_dimension(data, new_dimension_info, use_ref = False):
-    '''
-    update dimension of the data object to the one specified in new dimension_info
-    Args:
-        data (np.ndarray[dtype = object]) : numpy object that contains all the segment data of every iteration.
-        new_dimension_info (list/np.ndarray) : list of the new dimensions of the array
-        use_ref (bool) : use pointer to copy, or take full copy (False is full copy)
-    Returns:
-        data (np.ndarray[dtype = object]) : same as input data, but with new_dimension_info.
-    '''
-
-    new_dimension_info = np.array(new_dimension_info)
-
-    for i in range(len(new_dimension_info)):
-        if data.ndim < i+1:
-            data = _add_dimensions(data, new_dimension_info[-i-1:], use_ref)
-
-        elif list(data.shape)[-i -1] != new_dimension_info[-i -1]:
-            shape = list(data.shape)
-            shape[-i-1] = new_dimension_info[-i-1]
-            data = _extend_dimensions(data, shape, use_ref)
-
-    return data
-
-def loop_over_data(func, data, args, args_info, kwargs, kwargs_info):
-    '''
-    recursive function to apply the
-    Args:
-        func : function to execute
-        data : data of the segment
-        args: arugments that are provided
-        args_info : argument info is provided (e.g. axis updates)
-        kwargs : kwargs provided
-        kwarfs_info : same as args_info
-        loop_dimension
-    Returns:
-        None
-    '''
-    shape = list(data.shape)
-    n_dim = len(shape)
-
-    # copy the input --> we will fill in the arrays
-    args_cpy = list(copy.copy(args))
-    kwargs_cpy = copy.copy(kwargs)
-
-    for i in range(shape[0]):
-        for arg in args_info:
-            if n_dim-1 in arg['axis']:
-                args_cpy[arg['nth_arg']] = args[arg['nth_arg']][i]
-        for kwarg in kwargs_info:
-            if n_dim-1 in kwarg['axis']:
-                kwargs_cpy[kwargs_info['nth_arg']] = kwargs[kwargs_info['nth_arg']][i]
-
-        if n_dim == 1:
-            # we are at the lowest level of the loop.
-            args_cpy[0].data_tmp = data[i]
-            data[i] = func(*args_cpy, **kwargs_cpy)
-        else:
-            # clean up args, kwargs
-            loop_over_data(func, data[i], args_cpy, args_info, kwargs_cpy, kwargs_info)
-
 def _get_loop_info(lp, index):
     if lp.no_setpoints or lp.setvals is None:
         setpnt = None
@@ -185,91 +216,7 @@ def _get_loop_info(lp, index):
     'len': len(lp),
     'axis': lp.axis,
     'data' : lp.data,
-    'setpnt' : setpnt
+    'setpnt' : setpnt,
+    'adaptive' : lp.adaptive
     }
     return info
-
-def _extend_dimensions(data, shape, use_ref):
-    '''
-    Extends the dimensions of a existing array object. This is useful if one would have first defined sweep axis 2 without defining axis 1.
-    In this case axis 1 is implicitly made, only harbouring 1 element.
-    This function can be used to change the axis 1 to a different size.
-    Args:
-        data (np.ndarray[dtype = object]) : numpy object that contains all the segment data of every iteration.
-        shape (list/np.ndarray) : list of the new dimensions of the array (should have the same lenght as the dimension of the data!)
-        use_ref (bool) : use pointer to copy, or take full copy (False is full copy)
-    '''
-    new_data = data_container(shape = shape)
-
-    for i in range(len(shape)):
-        if data.shape[i] != shape[i]:
-            if i == 0:
-                for j in range(len(new_data)):
-                    new_data[j] = cpy_numpy_shallow(data, use_ref)
-            else:
-                new_data = new_data.swapaxes(i, 0)
-                data = data.swapaxes(i, 0)
-
-                for j in range(len(new_data)):
-                    new_data[j] = cpy_numpy_shallow(data, use_ref)
-
-                new_data = new_data.swapaxes(i, 0)
-
-    return new_data
-
-def _add_dimensions(data, shape, use_ref):
-    """
-    Function that can be used to add and extra dimension of an array object. A seperate function is needed since we want to make a copy and not a reference.
-    Note that only one dimension can be extended!
-    Args:
-        data (np.ndarray[dtype = object]) : numpy object that contains all the segment data of every iteration.
-        shape (list/np.ndarray) : list of the new dimensions of the array
-        use_ref (bool) : use pointer to copy, or take full copy (False is full copy)
-    """
-    new_data =  data_container(shape = shape)
-    for i in range(shape[0]):
-        new_data[i] = cpy_numpy_shallow(data, use_ref)
-    return new_data
-
-def cpy_numpy_shallow(data, use_ref):
-    '''
-    Makes a shallow copy of an numpy object array.
-    Args:
-        data : data element
-        use_ref (bool) : use reference to copy
-    '''
-
-    if use_ref == True:
-        if type(data) != data_container:
-            return data
-
-        if data.shape == (1,):
-            return data[0]
-
-        shape = data.shape
-        data_flat = data.flatten()
-        new_arr = np.empty(data_flat.shape, dtype=object)
-
-        for i in range(len(new_arr)):
-            new_arr[i] = data_flat[i]
-
-        new_arr = new_arr.reshape(shape)
-
-    else:
-        if type(data) != data_container:
-            return copy(data)
-
-        if data.shape == (1,):
-            return data[0].__copy__()
-
-        shape = data.shape
-        data_flat = data.flatten()
-        new_arr = np.empty(data_flat.shape, dtype=object)
-
-        for i in range(len(new_arr)):
-            new_arr[i] = copy.copy(data_flat[i])
-
-        new_arr = new_arr.reshape(shape)
-
-    
-    return new_arr
@@ -16,6 +16,8 @@ class loop_obj():
         self.dtype = None
         self.setvals = None
         self.setvals_set = False
+        # settings of the adaptive sampling of the loop axis (None : all the points are evaluated)
+        self.adaptive = None
 
     def add_data(self, data, axis = None, labels = None, units = None, setvals = None):
         '''
@@ -172,6 +174,7 @@ class loop_obj():
         cpy.units = copy.copy(self.units)
         cpy.axis = copy.copy(self.axis)
         cpy.dtype = copy.copy(self.dtype)
+        cpy.adaptive = copy.copy(self.adaptive)
 
         if hasattr(self, 'data'):
             cpy.data= copy.copy(self.data)
@@ -198,3 +201,18 @@ class geomspace(loop_obj):
     def __init__(self, start, stop, n_steps = 50, name = None, unit = None, axis = -1, setvals = None):
         super().__init__()
         super().add_data(np.geomspace(start, stop, n_steps), axis = axis, labels = name, units = unit, setvals= setvals)
+
+class adaptive_linspace(loop_obj):
+    """
+    linspace of which only part of the points are evaluated, they are chosen based on the fields that were calculated so far.
+
+    The sweep is first evaluated on a coarse grid of n_cells intervals (along every adaptive axis). Intervals (cells in 2D) are halved
+    where the field at the qubits (and the derivatives, when asked for) can not be interpolated within the tolerance, relative
+    to the largest value on the coarse grid. The refinement stops at the spacing of the linspace, the fields at the points
+    that were not evaluated are interpolated.
+    For the finest refinement level to fall on the points of the linspace, n_steps should be n_cells*2**m + 1, e.g. 129 for n_cells=8.
+    """
+    def __init__(self, start, stop, n_steps = 129, name = None, unit = None, axis = -1, tolerance = 1e-3, n_cells = 8, setvals = None):
+        super().__init__()
+        super().add_data(np.linspace(start, stop, n_steps), axis = axis, labels = name, units = unit, setvals= setvals)
+        self.adaptive = {'tolerance' : tolerance, 'n_cells' : n_cells}
@@ -3,20 +3,25 @@ import magpylib as magpy
 import numpy as np
 import copy
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from collections import Counter
 
+from micromagnet_simulator.engine.profiling import profiled
+from micromagnet_simulator.engine.sources import box_sources
+from micromagnet_simulator.gds_import import load_gds
 from micromagnet_simulator.loop_control.data_container import data_container, loop_ctrl
 from micromagnet_simulator.loop_control.setpoint_mgr import setpoint_mgr
 from micromagnet_simulator.magnet_viewer import qubit_view, plot_view
+from micromagnet_simulator.sweep_runner import sweep_runner
 
 
 @dataclass
 class mag_sim_data:
-	u_mag_positions= list()
-	magnetisation = tuple()
-	ext_field = tuple()
-	dot_positions= list()
+	u_mag_positions : list = field(default_factory=list)
+	magnetisation : tuple = tuple()
+	ext_field : tuple = tuple()
+	dot_positions : list = field(default_factory=list)
+	fixed_magnets : list = field(default_factory=list)
 	magnet_collection : any = None
 
 	def __copy__(self):
@@ -25,23 +30,45 @@ class mag_sim_data:
 		m.magnetisation = copy.copy(self.magnetisation) 
 		m.ext_field = copy.copy(self.ext_field)
 		m.dot_positions = copy.copy(self.dot_positions)
+		m.fixed_magnets = copy.copy(self.fixed_magnets)
 
 		return m
 
+	@property
+	def magnets(self):
+		'''
+		all magnets of this data point, the magnets in u_mag_positions get the current magnetisation,
+		the fixed magnets (see umag_creator.setCollection) keep their own magnetisation.
+		'''
+		for magnet in self.u_mag_positions:
+			if len(self.magnetisation) != 0:
+				magnet.set_magnetisation(self.magnetisation)
+
+		return self.fixed_magnets + self.u_mag_positions
+
+	def fix_magnets(self):
+		'''
+		freeze the magnetisation of the current magnets, and clear u_mag_positions.
+		'''
+		self.fixed_magnets = self.magnets
+		self.u_mag_positions = list()
+
+	@profiled('umag_creator.make_collection')
 	def make_collection(self):
-		if (self.magnet_collection == None):
-			self.magnet_collection = magnet_collection() # Make new collection
-		else:
-			pass #Do nothing and just amend the existing collection
+		self.magnet_collection = magnet_collection()
 
-		
-		for magnet in self.u_mag_positions:
-			magnet.set_magnetisation(self.magnetisation)
+		for magnet in self.magnets:
 			self.magnet_collection += magnet
 		self.magnet_collection.set_positions(self.dot_positions)
 
-	def move(self, displacement):
-		self.magnet_collection.move(displacement)
+		return self.magnet_collection
+
+	@property
+	def sources(self):
+		'''
+		the magnets of this data point packed as arrays (see engine.box_sources), without making a magnet collection.
+		'''
+		return box_sources.from_magnets(self.magnets)
 
 @dataclass
 class magnet():
@@ -52,6 +79,7 @@ class magnet():
 	delta_y : float
 	delta_z : float
 	magnetisation : tuple = (1000,0,0)
+	is_prism = False
 
 	def set_magnetisation(self, magnetisation):
 		self.magnetisation = magnetisation
@@ -67,22 +95,86 @@ class magnet():
 		        (self.y-self.delta_y/2, self.y+self.delta_y/2),
 		        (self.z-self.delta_z/2, self.z+self.delta_z/2)]
 
+	def outline(self, axes):
+		'''
+		corners of the projection of the magnet on the plane of two axes (e.g. (0,2) for xz) (unit in nm).
+		'''
+		(x_min, x_max), (y_min, y_max) = [self.shade[i] for i in axes]
+		return np.array([(x_min, y_min), (x_max, y_min), (x_max, y_max), (x_min, y_max)])*1e6
+
+@dataclass
+class prism():
+	'''
+	polygon extruded along one of the axes (unit in mm).
+
+	vertices are the corners of the polygon as coordinates along the two axes other than the extrusion axis (in increasing order of the axes),
+	level is the center and height the size of the prism along the extrusion axis.
+	'''
+	vertices : tuple
+	axis : int
+	level : float
+	height : float
+	magnetisation : tuple = (1000,0,0)
+	is_prism = True
+
+	def set_magnetisation(self, magnetisation):
+		self.magnetisation = magnetisation
+
+	@property
+	def shade(self):
+		others = [i for i in range(3) if i != self.axis]
+		vertices = np.asarray(self.vertices)
+
+		shade = [None]*3
+		shade[self.axis] = (self.level-self.height/2, self.level+self.height/2)
+		shade[others[0]] = (vertices[:,0].min(), vertices[:,0].max())
+		shade[others[1]] = (vertices[:,1].min(), vertices[:,1].max())
+		return shade
+
+	def outline(self, axes):
+		'''
+		corners of the projection of the prism on the plane of two axes (e.g. (0,2) for xz) (unit in nm).
+		'''
+		if self.axis in axes:
+			(x_min, x_max), (y_min, y_max) = [self.shade[i] for i in axes]
+			return np.array([(x_min, y_min), (x_max, y_min), (x_max, y_max), (x_min, y_max)])*1e6
+
+		vertices = np.asarray(self.vertices)*1e6
+		return vertices if axes[0] < axes[1] else vertices[:,::-1]
+
 class magnet_collection():
 	def __init__(self):
 		self.coll = magpy.Collection()
 		self.magnets = list()
 		self.qubit_positions = list()
+		self.displacement = np.zeros(3)
+		self._sources = None
 
 	def __add__(self, magnet, electron =[]):
-		self.coll.addSources(magnet.return_magnet())
+		# magpylib has no prisms, the backends add their field separately (see engine.backends).
+		if not magnet.is_prism:
+			self.coll.addSources(magnet.return_magnet())
 		self.magnets.append(magnet)
+		self._sources = None
 		return self
 
+	@property
+	def sources(self):
+		'''
+		the magnets of the collection packed as arrays (see engine.box_sources).
+		'''
+		if self._sources is None:
+			self._sources = box_sources.from_magnets(self.magnets, self.displacement)
+		return self._sources
+
 	def set_positions(self, pos):
 		self.qubit_positions = np.asarray(pos)
 
 	def move(self, displacement):
 		self.coll.move(displacement)
+		self.displacement += np.asarray(displacement)
+		if self._sources is not None:
+			self._sources.move(displacement)
 
 
 class umag_creator():
@@ -132,6 +224,9 @@ class umag_creator():
 	def add_triangle(self, p1_x, p1_y, p1_z, p2_x, p2_y, p2_z,p3_x, p3_y, p3_z, static_axis, delta, n_magnets=20):
 		'''
 		adds a triangular piece of micromagnet, h_magnet defines the height of that piece
+
+		The triangle is approximated by n_magnets boxes, if n_magnets is None the exact triangle is added as a prism
+		(all backends evaluate prisms in closed form, see engine.prism).
 		'''
 		point_1 = (p1_x, p1_y, p1_z)
 		point_2 = (p2_x, p2_y, p2_z)
@@ -139,6 +234,12 @@ class umag_creator():
 
 		moving_axes = [0,1,2]
 		moving_axes.pop(list('xyz').index(static_axis))
+
+		if n_magnets is None:
+			vertices = tuple((point[moving_axes[0]]*1e-6, point[moving_axes[1]]*1e-6) for point in (point_1, point_2, point_3))
+			axis = list('xyz').index(static_axis)
+			self.data_tmp.u_mag_positions.append(prism(vertices, axis, point_1[axis]*1e-6, delta*1e-6))
+			return self.data_tmp
 		# define in which area the triangle is located
 
 		x_pos = [point_1[moving_axes[0]], point_2[moving_axes[0]], point_3[moving_axes[0]]]
@@ -167,53 +268,105 @@ class umag_creator():
 
 		return self.data_tmp
 
-	def clearAll(self): 
+	@loop_ctrl
+	def add_polygon(self, vertices, static_axis, level, delta):
 		'''
-		Required for looping through different shapes
+		adds a piece of micromagnet with the shape of a polygon, extruded along static_axis (unit in nm).
+
+		Args:
+			vertices (list<tuple>) : corners of the polygon, as coordinates along the two other axes (in the order xyz, e.g. (x,z) if static_axis is 'y')
+			static_axis (str) : axis along which the polygon is extruded ('x', 'y' or 'z')
+			level (float) : center of the piece along static_axis
+			delta (float) : thickness of the piece along static_axis
 		'''
+		vertices = tuple((u*1e-6, v*1e-6) for u, v in vertices)
+		self.data_tmp.u_mag_positions.append(prism(vertices, list('xyz').index(static_axis), level*1e-6, delta*1e-6))
+		return self.data_tmp
+
+	def add_gds(self, filename, layer, z, thickness, datatype=None, cell=None, merge=False, tolerance=0, min_area=0, offset=(0,0)):
+		'''
+		adds the polygons of a layer of a GDS layout as pieces of micromagnet, extruded along z (unit in nm).
 
-		self.data[0].dot_positions.clear()
-		self.data[0].u_mag_positions.clear()
-		self.data[0].magnetisation = tuple()
-		self.data[0].ext_field = tuple()
-		self.data[0].magnet_collection.qubit_positions = list()
-		self.data[0].magnet_collection.qubit_positions.clear()
-		self.data[0].magnet_collection.magnets = list()
-		self.data[0].magnet_collection.magnets.clear()
-		self.data[0].magnet_collection.coll = magpy.Collection()
+		The layout is read once, the z position and the thickness can be swept.
 
-		self.data[0].magnet_collection : any = None
+		Args:
+			filename (str) : GDS file to read
+			layer (int) : layer of the micromagnet
+			z (double) : center of the micromagnet layer along z
+			thickness (double) : thickness of the micromagnet layer
+			datatype (int) : datatype of the polygons (None : all datatypes of the layer)
+			cell (str) : name of the cell to import (None : the top level cell of the file)
+			merge (bool) : merge overlapping and touching polygons (e.g. a magnet drawn as several pieces)
+			tolerance (double) : remove the corners of the polygons that lie within tolerance of the outline without them (0 only removes collinear corners)
+			min_area (double) : drop polygons with a smaller area (unit in nm^2)
+			offset (tuple) : (x,y) position of the origin of the layout
+		'''
+		polygons = load_gds(filename, layer, datatype, cell, merge, tolerance, min_area)
+		self._add_polygons(tuple((polygon + np.asarray(offset))*1e-6 for polygon in polygons), 2, z, thickness)
 
+	@loop_ctrl
+	def _add_polygons(self, polygons, axis, level, delta):
+		for polygon in polygons:
+			self.data_tmp.u_mag_positions.append(prism(polygon, axis, level*1e-6, delta*1e-6))
+		return self.data_tmp
+
+	def clearAll(self): 
+		'''
+		Required for looping through different shapes
+		'''
+		self.data = data_container(mag_sim_data())
+		self._setpoints = setpoint_mgr()
 
 		return None
 
 	def generate_view(self, show_geom = False):
 		if self.data.size == 1:
-			m_coll = magnet_collection()
-
-			for m in self.data[0].u_mag_positions:
-				m.set_magnetisation(self.data[0].magnetisation)
-				m_coll += m
+			data = self.data[0]
+			m_coll = data.make_collection()
 
 			if show_geom == True:
 				fig = plt.figure(figsize=(9,5))
 				ax1 = fig.add_subplot(121, projection='3d')
 				magpy.displaySystem(m_coll.coll, subplotAx=ax1, suppress=True)
 
-			return plot_view(m_coll, view=None)
+			return plot_view(m_coll, view=None, ext_field=data.ext_field)
 		else:
 			raise ValueError('no support for multidimensional views.')
 
 	def setCollection(self): 
 		''' 
 		To create different collections with new magnetizaion (and delete old magnets) 
+
+		The magnets added so far keep the current magnetisation, magnets added afterwards get the magnetisation that is set next.
+		'''
+		self._fix_magnets()
+
+	@loop_ctrl
+	def _fix_magnets(self):
+		self.data_tmp.fix_magnets()
+		return self.data_tmp
+
+	def generate_qubit_prop(self, n_workers=None, chunk_size=None, linear=False):
 		'''
-		for data_item in self.data.flatten():
-			data_item.make_collection()
-		self.data[0].u_mag_positions.clear()
+		generate a view of the properties of the qubits for every point of the sweep.
 
-	def generate_qubit_prop(self):
-		for data_item in self.data.flatten():
-			data_item.make_collection()
+		Args:
+			n_workers (int) : if not None, evaluate the sweep in a pool of n_workers processes (0 : number of cores)
+			chunk_size (int) : number of sweep points that are sent to a worker process at once
+			linear (bool) : evaluate every geometry of the sweep only once, for unit magnetisations along x, y and z,
+				and combine these for the magnetisation of every sweep point (fast for sweeps of the magnetisation)
+		'''
+		return qubit_view(self.data, self._setpoints, n_workers, chunk_size, linear)
 
-		return qubit_view(self.data, self._setpoints)
+	def generate_sweep_runner(self, directory, batch_size=100, gradient=True, n_workers=None, chunk_size=None, linear=False):
+		'''
+		generate a runner that evaluates the sweep in batches, which are stored in a directory, such that an interrupted sweep
+		can be resumed and the results so far can be viewed (see sweep_runner.sweep_runner and sweep_runner.load_sweep).
+
+		Args:
+			directory (str) : directory where the batches are stored
+			batch_size (int) : number of sweep points per batch
+			gradient (bool) : also calculate the derivatives of the field
+			n_workers, chunk_size, linear : see generate_qubit_prop
+		'''
+		return sweep_runner(self.data, self._setpoints, directory, batch_size, gradient, None, n_workers, chunk_size, linear)
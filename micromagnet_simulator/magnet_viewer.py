@@ -5,18 +5,98 @@ import magpylib as magpy
 import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
+from matplotlib.collections import PatchCollection
+from matplotlib.colors import Normalize
 
 matplotlib.rcParams.update({'font.size': 16})
 matplotlib.rcParams.update({"figure.figsize" : [10, 6]})
 
 from dataclasses import dataclass
-from collections import Counter
-
-from micromagnet_simulator.fields import field, field_qubits
+from collections import Counter, OrderedDict
+
+from micromagnet_simulator.fields import field, field_adaptive, field_points, field_views, field_qubits, field_qubits_adaptive
+from micromagnet_simulator.engine.backends import get_backend
+from micromagnet_simulator.engine.profiling import profiled
+from micromagnet_simulator.export import export_field
+
+def _is_regular(axis):
+	'''
+	True if the points of an axis are equally spaced (and increasing).
+	'''
+	if len(axis) < 3:
+		return True
+	steps = np.diff(axis)
+	return steps[0] > 0 and np.allclose(steps, steps[0], rtol=1e-6)
 
 class view():
 	def __init__(self):
 		self._unit = 'T'
+		self._backend = None
+		self._precision = 'float64'
+		self._render = 'fast'
+		self._norms = {}
+		self._norms_key = None
+
+	@property
+	def render(self):
+		return self._render
+
+	@render.setter
+	def render(self, value):
+		'''
+		set how the 2D plots are drawn :
+			'fast' : the data is decimated to the resolution of the axes and drawn as an image (imshow, or a rasterized pcolormesh
+				for irregular setpoints), the colour scale of the data is cached
+			'pcolor' : every point of the data is drawn as a polygon (slow for large images)
+		'''
+		if value not in ('fast', 'pcolor'):
+			raise ValueError("invalid render mode selected, options : 'fast', 'pcolor'")
+		self._render = value
+
+	def _norm(self, name, data):
+		'''
+		colour scale of data, cached per quantity until the fields change (they are recalculated, or the unit or the external field is changed).
+		'''
+		# the field object itself is kept in the key, such that a new field never matches the key of a field that was freed.
+		key = (self.field, self.field.version)
+		if self._norms_key is None or key[0] is not self._norms_key[0] or key[1] != self._norms_key[1]:
+			self._norms, self._norms_key = {}, key
+		if name not in self._norms:
+			finite = data[np.isfinite(data)]
+			self._norms[name] = Normalize(np.min(finite), np.max(finite)) if finite.size else Normalize()
+		return self._norms[name]
+
+	def _draw_map(self, ax, x, y, data, name):
+		'''
+		draw data with shape (len(x), len(y)) as a colour map on ax.
+
+		Args:
+			ax (Axes) : axes to draw on
+			x, y (np.ndarray) : coordinates of the points along the horizontal and vertical axis
+			data (np.ndarray) : values of the points
+			name (str) : name of the quantity, used to cache the colour scale
+
+		Returns:
+			mapping (ScalarMappable) : the image, e.g. for a colorbar
+		'''
+		if self.render == 'pcolor':
+			return ax.pcolor(x, y, data.T)
+
+		x, y, data = np.asarray(x), np.asarray(y), np.asarray(data)
+		norm = self._norm(name, data)
+
+		# more points than pixels are not visible, the data is decimated to the size of the axes (in pixels).
+		bbox = ax.get_window_extent()
+		step_x = max(1, int(len(x)//max(bbox.width, 1)))
+		step_y = max(1, int(len(y)//max(bbox.height, 1)))
+		x, y, data = x[::step_x], y[::step_y], data[::step_x, ::step_y]
+
+		if _is_regular(x) and _is_regular(y):
+			dx = (x[-1] - x[0])/(len(x) - 1) if len(x) > 1 else 1
+			dy = (y[-1] - y[0])/(len(y) - 1) if len(y) > 1 else 1
+			extent = [x[0] - dx/2, x[-1] + dx/2, y[0] - dy/2, y[-1] + dy/2]
+			return ax.imshow(data.T, origin='lower', extent=extent, aspect='auto', interpolation='nearest', norm=norm)
+		return ax.pcolormesh(x, y, data.T, shading='nearest', norm=norm, rasterized=True)
 	
 	@property
 	def unit(self):
@@ -30,14 +110,56 @@ class view():
 		else:
 			raise ValueError("invalid unit selected, options : 'T', 'mT', 'GHz', 'MHz'")
 
+	@property
+	def backend(self):
+		return self._backend
+
+	@backend.setter
+	def backend(self, value):
+		'''
+		set the backend used to calculate the fields (e.g. 'magpylib' or 'numpy'), None uses the default backend.
+		'''
+		get_backend(value)
+		self._backend = value
+		self.field.backend = value
+		self.field._field = None
+		self.field._d_field = None
+
+	@property
+	def precision(self):
+		return self._precision
+
+	@precision.setter
+	def precision(self, value):
+		'''
+		set the floating point precision used to store the fields ('float32' or 'float64').
+		'''
+		self.field.precision = value
+		self._precision = value
+		self.field._field = None
+		self.field._d_field = None
+
+	def export(self, filename, gradient=True):
+		'''
+		write the field (and its derivatives), the axes, the setpoints and the magnets to disk (see export.export_field and export.load_field).
+
+		Args:
+			filename (str) : .h5/.hdf5 file (needs h5py) or a directory of compressed chunks (any other name)
+			gradient (bool) : also export the derivatives of the field
+		'''
+		export_field(self.field, filename, gradient)
+
 	def show(self):
 		plt.show()
 
 class qubit_view(view):
-	def __init__(self, data_items, setpoints):
+	def __init__(self, data_items, setpoints, n_workers=None, chunk_size=None, linear=False):
 		super().__init__()
-		self.field = field_qubits(data_items, setpoints)
+		# sweeps with adaptive loop axes (see loop_control.looping.adaptive_linspace) are sampled adaptively.
+		field_type = field_qubits_adaptive if getattr(data_items, 'adaptive', None) else field_qubits
+		self.field = field_type(data_items, setpoints, self.backend, n_workers, chunk_size, self.precision, linear)
 
+	@profiled('qubit_view.plot_fields')
 	def plot_fields(self, direction):
 		if self.field.ndim == 2:
 			return self.__plot_1D('B{}'.format(direction), self.field.B(direction))
@@ -45,6 +167,7 @@ class qubit_view(view):
 		if self.field.ndim == 3:
 			return self.__plot_2D('B{}'.format(direction), self.field.B(direction))
 
+	@profiled('qubit_view.plot_derivative')
 	def plot_derivative(self, field_direction='x', movement_direction='x'):
 		if self.field.ndim == 2:
 			return self.__plot_1D("dB{}/d{}".format(field_direction, movement_direction, '/nm'),
@@ -77,36 +200,124 @@ class qubit_view(view):
 			ax = axes[i]
 			ax.set_xlabel('{} ({})'.format(self.field.setpoints.labels[0], self.field.setpoints.units[0]))
 			ax.set_ylabel('{} ({})'.format(self.field.setpoints.labels[1], self.field.setpoints.units[1]))
-			c = ax.pcolor(self.field.setpoints.setpoints[0],self.field.setpoints.setpoints[1],raw_data[:,:,i])
+			c = self._draw_map(ax, self.field.setpoints.setpoints[0], self.field.setpoints.setpoints[1], raw_data[:,:,i],
+				'{} qubit {}'.format(y_axis_name, i))
 			cbar = fig.colorbar(c, ax=ax)
 			cbar.ax.set_ylabel('{} ({})'.format(y_axis_name, self.field.unit+ append_unit))
 
 		return fig
 
 class plot_view(view):
-	def __init__(self, collection, view):
+	def __init__(self, collection, view, ext_field=(0,0,0)):
 		'''
 		add collection of magnet pieces to be plotted.
+
+		Args:
+			collection (magnet_collection) : magnets to plot
+			ext_field (tuple) : uniform external field (Bx, By, Bz) (unit in T) that is added to the field of the magnets
 		'''
 		super().__init__()
 		self.collection = collection
+		self.ext_field = ext_field
 		self.views = ((-1000,1000,100),(-1000,1000,80), (-30,-30,1))
-		self.field = field(collection, self.views, self.unit)	
+		self.field = field(collection, self.views, self.unit, self.backend, self.precision, ext_field=self.ext_field)	
+		self.registered_views = OrderedDict()
+		self._field_views = None
+
+	@staticmethod
+	def _slice_views(axis, start, stop, n, level1, level2):
+		views = [(level1,level1,1),(level2,level2,1)]
+		views.insert(list('xyz').index(axis), (start, stop, n))
+		return views
+
+	@staticmethod
+	def _image_views(axis, start_1, stop_1, n_1, start_2, stop_2, n_2, level):
+		views = [(level,level,1)]*3
+		views[list('xyz').index(axis[0])] = (start_1, stop_1, n_1)
+		views[list('xyz').index(axis[1])] = (start_2, stop_2, n_2)
+		return views
 
 	def set_slice(self, axis, start, stop, n, level1, level2):
-		self.views = [(level1,level1,1),(level2,level2,1)]
-		self.views.insert(list('xyz').index(axis), (start, stop, n))
+		self.views = self._slice_views(axis, start, stop, n, level1, level2)
 
-		self.field = field(self.collection, self.views, self.unit)
+		self.field = field(self.collection, self.views, self.unit, self.backend, self.precision, ext_field=self.ext_field)
 
-	def set_image(self,axis, start_1, stop_1, n_1, start_2, stop_2, n_2, level):
-		self.views = [(level,level,1)]*3
-		
-		self.views[list('xyz').index(axis[0])] = (start_1, stop_1, n_1)
-		self.views[list('xyz').index(axis[1])] = (start_2, stop_2, n_2)
+	def set_image(self,axis, start_1, stop_1, n_1, start_2, stop_2, n_2, level, adaptive=None):
+		'''
+		set a 2D image of the field.
+
+		Args:
+			axis (str) : axes of the image (e.g. 'xz')
+			start_1, stop_1, n_1 : range and number of points along the first axis (unit in nm)
+			start_2, stop_2, n_2 : range and number of points along the second axis (unit in nm)
+			level (double) : position along the third axis (unit in nm)
+			adaptive (float) : if not None, the field is sampled adaptively with this (relative) tolerance and interpolated onto the image
+				(see fields.field_adaptive), which needs far fewer evaluations for images with large smooth regions
+		'''
+		self.views = self._image_views(axis, start_1, stop_1, n_1, start_2, stop_2, n_2, level)
+
+		if adaptive is None:
+			self.field = field(self.collection, self.views, self.unit, self.backend, self.precision, ext_field=self.ext_field)
+		else:
+			self.field = field_adaptive(self.collection, self.views, adaptive, self.unit, self.backend, self.precision, ext_field=self.ext_field)
+
+	def add_slice(self, name, axis, start, stop, n, level1, level2):
+		'''
+		register a 1D slice (see set_slice) that is evaluated together with the other registered views (see evaluate_views).
+		'''
+		self.registered_views[name] = self._slice_views(axis, start, stop, n, level1, level2)
+		self._field_views = None
+
+	def add_image(self, name, axis, start_1, stop_1, n_1, start_2, stop_2, n_2, level):
+		'''
+		register a 2D image (see set_image) that is evaluated together with the other registered views (see evaluate_views).
+		'''
+		self.registered_views[name] = self._image_views(axis, start_1, stop_1, n_1, start_2, stop_2, n_2, level)
+		self._field_views = None
+
+	def add_points(self, name, points):
+		'''
+		register a list of points (shape (n_points, 3), unit in nm) that is evaluated together with the other registered views (see evaluate_views).
+		'''
+		self.registered_views[name] = np.asarray(points, dtype=float).reshape(-1,3)
+		self._field_views = None
+
+	def evaluate_views(self, gradient=False):
+		'''
+		evaluate all the registered views in a single pass over all their points (see fields.field_views).
+
+		Args:
+			gradient (bool) : also calculate the derivatives of the fields
+		Returns:
+			fields (dict) : the fields of the views by name (slices of a single buffer)
+		'''
+		views = self._field_views
+		if views is None or views.backend != self.backend or views.precision != self.precision:
+			fields = OrderedDict()
+			for name, points in self.registered_views.items():
+				if isinstance(points, np.ndarray):
+					fields[name] = field_points(self.collection, points, self.unit, self.backend, self.precision, ext_field=self.ext_field)
+				else:
+					fields[name] = field(self.collection, points, self.unit, self.backend, self.precision, ext_field=self.ext_field)
+			views = self._field_views = field_views(fields)
+
+		# every view scales its own slice of the buffer to the unit of the plot_view.
+		fields = views.evaluate_views(gradient)
+		for view_field in fields.values():
+			view_field.unit = self.unit
+		return fields
+
+	def select_view(self, name):
+		'''
+		plot a registered view with the plot methods, the fields of all the registered views are evaluated if needed.
+		'''
+		if name not in self.registered_views:
+			raise ValueError('view {} is not registered, options : {}'.format(name, ', '.join(self.registered_views)))
 
-		self.field = field(self.collection, self.views, self.unit)
+		self.field = self.evaluate_views()[name]
+		self.views = self.registered_views[name]
 
+	@profiled('plot_view.plot_fields')
 	def plot_fields(self, direction='xyz', unit='T', plot_type='norm'):
 
 		if self.field.dim == 1:
@@ -118,6 +329,7 @@ class plot_view(view):
 		if plot_type == 'norm' and self.field.dim == 2:
 			return self.__plot_2D_norm('B' + direction, self.field.B(direction))
 
+	@profiled('plot_view.plot_derivative')
 	def plot_derivative(self, field_direction='x', movement_direction='x'):
 		if self.field.dim == 1:
 			return self.__plot_1D("dB{}/d{}".format(field_direction, movement_direction, '/nm'),
@@ -157,13 +369,13 @@ class plot_view(view):
 		plt.ylim(self.views[idx[1]][0], self.views[idx[1]][1])
 		
 		xyz = [self.field.x,self.field.y,self.field.z]
-		X,Y = np.meshgrid(xyz[idx[0]],xyz[idx[1]])
-		U = getattr(self.field, 'B{}'.format('xyz'[idx[0]])).T
-		V = getattr(self.field, 'B{}'.format('xyz'[idx[1]])).T
-
-		b_amp = self.field.Btot.T
+		c = self._draw_map(ax, xyz[idx[0]], xyz[idx[1]], self.field.Btot, 'Btot')
 
-		c = ax.pcolor(xyz[idx[0]],xyz[idx[1]],b_amp)
+		# the stream lines are interpolated on the grid, a grid much finer than the lines only adds to the cost.
+		step = 1 if self.render == 'pcolor' else max(1, max(len(xyz[idx[0]]), len(xyz[idx[1]]))//64)
+		X,Y = np.meshgrid(xyz[idx[0]][::step],xyz[idx[1]][::step])
+		U = getattr(self.field, 'B{}'.format('xyz'[idx[0]]))[::step,::step].T
+		V = getattr(self.field, 'B{}'.format('xyz'[idx[1]]))[::step,::step].T
 		ax.streamplot(X, Y, U, V, color=np.log(U**2+V**2))
 		k = fig.colorbar(c, ax=ax)
 		k.ax.set_ylabel('B{}{} ({})'.format('xyz'[idx[0]], 'xyz'[idx[1]], self.field.unit+ append_unit))
@@ -188,10 +400,8 @@ class plot_view(view):
 		
 		
 
-		# im = plt.imshow(raw_data.T[::-1,:], extent=[self.views[idx[0]][0], self.views[idx[0]][1], self.views[idx[1]][0], self.views[idx[1]][1]])
-		# cbar = plt.colorbar(im, ax=ax)
 		xyz = [self.field.x,self.field.y,self.field.z]
-		c = ax.pcolor(xyz[idx[0]],xyz[idx[1]],raw_data.T)
+		c = self._draw_map(ax, xyz[idx[0]], xyz[idx[1]], raw_data, y_axis_name)
 		cbar = fig.colorbar(c, ax=ax)
 		cbar.ax.set_ylabel('{} ({})'.format(y_axis_name, self.field.unit+ append_unit))
 
@@ -201,12 +411,7 @@ class plot_view(view):
 		return fig
 
 	def __add_micromagnet_overlay(self, ax, idx):
-		for magnet in self.collection.magnets:
-			x_min = magnet.shade[idx[0]][0]*1e6
-			y_min = magnet.shade[idx[1]][0]*1e6
-			x_max = magnet.shade[idx[0]][1]*1e6
-			y_max = magnet.shade[idx[1]][1]*1e6
-
-			patch = patches.Rectangle((x_min,y_min),x_max-x_min,y_max-y_min, linewidth=1, facecolor='none', edgecolor='w')
-			ax.add_patch(patch)
+		# a single collection of all the outlines is drawn much faster than a patch per magnet.
+		outlines = [patches.Polygon(magnet.outline(idx), closed=True) for magnet in self.collection.magnets]
+		ax.add_collection(PatchCollection(outlines, linewidths=1, facecolors='none', edgecolors='w'), autolim=False)
 
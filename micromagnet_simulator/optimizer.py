@@ -0,0 +1,190 @@
+'''
+Optimization of parametrised micromagnet designs.
+
+A design is a function that returns an umag_creator for given (scalar) parameters, e.g. example_MM_design of the docs.
+The objective and the constraints are functions of the fields at the qubit positions (a field_qubits with one sweep
+point per design) that return a value per design. The derivatives to the parameters are calculated by finite differences,
+all the designs that are needed for the value and the derivatives are evaluated together as one (batched) sweep.
+
+	opt = design_optimizer(example_MM_design, {'w_slant' : (50, 20, 80), 'h_slant' : (200, 100, 300)},
+		objective=driving_gradient('yz', 'x'), maximize=True,
+		constraints=[(decoherence_gradient('x', 'xy'), None, 0.05), (frequency_spread('xyz'), None, 10)])
+	result = opt.optimize()
+	print(result.parameters, opt.n_designs)
+'''
+import numpy as np
+import scipy.optimize
+
+from micromagnet_simulator.fields import field_qubits
+from micromagnet_simulator.loop_control.setpoint_mgr import setpoint_mgr, setpoint
+
+def driving_gradient(field_direction='yz', movement_direction='x', reduction=np.mean):
+	'''
+	objective : driving gradient at the qubit positions (see field_generic.dB).
+
+	Args:
+		field_direction (str) : field components perpendicular to the quantization axis
+		movement_direction (str) : direction in which the qubits are moved for driving
+		reduction (function) : reduction over the qubits (e.g. np.mean, np.min)
+	'''
+	def objective(fields):
+		return reduction(fields.dB(field_direction, movement_direction), axis=-1)
+	return objective
+
+def decoherence_gradient(field_direction='x', movement_direction='xy', reduction=np.max):
+	'''
+	objective : decoherence gradient at the qubit positions, by default the largest of all the qubits (see driving_gradient).
+	'''
+	def objective(fields):
+		return reduction(fields.dB(field_direction, movement_direction), axis=-1)
+	return objective
+
+def frequency_spread(direction='xyz'):
+	'''
+	objective : difference between the largest and the smallest field of the qubits (in the unit of the optimizer).
+
+	Args:
+		direction (str) : field components of which the magnitude is taken
+	'''
+	def objective(fields):
+		return np.ptp(fields.B(direction), axis=-1)
+	return objective
+
+class design_optimizer():
+	def __init__(self, design, parameters, objective, constraints=None, maximize=False, unit='mT', backend=None, step=1e-3):
+		'''
+		optimizer of the parameters of a micromagnet design.
+
+		Args:
+			design (function) : function that makes an umag_creator for the parameters, given as keyword arguments
+			parameters (dict) : (initial value, lower bound, upper bound) per parameter name (e.g. in nm)
+			objective (function) : function of a field_qubits that returns a value per design (see driving_gradient)
+			constraints (list) : (function, lower bound, upper bound) tuples, the function works like the objective, a bound can be None (None : no constraints)
+			maximize (bool) : maximize the objective instead of minimizing it
+			unit (str) : unit of the fields that are given to the objective and the constraints ('T', 'mT', 'MHz', 'GHz')
+			backend (str) : backend used to calculate the fields (None is the default backend)
+			step (float) : step of the finite differences, relative to the range of a parameter
+		'''
+		self.design = design
+		self.names = list(parameters)
+		self.x0 = np.array([parameters[name][0] for name in self.names], dtype=float)
+		self.lower = np.array([parameters[name][1] for name in self.names], dtype=float)
+		self.upper = np.array([parameters[name][2] for name in self.names], dtype=float)
+		if np.any(self.upper <= self.lower) or np.any(self.x0 < self.lower) or np.any(self.x0 > self.upper):
+			raise ValueError('the initial value of every parameter should be between its lower and upper bound (lower < upper).')
+
+		self.objective = objective
+		self.constraints = [] if constraints is None else list(constraints)
+		for function, lower, upper in self.constraints:
+			if lower is None and upper is None:
+				raise ValueError('a constraint needs a lower or an upper bound.')
+
+		self.maximize = maximize
+		self.unit = unit
+		self.backend = backend
+		self.step = step
+
+		self.n_designs = 0
+		self.history = []
+		self._cache = {}
+		self._scale = None
+
+	def parameters(self, x):
+		'''
+		parameters of the design (dict) for normalized parameters x (0 : lower bound, 1 : upper bound).
+		'''
+		return dict(zip(self.names, self.lower + np.asarray(x)*(self.upper - self.lower)))
+
+	def evaluate(self, parameter_sets):
+		'''
+		evaluate the objective and the constraints for a list of designs in one sweep.
+
+		Args:
+			parameter_sets (list<dict>) : the parameters of every design
+
+		Returns:
+			values (np.ndarray) : objective (first column) and constraints of every design, shape (n_designs, 1+n_constraints)
+		'''
+		data = np.empty(len(parameter_sets), dtype=object)
+		for i, params in enumerate(parameter_sets):
+			umag = self.design(**params)
+			if umag.data.size != 1:
+				raise ValueError('the design should not contain loop objects, the optimizer makes the sweep.')
+			data[i] = umag.data[0]
+
+		setpoints = setpoint_mgr() + setpoint(0, ('design',), ('#',), (np.arange(len(data)),))
+		fields = field_qubits(data, setpoints, self.backend)
+		fields.unit = self.unit
+
+		values = [self.objective(fields)] + [function(fields) for function, lower, upper in self.constraints]
+		self.n_designs += len(data)
+
+		return np.stack([np.reshape(v, (len(data),)) for v in values], axis=1)
+
+	def _evaluate(self, x):
+		# value and finite difference derivatives (central differences, one sided at the bounds) of the normalized problem.
+		key = np.asarray(x, dtype=float).tobytes()
+		if key in self._cache:
+			return self._cache[key]
+
+		x = np.clip(np.asarray(x, dtype=float), 0, 1)
+		points = [x]
+		for i in range(len(x)):
+			for sign in (1, -1):
+				point = x.copy()
+				point[i] = np.clip(x[i] + sign*self.step, 0, 1)
+				points.append(point)
+
+		values = self.evaluate([self.parameters(p) for p in points])
+		steps = np.array(points[1::2]) - np.array(points[2::2])
+		jacobian = (values[1::2] - values[2::2])/np.diag(steps)[:, np.newaxis]
+
+		self.history.append((self.parameters(x), values[0]))
+		self._cache[key] = (values[0], jacobian.T)
+		return self._cache[key]
+
+	def _objective(self, x):
+		value, jacobian = self._evaluate(x)
+		sign = -1 if self.maximize else 1
+		return sign*value[0]/self._scale[0], sign*jacobian[0]/self._scale[0]
+
+	def _constraints(self):
+		constraints = []
+		for i, (function, lower, upper) in enumerate(self.constraints, 1):
+			for bound, sign in ((lower, 1), (upper, -1)):
+				if bound is None:
+					continue
+				# scipy convention for inequalities : fun(x) >= 0
+				constraints.append({'type' : 'ineq',
+					'fun' : lambda x, i=i, b=bound, s=sign : s*(self._evaluate(x)[0][i] - b)/self._scale[i],
+					'jac' : lambda x, i=i, s=sign : s*self._evaluate(x)[1][i]/self._scale[i]})
+		return constraints
+
+	def optimize(self, method='SLSQP', **options):
+		'''
+		optimize the parameters, starting from the initial values.
+
+		Args:
+			method (str) : scipy.optimize.minimize method that supports bounds (and constraints if any, e.g. 'SLSQP', 'trust-constr')
+			**options : options for the method (e.g. maxiter, ftol)
+
+		Returns:
+			result (scipy.optimize.OptimizeResult) : result of scipy, with the parameters of the optimum in result.parameters,
+				the value of the objective in result.objective and the number of evaluated designs in result.n_designs
+		'''
+		x0 = (self.x0 - self.lower)/(self.upper - self.lower)
+
+		# the objective and the constraints are scaled to order 1 at the initial design.
+		value = self._evaluate(x0)[0]
+		self._scale = np.abs(value)
+		for i, (function, lower, upper) in enumerate(self.constraints, 1):
+			self._scale[i] = max(abs(b) for b in (lower, upper, value[i]) if b is not None)
+		self._scale[self._scale == 0] = 1
+
+		result = scipy.optimize.minimize(self._objective, x0, jac=True, method=method, bounds=[(0, 1)]*len(x0),
+			constraints=self._constraints(), options=options)
+
+		result.parameters = self.parameters(np.clip(result.x, 0, 1))
+		result.objective = self._evaluate(result.x)[0][0]
+		result.n_designs = self.n_designs
+		return result
@@ -0,0 +1,201 @@
+'''
+Resumable evaluation of long sweeps.
+
+The points of a sweep are evaluated in batches. Every finished batch is written as a shard (npz file) to a directory,
+next to the setpoints of the sweep. When a run is interrupted (e.g. the kernel dies), a runner on the same directory
+continues after the batches that were completed. The results so far can be viewed at any time, also from another process
+while the run continues, points that are not evaluated yet are NaN.
+
+	runner = umag.generate_sweep_runner('~/sweeps/slanting_magnet', batch_size=200)
+	runner.run()
+
+	view = load_sweep('~/sweeps/slanting_magnet')
+	view.plot_fields('xyz')
+'''
+import json
+import os
+
+import numpy as np
+
+from micromagnet_simulator.engine.backends import get_backend_key, get_backend_name
+from micromagnet_simulator.engine.cache import field_cache
+from micromagnet_simulator.engine.profiling import stage
+from micromagnet_simulator.engine.sweep import packed_sweep
+from micromagnet_simulator.fields import field_qubits
+from micromagnet_simulator.loop_control.setpoint_mgr import setpoint_mgr, setpoint
+from micromagnet_simulator.magnet_viewer import qubit_view
+
+_metadata_file = 'sweep.json'
+_setpoints_file = 'setpoints.npz'
+
+def _shard_file(batch):
+	return 'batch_{:06d}.npz'.format(batch)
+
+def _write(path, write):
+	# write to a temporary file first, such that a shard is never read (or resumed from) while it is partially written.
+	tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+	with open(tmp_path, 'wb' if path.endswith('.npz') else 'w') as f:
+		write(f)
+	os.replace(tmp_path, path)
+
+class sweep_runner():
+	def __init__(self, data_items, setpoints, directory, batch_size=100, gradient=True, backend=None, n_workers=None, chunk_size=None, linear=False):
+		'''
+		evaluate a sweep in batches that are stored in a directory (see load_sweep to view the results).
+
+		Args:
+			data_items (data_container) : the simulation data of every sweep point
+			setpoints (setpoint_mgr) : setpoints of the sweep
+			directory (str) : directory of the shards, made if it does not exist
+			batch_size (int) : number of sweep points per batch
+			gradient (bool) : also calculate the derivatives of the field
+			backend, n_workers, chunk_size, linear : see field_qubits
+		'''
+		self.data_items = data_items
+		self.setpoints = setpoints
+		self.directory = os.path.expanduser(directory)
+		self.batch_size = batch_size
+		self.gradient = gradient
+		self.field = field_qubits(data_items, setpoints, backend, n_workers, chunk_size, linear=linear)
+
+		self.n_points = data_items.size
+		self.n_batches = -(-self.n_points//batch_size)
+
+		os.makedirs(self.directory, exist_ok=True)
+		metadata = self._metadata()
+		path = os.path.join(self.directory, _metadata_file)
+		if os.path.exists(path):
+			with open(path) as f:
+				if json.load(f)['key'] != metadata['key']:
+					raise ValueError('the directory {} contains the results of another sweep (or of other settings of the runner).'.format(directory))
+			# the points of the completed batches are checked batch by batch, the sweep is never packed as a whole.
+			for batch in self.completed():
+				index, sweep = self._batch(batch)
+				with np.load(os.path.join(self.directory, _shard_file(batch))) as shard:
+					if str(shard['key']) != self._batch_key(sweep):
+						raise ValueError('the directory {} contains the results of another sweep (batch {} differs).'.format(directory, batch))
+		else:
+			axes = sorted(setpoints._setpoints.keys())
+			_write(os.path.join(self.directory, _setpoints_file),
+				lambda f : np.savez(f, **{'axis_{}'.format(axis) : values for axis, values in zip(axes, setpoints.setpoints)}))
+			_write(path, lambda f : json.dump(metadata, f, indent=1))
+
+	def _metadata(self):
+		# the sweep is identified by its shape, the setpoints, the backend (and its settings) and the settings of the runner,
+		# the points themselves by the key of every batch (see _batch_key).
+		backend_key = 'numpy' if self.field.linear else get_backend_key(self.field.backend)
+		key = field_cache.key('sweep_runner', self.data_items.shape, *self.setpoints.setpoints, backend_key,
+			self.batch_size, self.gradient)
+		backend = 'numpy' if self.field.linear else get_backend_name(self.field.backend)
+
+		return {'key' : key, 'n_points' : self.n_points, 'batch_size' : self.batch_size, 'n_batches' : self.n_batches,
+			'gradient' : self.gradient, 'backend' : backend, 'axes' : sorted(self.setpoints._setpoints.keys()),
+			'labels' : list(self.setpoints.labels), 'units' : list(self.setpoints.units)}
+
+	def _batch(self, batch):
+		'''
+		flat indices and the packed points (see engine.sweep.packed_sweep) of a batch.
+		'''
+		index = np.arange(batch*self.batch_size, min((batch + 1)*self.batch_size, self.n_points))
+		return index, packed_sweep.from_data(self.data_items[int(i)] for i in index)
+
+	@staticmethod
+	def _batch_key(sweep):
+		'''
+		key of the points of a batch, stored in its shard.
+		'''
+		prisms = None if sweep.prisms is None else [p.key() for p in sweep.prisms]
+		return field_cache.key('sweep_runner.batch', sweep.offsets, sweep.centers, sweep.dims, sweep.magnetisation, prisms,
+			sweep.dot_positions, sweep.ext_field)
+
+	def completed(self):
+		'''
+		numbers of the batches that are stored.
+		'''
+		return [batch for batch in range(self.n_batches) if os.path.exists(os.path.join(self.directory, _shard_file(batch)))]
+
+	@property
+	def done(self):
+		return len(self.completed()) == self.n_batches
+
+	def run(self, n_batches=None, progress=None):
+		'''
+		evaluate the batches that are not completed yet.
+
+		Args:
+			n_batches (int) : maximal number of batches that are evaluated in this call (None : all the remaining batches)
+			progress (function) : called as progress(n_completed, n_batches) after every batch
+
+		Returns:
+			view (qubit_view) : view of the results so far (see load_sweep)
+		'''
+		completed = set(self.completed())
+		remaining = [batch for batch in range(self.n_batches) if batch not in completed][:n_batches]
+
+		for batch in remaining:
+			with stage('sweep_runner.batch', n_points=min(self.batch_size, self.n_points - batch*self.batch_size)):
+				index, sweep = self._batch(batch)
+				B, J = self.field._evaluate_points(sweep, self.gradient)
+
+				shard = {'index' : index, 'key' : self._batch_key(sweep), 'B' : 1e-3*B, 'ext_field' : sweep.ext_field}
+				if self.gradient:
+					shard['dB'] = 1e-9*J
+				_write(os.path.join(self.directory, _shard_file(batch)), lambda f : np.savez(f, **shard))
+
+			completed.add(batch)
+			if progress is not None:
+				progress(len(completed), self.n_batches)
+
+		return self.view()
+
+	def view(self):
+		'''
+		view of the results so far (see load_sweep).
+		'''
+		return load_sweep(self.directory)
+
+def load_sweep(directory):
+	'''
+	load the results of a sweep_runner, the sweep points that are not evaluated (yet) are NaN.
+
+	Args:
+		directory (str) : directory of the sweep
+
+	Returns:
+		view (qubit_view) : view of the fields at the qubits, it can only show the stored results (fields are not calculated).
+	'''
+	directory = os.path.expanduser(directory)
+	with open(os.path.join(directory, _metadata_file)) as f:
+		metadata = json.load(f)
+
+	setpoints = setpoint_mgr()
+	with np.load(os.path.join(directory, _setpoints_file)) as values:
+		for axis, label, unit in zip(metadata['axes'], metadata['labels'], metadata['units']):
+			setpoints += setpoint(axis, (label,), (unit,), (values['axis_{}'.format(axis)],))
+
+	B = ext_field = dB = None
+	for batch in range(metadata['n_batches']):
+		path = os.path.join(directory, _shard_file(batch))
+		if not os.path.exists(path):
+			continue
+
+		with np.load(path) as shard:
+			if B is None:
+				n_dots = shard['B'].shape[1]
+				B = np.full((metadata['n_points'], n_dots, 3), np.nan)
+				ext_field = np.zeros((metadata['n_points'], 3))
+				dB = np.full((metadata['n_points'], n_dots, 3, 3), np.nan) if metadata['gradient'] else None
+
+			index = shard['index']
+			B[index] = shard['B']
+			ext_field[index] = shard['ext_field']
+			if dB is not None:
+				dB[index] = shard['dB']
+
+	if B is None:
+		raise ValueError('no batches of the sweep in {} are completed yet.'.format(directory))
+
+	view = qubit_view(None, setpoints)
+	view.field.ext_field = view.field._sweep_grid(ext_field)[...,np.newaxis,:]
+	view.field._store_sweep(B, dB)
+	return view
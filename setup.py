@@ -7,4 +7,5 @@ setup(name="micromagnet_simulator",
 	author='Stephan Philips',
 	version="1.0",
 	packages = find_packages(),
-	install_requires=['gdspy', 'magpylib'])
+	install_requires=['gdspy', 'magpylib', 'scipy'],
+	extras_require={'compiled' : ['numba'], 'hdf5' : ['h5py']})
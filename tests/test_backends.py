@@ -0,0 +1,142 @@
+import numpy as np
+import pytest
+
+from micromagnet_simulator.engine import backends as backends_module, compiled
+from micromagnet_simulator.engine.backends import get_backend, magpylib_backend, multipole_backend
+from micromagnet_simulator.magnet_creator import umag_creator
+
+backends = ['numpy', pytest.param('compiled', marks=pytest.mark.skipif(not compiled.available, reason='numba is not installed'))]
+
+# magpylib is the reference, with a small step for its finite difference derivatives (unit in mm).
+reference = magpylib_backend(h=1e-8)
+
+def random_design(seed, prisms=False):
+	rng = np.random.default_rng(seed)
+	umag = umag_creator()
+	umag.set_magnetisation(*rng.uniform(-1, 1, 3))
+	for _ in range(6):
+		dims = rng.uniform(20, 200, 3)
+		umag.add_cube(*rng.uniform(-300, 300, 2), dims[2]/2 + rng.uniform(0, 50), *dims)
+	if prisms:
+		umag.add_polygon([(0, 0), (150, -20), (180, 90), (60, 200), (-50, 100)], 'z', 50, 80)
+		umag.add_triangle(-200, 0, 0, -100, 0, 0, -200, 0, 150, 'y', 100, n_magnets=None)
+	return umag.data[0]
+
+def random_positions(seed, n_points=200):
+	rng = np.random.default_rng(seed)
+	return np.stack([rng.uniform(-400, 400, n_points), rng.uniform(-400, 400, n_points), rng.uniform(-120, -30, n_points)], axis=1)*1e-6
+
+def assert_field_equal(B, J, B_ref, J_ref):
+	np.testing.assert_allclose(B, B_ref, rtol=1e-9, atol=1e-9*np.max(np.abs(B_ref)))
+	assert np.max(np.linalg.norm(J - J_ref, axis=(1,2)))/np.max(np.linalg.norm(J_ref, axis=(1,2))) < 1e-6
+
+@pytest.mark.parametrize('backend', backends)
+@pytest.mark.parametrize('prisms', [False, True])
+def test_field(backend, prisms):
+	collection = random_design(0, prisms).make_collection()
+	positions = random_positions(1)
+
+	B_ref, J_ref = reference.getB_jacobian(collection, positions)
+	B, J = get_backend(backend).getB_jacobian(collection, positions)
+	assert_field_equal(B, J, B_ref, J_ref)
+	np.testing.assert_array_equal(get_backend(backend).getB(collection, positions), B)
+
+@pytest.mark.parametrize('backend', backends)
+def test_batched(backend):
+	# sets of boxes with the same number of boxes (e.g. the points of a sweep), every set with its own observation points.
+	designs = [random_design(seed) for seed in range(5)]
+	positions = np.stack([random_positions(10 + seed, 50) for seed in range(5)])
+	centers, dims, magnetisation = [np.stack([getattr(design.sources, name) for design in designs]) for name in ('centers', 'dims', 'magnetisation')]
+
+	B, J = get_backend(backend).getB_batched(centers, dims, magnetisation, positions, jacobian=True)
+	np.testing.assert_array_equal(get_backend(backend).getB_batched(centers, dims, magnetisation, positions), B)
+	for i, design in enumerate(designs):
+		B_ref, J_ref = reference.getB_jacobian(design.make_collection(), positions[i])
+		assert_field_equal(B[i], J[i], B_ref, J_ref)
+
+def surface_and_extensions():
+	'''
+	points on the surface of a box centered at the origin with dimensions (200, 100, 50) nm (faces, edges and corners),
+	and points on the extensions of its edges and in the planes of its faces, unit in mm.
+	'''
+	surface = np.array([[0, 0, 25], [50, 20, -25], [100, 0, 0], [-30, 50, 10], [0, 50, 25], [100, -50, 10], [-100, 50, -25]])
+	extensions = np.array([[100, 50, 60], [100, 80, 25], [-150, -50, -25], [30, 120, -25], [150, 50, 0], [0, 90, 25]])
+	return surface*1e-6, extensions*1e-6
+
+@pytest.mark.parametrize('backend', backends)
+def test_surface_and_edge_extensions(backend):
+	umag = umag_creator()
+	umag.set_magnetisation(0.3, 0.5, 1)
+	umag.add_cube(0, 0, 0, 200, 100, 50)
+	collection = umag.data[0].make_collection()
+	surface, extensions = surface_and_extensions()
+
+	# the field is not defined on the surface of a magnet.
+	B, J = get_backend(backend).getB_jacobian(collection, surface)
+	assert np.all(np.isnan(B)) and np.all(np.isnan(J))
+	assert np.all(np.isnan(get_backend(backend).getB(collection, surface)))
+
+	# on the extensions of the edges magpylib returns NaN, the backends return the limit of the field.
+	B, J = get_backend(backend).getB_jacobian(collection, extensions)
+	assert np.all(np.isfinite(B)) and np.all(np.isfinite(J))
+	np.testing.assert_array_equal(get_backend(backend).getB(collection, extensions), B)
+	B_magpylib = reference.getB(collection, extensions)
+	assert np.any(np.isnan(B_magpylib))
+
+	finite = np.all(np.isfinite(B_magpylib), axis=1)
+	np.testing.assert_allclose(B[finite], B_magpylib[finite], rtol=1e-9, atol=1e-9*np.max(np.abs(B)))
+	# magpylib suffers from cancellation close to the extensions, it is accurate again about 1e-3 nm away from them.
+	B_near = reference.getB(collection, extensions + np.array([1e-9, -2e-9, 1.5e-9]))
+	np.testing.assert_allclose(B, B_near, rtol=1e-4, atol=1e-4*np.max(np.abs(B)))
+
+def test_compiled_fallback(monkeypatch):
+	monkeypatch.setattr(compiled, 'available', False)
+	with pytest.warns(UserWarning, match='numba'):
+		get_backend('compiled')
+
+def array_of_pieces():
+	# 12x12 pieces of a micromagnet, and points around and below them (unit in mm).
+	umag = umag_creator()
+	umag.set_magnetisation(1, 0.3, -0.2)
+	for i in range(12):
+		for j in range(12):
+			umag.add_cube(-1100 + 200*i, -1100 + 200*j, 50, 150, 120, 100)
+	rng = np.random.default_rng(3)
+	positions = np.stack([rng.uniform(-1500, 1500, 300), rng.uniform(-1500, 1500, 300), rng.uniform(-200, -30, 300)], axis=1)*1e-6
+	return umag.data[0].make_collection(), positions
+
+@pytest.mark.parametrize('tolerance', [1e-2, 1e-3, 1e-4])
+def test_multipole_accuracy(tolerance):
+	collection, positions = array_of_pieces()
+	B_ref, J_ref = get_backend('numpy').getB_jacobian(collection, positions)
+
+	# the error relative to the largest field is about tolerance/2 (or smaller).
+	B, J = multipole_backend(tolerance, leaf_size=4).getB_jacobian(collection, positions)
+	assert 0 < np.max(np.abs(B - B_ref))/np.max(np.abs(B_ref)) < tolerance/2
+	assert np.max(np.abs(J - J_ref))/np.max(np.abs(J_ref)) < tolerance/2
+	np.testing.assert_allclose(multipole_backend(tolerance, leaf_size=4).getB(collection, positions), B, rtol=1e-12)
+
+	B, J = multipole_backend(0, leaf_size=4).getB_jacobian(collection, positions)
+	assert_field_equal(B, J, B_ref, J_ref)
+
+def test_multipole_octree_cache(monkeypatch):
+	builds = []
+	build = backends_module.octree
+	def counting_octree(*args):
+		builds.append(args)
+		return build(*args)
+	monkeypatch.setattr(backends_module, 'octree', counting_octree)
+
+	collection, positions = array_of_pieces()
+	backend = multipole_backend(leaf_size=4)
+	B = np.concatenate([backend.getB(collection, positions[i:i+100]) for i in range(0, len(positions), 100)])
+	backend.getB_jacobian(collection, positions)
+	# the octree is built once for all the chunks of the same magnets.
+	assert len(builds) == 1
+
+	# and again when the magnets are moved.
+	collection.move((0, 0, 1e-4))
+	B_moved = backend.getB(collection, positions)
+	assert len(builds) == 2
+	np.testing.assert_allclose(B_moved, multipole_backend(leaf_size=4).getB(collection, positions), rtol=1e-12)
+	assert not np.allclose(B_moved, B)
@@ -0,0 +1,132 @@
+import tracemalloc
+import warnings
+
+import magpylib as magpy
+import numpy as np
+import pytest
+
+from micromagnet_simulator.engine.box import box_field, box_field_batched
+
+def magpylib_field(centers, dims, magnetisation, positions):
+	boxes = [magpy.source.magnet.Box(mag=tuple(m), dim=tuple(d), pos=tuple(c)) for c, d, m in zip(centers, dims, magnetisation)]
+	with warnings.catch_warnings():
+		warnings.simplefilter('ignore', RuntimeWarning)
+		return magpy.Collection(*boxes).getB(positions)
+
+def random_boxes(rng, n_boxes):
+	centers = rng.uniform(-1, 1, (n_boxes, 3))
+	dims = rng.uniform(0.1, 1, (n_boxes, 3))
+	magnetisation = rng.uniform(-1000, 1000, (n_boxes, 3))
+	return centers, dims, magnetisation
+
+def edge_extensions(dims, distance=(0.3, 2.)):
+	'''
+	points on the extensions of the 12 edges of a box centered at the origin, on both sides of the box.
+	'''
+	half = np.asarray(dims)/2
+	points = []
+	for axis in range(3):
+		others = [i for i in range(3) if i != axis]
+		for s1 in (-1, 1):
+			for s2 in (-1, 1):
+				for sign in (-1, 1):
+					for d in distance:
+						point = np.zeros(3)
+						point[others[0]] = s1*half[others[0]]
+						point[others[1]] = s2*half[others[1]]
+						point[axis] = sign*(half[axis] + d)
+						points.append(point)
+	return np.array(points)
+
+def test_box_field_random():
+	rng = np.random.default_rng(1)
+	for _ in range(5):
+		centers, dims, magnetisation = random_boxes(rng, 8)
+		positions = rng.uniform(-3, 3, (500, 3))
+
+		B = box_field(centers, dims, magnetisation, positions)
+		B_ref = magpylib_field(centers, dims, magnetisation, positions)
+
+		error = np.linalg.norm(B - B_ref, axis=1)/np.linalg.norm(B_ref, axis=1)
+		assert np.max(error) < 1e-9
+
+def test_box_field_edge_extensions():
+	dims = np.array([[1., 2., 3.]])
+	magnetisation = np.array([[100., 200., 300.]])
+	positions = edge_extensions(dims[0])
+
+	B = box_field(np.zeros((1, 3)), dims, magnetisation, positions)
+	B_ref = magpylib_field(np.zeros((1, 3)), dims, magnetisation, positions)
+
+	# magpylib has no value for part of these points, the limit is finite and continuous.
+	assert np.any(np.isnan(B_ref))
+	assert np.all(np.isfinite(B))
+
+	finite = np.all(np.isfinite(B_ref), axis=1)
+	np.testing.assert_allclose(B[finite], B_ref[finite], rtol=1e-9, atol=1e-9)
+
+	offset = np.array([1e-7, -2e-7, 1.5e-7])
+	B_near = box_field(np.zeros((1, 3)), dims, magnetisation, positions + offset)
+	np.testing.assert_allclose(B, B_near, rtol=1e-5, atol=1e-5)
+
+def finite_differences(centers, dims, magnetisation, positions, step=1e-5):
+	J = np.zeros(positions.shape + (3,))
+	for j in range(3):
+		shift = np.zeros(3)
+		shift[j] = step
+		J[...,j] = (box_field(centers, dims, magnetisation, positions + shift) - box_field(centers, dims, magnetisation, positions - shift))/(2*step)
+	return J
+
+def test_box_jacobian_random():
+	rng = np.random.default_rng(2)
+	centers, dims, magnetisation = random_boxes(rng, 8)
+	positions = rng.uniform(-3, 3, (500, 3))
+
+	B, J = box_field(centers, dims, magnetisation, positions, jacobian=True)
+	np.testing.assert_array_equal(B, box_field(centers, dims, magnetisation, positions))
+
+	J_ref = finite_differences(centers, dims, magnetisation, positions)
+	error = np.linalg.norm(J - J_ref, axis=(1,2))/np.linalg.norm(J_ref, axis=(1,2))
+	assert np.max(error) < 1e-6
+
+def test_box_jacobian_edge_extensions():
+	dims = np.array([[1., 2., 3.]])
+	magnetisation = np.array([[100., 200., 300.]])
+
+	# on the extensions of the edges and close to them, where the arctan terms of single corners diverge.
+	for offset in (0, 1e-6, 1e-3):
+		positions = edge_extensions(dims[0]) + offset*np.array([1, -1, 1])
+		B, J = box_field(np.zeros((1, 3)), dims, magnetisation, positions, jacobian=True)
+		assert np.all(np.isfinite(J))
+
+		J_ref = finite_differences(np.zeros((1, 3)), dims, magnetisation, positions)
+		error = np.linalg.norm(J - J_ref, axis=(1,2))/np.linalg.norm(J_ref, axis=(1,2))
+		assert np.max(error) < 1e-6
+
+@pytest.mark.parametrize('chunk_size', [2**18, 2**12, 1000])
+def test_box_field_batched(chunk_size):
+	# chunks of several sets (2**18), and of the boxes and points within a set (2**12 and 1000 < 40x300 pairs per set).
+	rng = np.random.default_rng(5)
+	sets = [random_boxes(rng, 40) for _ in range(6)]
+	centers, dims, magnetisation = [np.stack(data) for data in zip(*sets)]
+	positions = rng.uniform(-2, 2, (6, 300, 3))
+
+	B, J = box_field_batched(centers, dims, magnetisation, positions, chunk_size, jacobian=True)
+	np.testing.assert_array_equal(box_field_batched(centers, dims, magnetisation, positions, chunk_size), B)
+	for i in range(6):
+		B_set, J_set = box_field(centers[i], dims[i], magnetisation[i], positions[i], jacobian=True)
+		np.testing.assert_allclose(B[i], B_set, rtol=1e-12, atol=1e-12*np.max(np.abs(B_set)))
+		np.testing.assert_allclose(J[i], J_set, rtol=1e-12, atol=1e-12*np.max(np.abs(J_set)))
+
+def test_box_field_batched_memory():
+	# a single set of 50x4000 box-point pairs, the temporary arrays are bounded by the chunk size.
+	rng = np.random.default_rng(6)
+	centers, dims, magnetisation = [data[np.newaxis] for data in random_boxes(rng, 50)]
+	positions = rng.uniform(-2, 2, (1, 4000, 3))
+
+	tracemalloc.start()
+	box_field_batched(centers, dims, magnetisation, positions, chunk_size=2**13, jacobian=True)
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	# a chunk of 2**13 pairs takes about 5 MB, all the pairs at once about 100 MB.
+	assert peak < 16*2**20
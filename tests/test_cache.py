@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from micromagnet_simulator.engine.backends import get_backend
+from micromagnet_simulator.engine.cache import set_field_cache
+from micromagnet_simulator.engine.incremental import set_incremental_cache
+from micromagnet_simulator.magnet_creator import umag_creator
+
+@pytest.fixture
+def field_cache(tmp_path):
+	set_field_cache(str(tmp_path))
+	yield
+	set_field_cache(None)
+
+@pytest.fixture
+def incremental_cache():
+	set_incremental_cache(4)
+	yield
+	set_incremental_cache(None)
+
+def image(backend):
+	umag = umag_creator()
+	umag.set_magnetisation(1, 0, 0)
+	for i in range(256):
+		umag.add_cube(100*(i%16), 100*(i//16), 50, 60, 60, 100)
+	view = umag.generate_view()
+	view.backend = backend
+	view.set_image('xy', -3000, -2000, 20, -500, 0, 20, -60)
+	return view.field.field
+
+def test_cache_backend_settings(field_cache, monkeypatch):
+	B_exact = image('numpy')
+	B_multipole = image('multipole')
+	assert not np.allclose(B_multipole, B_exact, rtol=1e-6, atol=0)
+
+	# a field that is cached for other settings of the backend is not reused.
+	with monkeypatch.context() as patch:
+		patch.setattr(get_backend('multipole'), 'tolerance', 0)
+		np.testing.assert_allclose(image('multipole'), B_exact, rtol=1e-12)
+
+	np.testing.assert_array_equal(image('multipole'), B_multipole)
+
+def test_incremental_backend_settings(incremental_cache, monkeypatch):
+	B_exact = image('numpy')
+	B_multipole = image('multipole')
+
+	# the total field of the same points and boxes is only reused for the same settings of the backend.
+	with monkeypatch.context() as patch:
+		patch.setattr(get_backend('multipole'), 'tolerance', 0)
+		np.testing.assert_allclose(image('multipole'), B_exact, rtol=1e-12)
+
+	np.testing.assert_allclose(image('multipole'), B_multipole, rtol=1e-12)
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from micromagnet_simulator.loop_control.looping import linspace
+from micromagnet_simulator.magnet_creator import umag_creator
+
+def cube(magnet):
+	# center and size of a cube in nm.
+	return np.array([magnet.x, magnet.y, magnet.z, magnet.delta_x, magnet.delta_y, magnet.delta_z])*1e6
+
+def test_shape_and_axis_order():
+	xs, ys = np.linspace(-100, 100, 4), np.linspace(0, 50, 3)
+	umag = umag_creator()
+	umag.add_cube(linspace(-100, 100, 4, axis=0, name='x', unit='nm'), linspace(0, 50, 3, axis=1, name='y', unit='nm'), 20, 50, 60, 70)
+	umag.add_electron_position(0, 0, -50)
+
+	# the data is ordered with the last loop axis first, only the operations are stored.
+	assert umag.data.shape == (3, 4)
+	assert umag.data.size == 12 and len(umag.data) == 3
+	assert len(umag.data.operations) == 2
+	for j, y in enumerate(ys):
+		for i, x in enumerate(xs):
+			data = umag.data[j, i]
+			assert len(data.u_mag_positions) == 1 and len(data.dot_positions) == 1
+			np.testing.assert_allclose(cube(data.u_mag_positions[0]), [x, y, 20, 50, 60, 70])
+
+	# flat access in C order of the shape, the template is not changed by building the points.
+	flat = umag.data.flat
+	assert len(flat) == 12
+	for k, data in enumerate(umag.data.flatten()):
+		j, i = np.unravel_index(k, (3, 4))
+		np.testing.assert_allclose(cube(data.u_mag_positions[0])[:2], [xs[i], ys[j]])
+		np.testing.assert_allclose(cube(flat[k].u_mag_positions[0]), cube(data.u_mag_positions[0]))
+	np.testing.assert_allclose(cube(flat[-1].u_mag_positions[0])[:2], [xs[-1], ys[-1]])
+	with pytest.raises(IndexError):
+		flat[12]
+	assert umag.data.template.u_mag_positions == [] and umag.data.template.dot_positions == []
+
+	# a loop that is not given an axis gets a new one.
+	umag.set_magnetisation(linspace(0, 1, 2, name='M', unit='T'), 0, 0)
+	assert umag.data.shape == (2, 3, 4)
+	assert umag.data[1, 2, 3].magnetisation == (1000, 0, 0)
+
+def test_kwargs_loop():
+	umag = umag_creator()
+	umag.add_cube(0, 0, 20, 50, delta_y=linspace(100, 300, 3, axis=0, name='length', unit='nm'), delta_z=40)
+
+	assert umag.data.shape == (3,)
+	for i, length in enumerate(np.linspace(100, 300, 3)):
+		np.testing.assert_allclose(cube(umag.data[i].u_mag_positions[0]), [0, 0, 20, 50, length, 40])
+	assert umag._setpoints.labels == ('length',)
+	np.testing.assert_allclose(umag._setpoints.setpoints[0], np.linspace(100, 300, 3))
+
+def test_fixed_collection():
+	umag = umag_creator()
+	umag.set_magnetisation(1, 0, 0)
+	umag.add_cube(0, 0, 0, 10, 10, 10)
+	umag.setCollection()
+	umag.set_magnetisation(0, linspace(0.5, 1.5, 3, axis=0, name='My', unit='T'), 0)
+	umag.add_cube(100, 0, 0, 10, 10, 10)
+
+	for i, My in enumerate(np.linspace(0.5, 1.5, 3)):
+		data = umag.data[i]
+		# the magnets before setCollection keep their magnetisation, the later ones get the swept magnetisation.
+		assert len(data.fixed_magnets) == 1 and len(data.u_mag_positions) == 1
+		magnets = data.magnets
+		assert magnets[0].magnetisation == (1000, 0, 0)
+		np.testing.assert_allclose(magnets[1].magnetisation, (0, My*1e3, 0))
+
+def test_clear_all():
+	umag = umag_creator()
+	umag.add_cube(linspace(-100, 100, 4, axis=0, name='x', unit='nm'), 0, 0, 10, 10, 10)
+	umag.clearAll()
+
+	assert umag.data.shape == (1,) and umag.data.operations == []
+	assert list(umag._setpoints) == []
+	umag.add_cube(0, 0, 0, 10, 10, 10)
+	assert umag.data.shape == (1,) and len(umag.data[0].u_mag_positions) == 1
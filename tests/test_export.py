@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from micromagnet_simulator import export
+from micromagnet_simulator.export import _directory_store, export_field, load_field
+from micromagnet_simulator.loop_control.looping import linspace
+from micromagnet_simulator.magnet_creator import umag_creator
+
+# a directory of npz chunks, and a HDF5 file (h5py is optional).
+filenames = ['field', pytest.param('field.h5', marks=pytest.mark.skipif(export.h5py is None, reason='h5py is not installed'))]
+
+def make_design(x=0):
+	umag = umag_creator()
+	umag.set_magnetisation(1, 0.2, 0)
+	umag.set_external_field(0.1, 0, 0.05)
+	umag.add_cube(x, 0, 100, 400, 300, 200)
+	umag.add_polygon([(300, -100), (500, -100), (400, 150)], 'z', 100, 200)
+	umag.add_electron_position(0, 0, -60)
+	umag.add_electron_position(100, 0, -60)
+	return umag
+
+@pytest.mark.parametrize('filename', filenames)
+def test_image(tmp_path, filename):
+	view = make_design().generate_view()
+	view.set_image('xz', -500, 500, 40, -200, -20, 10, 0)
+	view.unit = 'mT'
+	# small chunks, such that the fields are spread over several chunks.
+	export_field(view.field, str(tmp_path/filename), chunk_bytes=2**12)
+
+	stored = load_field(str(tmp_path/filename))
+	reference = make_design().generate_view()
+	reference.set_image('xz', -500, 500, 40, -200, -20, 10, 0)
+	reference = reference.field
+
+	# the fields are stored in T, the unit and the external field are applied to the parts that are read.
+	assert stored.unit == 'T' and stored.field.shape == reference.field.shape
+	np.testing.assert_allclose(stored.field[...], reference.field, rtol=1e-12, atol=1e-15)
+	np.testing.assert_allclose(stored.d_field[...], reference.d_field, rtol=1e-12, atol=1e-18)
+	np.testing.assert_allclose(stored.Bx, reference.Bx, rtol=1e-12, atol=1e-15)
+	np.testing.assert_allclose(stored.dB('x', 'xy'), reference.dB('x', 'xy'), rtol=1e-12, atol=1e-18)
+	np.testing.assert_allclose(stored.ext_field, (0.1, 0, 0.05))
+
+	stored.unit = 'mT'
+	reference.unit = 'mT'
+	np.testing.assert_allclose(stored.Btot, reference.Btot, rtol=1e-12, atol=1e-12)
+	np.testing.assert_allclose(stored.dB('z', 'x'), reference.dB('z', 'x'), rtol=1e-12, atol=1e-15)
+	stored.ext_field = (0, 0, 0)
+	reference.ext_field = (0, 0, 0)
+	np.testing.assert_allclose(stored.Bz, reference.Bz, rtol=1e-12, atol=1e-12)
+
+	np.testing.assert_allclose(stored.x, np.linspace(-500, 500, 40))
+	np.testing.assert_allclose(stored.z, np.linspace(-200, -20, 10))
+	np.testing.assert_allclose(stored.geometry['centers'], [[0, 0, 100]])
+	np.testing.assert_allclose(stored.geometry['prism_vertices'], [[300, -100], [500, -100], [400, 150]])
+	np.testing.assert_allclose(stored.geometry['dot_positions'], [[0, 0, -60], [100, 0, -60]])
+
+@pytest.mark.parametrize('filename', filenames)
+def test_sweep(tmp_path, filename):
+	view = make_design(linspace(-100, 100, 5, axis=0, name='x', unit='nm')).generate_qubit_prop()
+	export_field(view.field, str(tmp_path/filename), gradient=False)
+
+	stored = load_field(str(tmp_path/filename))
+	reference = make_design(linspace(-100, 100, 5, axis=0, name='x', unit='nm')).generate_qubit_prop().field
+	np.testing.assert_allclose(stored.field[...], reference.field, rtol=1e-12, atol=1e-15)
+	np.testing.assert_allclose(stored.B('xz'), reference.B('xz'), rtol=1e-12, atol=1e-15)
+	assert stored.setpoints.labels == ('x',)
+	np.testing.assert_allclose(stored.setpoints.setpoints[0], np.linspace(-100, 100, 5))
+	with pytest.raises(ValueError):
+		stored.d_field
+
+	# the boxes and the prisms of every sweep point.
+	geometry = stored.geometry
+	np.testing.assert_array_equal(geometry['offsets'], np.arange(6))
+	np.testing.assert_allclose(geometry['centers'][:,0], np.linspace(-100, 100, 5))
+	np.testing.assert_array_equal(geometry['prism_offsets'], np.arange(6))
+	np.testing.assert_array_equal(geometry['prism_n_vertices'], [3]*5)
+	np.testing.assert_allclose(geometry['prism_vertices'], np.tile([[300, -100], [500, -100], [400, 150]], (5, 1)))
+	np.testing.assert_array_equal(geometry['prism_axes'], [2]*5)
+	np.testing.assert_allclose(geometry['prism_levels'], [100]*5)
+	np.testing.assert_allclose(geometry['prism_heights'], [200]*5)
+	np.testing.assert_allclose(geometry['prism_magnetisation'], [[1, 0.2, 0]]*5)
+
+def test_chunked_array(tmp_path):
+	data = np.arange(3*50*4*3, dtype=float).reshape(3, 50, 4, 3)
+	store = _directory_store(str(tmp_path/'store'), 'w')
+	# chunks of 7 elements along the largest axis (axis 1).
+	info = store.write_array('data', data, 2., 7*3*4*3*8)
+	assert info['axis'] == 1 and info['chunk'] == 7
+	array = store.array('data', info)
+	assert array.shape == data.shape and array.ndim == 4
+
+	data = 2*data
+	for key in (0, -1, 1, (slice(None), 3), (slice(None), -8), (1, slice(5, 30, 4)), (slice(None), slice(None, None, -3), 2),
+			(Ellipsis, 1), (2, Ellipsis), (0, Ellipsis, 2), (slice(None), [40, 3, 4, 49, 10]), (1, [6, 7, 8], Ellipsis, 0),
+			(slice(None), slice(10, 10)), Ellipsis):
+		np.testing.assert_array_equal(array[key], data[key], err_msg=str(key))
+	np.testing.assert_array_equal(np.asarray(array), data)
@@ -0,0 +1,181 @@
+import numpy as np
+import pytest
+
+from micromagnet_simulator.fields import field, field_adaptive, field_points, field_views
+from micromagnet_simulator.magnet_creator import umag_creator
+
+def make_design():
+	umag = umag_creator()
+	umag.set_magnetisation(1, 0.2, 0)
+	umag.add_cube(-300, 0, 100, 400, 300, 200)
+	umag.add_cube(300, 50, 100, 400, 300, 200)
+	return umag
+
+def make_collection():
+	return make_design().data[0].make_collection()
+
+# 'xz' image below the magnets (unit in nm).
+views = ((-500, 500, 21), (0, 0, 1), (-200, -20, 10))
+
+def assert_close(value, reference, rtol):
+	np.testing.assert_allclose(value, reference, rtol=0, atol=rtol*np.max(np.abs(reference)))
+
+def test_float32():
+	collection = make_collection()
+	single = field(collection, views, precision='float32', ext_field=(0.1, 0, 0))
+	double = field(collection, views, ext_field=(0.1, 0, 0))
+
+	assert single.field.dtype == np.float32 and single.d_field.dtype == np.float32
+	assert double.field.dtype == np.float64
+	assert_close(single.field, double.field, 1e-6)
+	assert_close(single.d_field, double.d_field, 1e-6)
+
+	# the stored fields are scaled in place, they stay in single precision.
+	single.unit = 'mT'
+	double.unit = 'mT'
+	assert single.field.dtype == np.float32 and single.d_field.dtype == np.float32
+	assert_close(single.field, double.field, 1e-6)
+	assert_close(single.d_field, double.d_field, 1e-6)
+	assert_close(single.Bx, 1e3*field(collection, views, ext_field=(0.1, 0, 0)).Bx, 1e-6)
+
+	with pytest.raises(ValueError):
+		field(collection, views, precision='float16')
+
+def test_iter_tiles_cancel():
+	collection = make_collection()
+	reference = field(collection, views, ext_field=(0.1, 0, 0))
+	tiled = field(collection, views, ext_field=(0.1, 0, 0))
+
+	calls = []
+	out = np.zeros(tiled.grid_shape + (3,))
+	B, dB = tiled.evaluate(tile_size=50, out=out, progress=lambda n_done, n_points : calls.append((n_done, n_points)),
+		cancel=lambda : len(calls) == 2)
+
+	# the first two tiles are written to the output, the rest is untouched and the field is not stored.
+	assert B is out and dB is None
+	assert calls == [(50, 210), (100, 210)]
+	np.testing.assert_allclose(out.reshape(-1, 3)[:100], reference.field.reshape(-1, 3)[:100], rtol=1e-12)
+	assert np.all(out.reshape(-1, 3)[100:] == 0)
+	assert tiled._field is None
+
+	points = [points for points, _, _ in tiled.iter_tiles(tile_size=64)]
+	assert points == [slice(0, 64), slice(64, 128), slice(128, 192), slice(192, 210)]
+	np.testing.assert_allclose(tiled.field, reference.field, rtol=1e-12)
+
+	with pytest.raises(ValueError):
+		tiled.evaluate(tile_size=0)
+	with pytest.raises(ValueError):
+		tiled.evaluate(out=np.zeros((210, 3)))
+
+def test_iter_tiles_memmap(tmp_path):
+	collection = make_collection()
+	reference = field(collection, views, unit='mT', ext_field=(0.1, 0, 0))
+	tiled = field(collection, views, unit='mT', ext_field=(0.1, 0, 0))
+
+	B, dB = tiled.evaluate(gradient=True, tile_size=64, out=str(tmp_path/'B.npy'), d_out=str(tmp_path/'dB.npy'))
+	assert isinstance(B, np.memmap) and isinstance(dB, np.memmap)
+	assert tiled.field is B and tiled.d_field is dB
+	B.flush()
+	dB.flush()
+
+	np.testing.assert_allclose(np.load(tmp_path/'B.npy'), reference.field, rtol=1e-12)
+	np.testing.assert_allclose(np.load(tmp_path/'dB.npy'), reference.d_field, rtol=1e-12, atol=1e-12*np.max(np.abs(reference.d_field)))
+
+def test_iter_tiles_views():
+	collection = make_collection()
+	def make_views():
+		return field_views({'image' : field(collection, views), 'dots' : field_points(collection, [(0, 0, -50), (100, 0, -80)])})
+
+	# a cancelled evaluation does not hand out fields to the views.
+	combined = make_views()
+	calls = []
+	for _ in combined.iter_tiles(tile_size=100, progress=lambda n_done, n_points : calls.append(n_done), cancel=lambda : len(calls) == 1):
+		pass
+	assert calls == [100]
+	assert combined.fields['image']._field is None and combined.fields['dots']._field is None
+
+	combined = make_views()
+	points = [points for points, _, _ in combined.iter_tiles(tile_size=100)]
+	assert points == [slice(0, 100), slice(100, 200), slice(200, 212)]
+	np.testing.assert_allclose(combined.fields['image'].field, field(collection, views).field, rtol=1e-12)
+	np.testing.assert_allclose(combined.fields['dots'].field, field_points(collection, [(0, 0, -50), (100, 0, -80)]).field, rtol=1e-12)
+
+@pytest.mark.parametrize('ext_field', [0.05, (0.1, -0.02, 0.3)])
+def test_ext_field(ext_field):
+	collection = make_collection()
+	magnets = field(collection, views)
+	total = field(collection, views, ext_field=ext_field)
+
+	# the external field is added to every point, the derivatives do not change.
+	np.testing.assert_allclose(total.field, magnets.field + np.asarray(ext_field), rtol=1e-12, atol=1e-15)
+	np.testing.assert_array_equal(total.d_field, magnets.d_field)
+
+	total.unit = 'mT'
+	np.testing.assert_allclose(total.field, 1e3*(magnets.field + np.asarray(ext_field)), rtol=1e-12, atol=1e-12)
+	np.testing.assert_allclose(total.d_field, 1e3*magnets.d_field, rtol=1e-12)
+
+	# changing the external field updates the stored field in place, in the current unit.
+	total.ext_field = (0, 0, 0.2)
+	np.testing.assert_allclose(total.field, 1e3*(magnets.field + np.array([0, 0, 0.2])), rtol=1e-12, atol=1e-12)
+	total.ext_field = ()
+	np.testing.assert_allclose(total.field, 1e3*magnets.field, rtol=1e-12, atol=1e-12)
+	np.testing.assert_allclose(total.d_field, 1e3*magnets.d_field, rtol=1e-12)
+
+@pytest.mark.parametrize('gradient', [False, True])
+def test_field_adaptive(gradient):
+	collection = make_collection()
+	image = ((-800, 800, 257), (0, 0, 1), (-300, -20, 129))
+	adaptive = field_adaptive(collection, image, tolerance=1e-3, ext_field=(0.1, 0, 0))
+	dense = field(collection, image, ext_field=(0.1, 0, 0))
+
+	# the interpolation error stays below the tolerance (relative to the largest field), with fewer evaluations than points.
+	name = 'd_field' if gradient else 'field'
+	error = np.max(np.abs(getattr(adaptive, name) - getattr(dense, name)))/np.max(np.abs(getattr(dense, name)))
+	assert error < 1e-3/2
+	assert 0 < adaptive.n_evaluations < 0.7*dense.n_points
+
+	# a zoom on the points of the grid uses the same samples.
+	zoom = ((-200, 200, 65), (0, 0, 1), (-160, -20, 65))
+	resampled = adaptive.resample(zoom)
+	np.testing.assert_allclose(getattr(resampled, name), getattr(field(collection, zoom, ext_field=(0.1, 0, 0)), name),
+		rtol=0, atol=1e-3/2*np.max(np.abs(getattr(dense, name))))
+	assert resampled.tree is adaptive.tree and resampled.n_evaluations == adaptive.n_evaluations
+
+	with pytest.raises(ValueError):
+		adaptive.resample(((-200, 200, 65), (0, 0, 1), (-50, -50, 1)))
+	with pytest.raises(ValueError):
+		adaptive.resample(((-200, 200, 65), (10, 10, 1), (-160, -20, 65)))
+
+def test_field_views():
+	view = make_design().generate_view()
+	view.add_image('xy', 'xy', -500, 500, 20, -400, 400, 15, -30)
+	view.add_slice('cut', 'y', -1000, 1000, 50, 0, -30)
+	view.add_points('dots', [(0, -40, -30), (0, 40, -30), (100, 0, -60)])
+
+	separate = {'xy' : field(view.collection, view.registered_views['xy']), 'cut' : field(view.collection, view.registered_views['cut']),
+		'dots' : field_points(view.collection, view.registered_views['dots'])}
+
+	# the views are evaluated together, their fields are slices of one buffer.
+	fields = view.evaluate_views(gradient=True)
+	assert list(fields) == ['xy', 'cut', 'dots']
+	for name, reference in separate.items():
+		assert fields[name].field.shape == reference.field.shape
+		np.testing.assert_allclose(fields[name].field, reference.field, rtol=1e-12, atol=1e-15)
+		np.testing.assert_allclose(fields[name].d_field, reference.d_field, rtol=1e-12, atol=1e-18)
+		assert np.shares_memory(fields[name].field, view._field_views.field)
+
+	# the selected view follows the unit of the plot_view, also the views that are selected later.
+	view.select_view('cut')
+	view.unit = 'mT'
+	np.testing.assert_allclose(view.field.field, 1e3*separate['cut'].field, rtol=1e-12, atol=1e-12)
+	view.select_view('dots')
+	assert view.field.unit == 'mT'
+	np.testing.assert_allclose(view.field.Bx, 1e3*separate['dots'].Bx, rtol=1e-12, atol=1e-12)
+	np.testing.assert_allclose(view.field.dB('x', 'y'), 1e3*separate['dots'].dB('x', 'y'), rtol=1e-12, atol=1e-15)
+	view.unit = 'T'
+	view.select_view('cut')
+	np.testing.assert_allclose(view.field.field, separate['cut'].field, rtol=1e-12, atol=1e-15)
+	assert view.views == view.registered_views['cut']
+
+	with pytest.raises(ValueError):
+		view.select_view('missing')
@@ -0,0 +1,104 @@
+import gdspy
+import numpy as np
+import pytest
+
+from micromagnet_simulator.gds_import import read_gds, merge_polygons, simplify_polygon, load_gds
+from micromagnet_simulator.magnet_creator import umag_creator
+
+@pytest.fixture
+def layout(tmp_path):
+	'''
+	GDS file (unit um) with an L-shaped magnet drawn as two touching rectangles and a referenced pad on layer 1 (datatype 0),
+	a triangle on layer 1 (datatype 2) and a rectangle on layer 2.
+	'''
+	library = gdspy.GdsLibrary(unit=1e-6, precision=1e-9)
+	# the cells are not added to the global library of gdspy, such that the layout can be made once per test.
+	pad = gdspy.Cell('pad', exclude_from_current=True)
+	pad.add(gdspy.Rectangle((0, 0), (0.1, 0.05), layer=1, datatype=0))
+
+	top = gdspy.Cell('top', exclude_from_current=True)
+	top.add(gdspy.Rectangle((0, 0), (0.2, 0.1), layer=1, datatype=0))
+	top.add(gdspy.Rectangle((0.1, 0.1), (0.2, 0.3), layer=1, datatype=0))
+	top.add(gdspy.CellReference(pad, (-0.3, 0.2)))
+	top.add(gdspy.Polygon([(0.4, 0), (0.6, 0), (0.4, 0.2)], layer=1, datatype=2))
+	top.add(gdspy.Rectangle((-1, -1), (1, 1), layer=2, datatype=0))
+	library.add(top)
+
+	filename = str(tmp_path/'layout.gds')
+	library.write_gds(filename)
+	return filename
+
+def test_layer_selection(layout):
+	assert len(read_gds(layout, 1)) == 4
+	assert len(read_gds(layout, 1, datatype=0)) == 3
+	assert len(read_gds(layout, 1, datatype=2)) == 1
+	assert len(read_gds(layout, 2)) == 1
+	assert len(read_gds(layout, 3)) == 0
+
+	# the polygons are in nm, the reference to the pad is flattened.
+	areas = sorted(abs(gdspy.Polygon(polygon).area()) for polygon in read_gds(layout, 1, datatype=0))
+	np.testing.assert_allclose(areas, [100*50, 100*200, 200*100])
+	pad = min(read_gds(layout, 1, datatype=0), key=lambda polygon : abs(gdspy.Polygon(polygon).area()))
+	np.testing.assert_allclose(np.min(pad, axis=0), [-300, 200])
+
+	assert len(read_gds(layout, 1, cell='pad')) == 1
+	with pytest.raises(ValueError):
+		read_gds(layout, 1, cell='missing')
+
+def test_merge_polygons(layout):
+	merged = merge_polygons(read_gds(layout, 1, datatype=0))
+	# the touching rectangles become one L-shaped polygon, the pad stays apart.
+	assert len(merged) == 2
+	l_shape = max(merged, key=len)
+	assert abs(gdspy.Polygon(l_shape).area()) == pytest.approx(200*100 + 100*200)
+	assert len(simplify_polygon(l_shape, 0)) == 6
+
+	assert merge_polygons([]) == []
+
+def test_simplify_polygon():
+	# a rectangle with a collinear corner and a corner that deviates 0.5 nm from the outline.
+	polygon = np.array([[0., 0.], [100, 0], [200, 0], [200, 100], [100, 100.5], [0, 100]])
+	np.testing.assert_array_equal(simplify_polygon(polygon, 0), polygon[[0, 2, 3, 4, 5]])
+	np.testing.assert_array_equal(simplify_polygon(polygon, 1), polygon[[0, 2, 3, 5]])
+
+	# the fine discretisation of a rounded corner is removed, a triangle is never reduced.
+	angles = np.linspace(0, np.pi/2, 50)
+	arc = np.stack([180 + 20*np.cos(angles), 80 + 20*np.sin(angles)], axis=1)
+	rounded = np.concatenate([[[0, 0], [200, 0]], arc, [[0, 100]]])
+	assert len(simplify_polygon(rounded, 1)) < 10
+	triangle = np.array([[0., 0.], [1, 0], [0, 1]])
+	np.testing.assert_array_equal(simplify_polygon(triangle, 10), triangle)
+
+def test_load_gds_min_area(layout):
+	assert len(load_gds(layout, 1, datatype=0, merge=True)) == 2
+	assert len(load_gds(layout, 1, datatype=0, merge=True, min_area=100*50)) == 1
+
+def field(add_magnet):
+	umag = umag_creator()
+	umag.set_magnetisation(0.5, 0.2, 1)
+	add_magnet(umag)
+	umag.add_electron_position(150, 50, -60)
+	umag.add_electron_position(0, 250, -80)
+	umag.add_electron_position(-250, 200, -40)
+	field = umag.generate_qubit_prop().field
+	return field.field, field.d_field
+
+@pytest.mark.parametrize('merge', [False, True])
+def test_gds_field(layout, merge):
+	offset = (50, -20)
+	B, dB = field(lambda umag : umag.add_gds(layout, 1, 30, 60, datatype=0, merge=merge, offset=offset))
+
+	def add_cubes(umag):
+		# the L-shaped magnet and the pad, shifted by the offset.
+		for x, y, dx, dy in ((100, 50, 200, 100), (150, 200, 100, 200), (-250, 225, 100, 50)):
+			umag.add_cube(x + offset[0], y + offset[1], 30, dx, dy, 60)
+	B_cubes, dB_cubes = field(add_cubes)
+	np.testing.assert_allclose(B, B_cubes, rtol=1e-9, atol=1e-9*np.max(np.abs(B_cubes)))
+	np.testing.assert_allclose(dB, dB_cubes, rtol=1e-6, atol=1e-6*np.max(np.abs(dB_cubes)))
+
+	def add_polygons(umag):
+		for polygon in load_gds(layout, 1, datatype=0, merge=merge):
+			umag.add_polygon(polygon + offset, 'z', 30, 60)
+	B_polygons, dB_polygons = field(add_polygons)
+	np.testing.assert_allclose(B, B_polygons, rtol=1e-12, atol=1e-14)
+	np.testing.assert_allclose(dB, dB_polygons, rtol=1e-12, atol=1e-16)
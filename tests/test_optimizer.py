@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from micromagnet_simulator.optimizer import design_optimizer
+from micromagnet_simulator.magnet_creator import umag_creator
+
+def design(x, width):
+	# a magnet magnetised along z, shifted by x, above a dot at the origin.
+	umag = umag_creator()
+	umag.set_magnetisation(0, 0, 1)
+	umag.add_cube(x, 0, 100, width, 200, 100)
+	umag.add_electron_position(0, 0, -60)
+	return umag
+
+def field_z(fields):
+	return fields.field[...,0,2]
+
+def test_gradient():
+	opt = design_optimizer(design, {'x' : (100, -200, 300), 'width' : (150, 50, 250)}, field_z, constraints=[(field_z, 0, None)])
+	assert opt.backend is None
+
+	# the batched finite differences equal separate evaluations of the shifted designs (one sided at a bound).
+	for x in (np.array([0.3, 0.6]), np.array([1, 0.6])):
+		value, jacobian = opt._evaluate(x)
+		assert jacobian.shape == (2, 2)
+		np.testing.assert_allclose(value, opt.evaluate([opt.parameters(x)])[0], rtol=1e-12)
+		for i in range(2):
+			step = np.zeros(2)
+			step[i] = opt.step
+			upper, lower = np.clip(x + step, 0, 1), np.clip(x - step, 0, 1)
+			difference = (opt.evaluate([opt.parameters(upper)])[0] - opt.evaluate([opt.parameters(lower)])[0])/(upper[i] - lower[i])
+			np.testing.assert_allclose(jacobian[:,i], difference, rtol=1e-9)
+
+	# the values are cached per point.
+	n_designs = opt.n_designs
+	opt._evaluate(np.array([0.3, 0.6]))
+	assert opt.n_designs == n_designs
+
+def test_optimize():
+	# the field below the magnet is largest when the magnet is centered above the dot.
+	opt = design_optimizer(design, {'x' : (100, -200, 300), 'width' : (150, 150, 250)}, field_z, maximize=True)
+	result = opt.optimize(maxiter=50)
+	assert result.success
+	assert result.parameters['x'] == pytest.approx(0, abs=1)
+	assert result.parameters['width'] == pytest.approx(250)
+	assert result.objective == pytest.approx(field_z(design(0, 250).generate_qubit_prop().field)*1e3, rel=1e-6)
+	assert result.n_designs == opt.n_designs == 5*len(opt.history)
+
+	# with an upper bound on the field the optimum lies on the bound.
+	bound = 0.9*result.objective
+	opt = design_optimizer(design, {'x' : (100, -200, 300), 'width' : (150, 150, 250)}, field_z, maximize=True,
+		constraints=[(field_z, None, bound)])
+	result = opt.optimize(maxiter=50)
+	assert result.success
+	assert result.objective == pytest.approx(bound, rel=1e-4)
+
+	with pytest.raises(ValueError):
+		design_optimizer(design, {'x' : (400, -200, 300), 'width' : (150, 150, 250)}, field_z)
+	with pytest.raises(ValueError):
+		design_optimizer(design, {'x' : (100, -200, 300), 'width' : (150, 150, 250)}, field_z, constraints=[(field_z, None, None)])
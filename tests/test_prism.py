@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from micromagnet_simulator.engine.box import box_field
+from micromagnet_simulator.engine.prism import prism_field
+from micromagnet_simulator.magnet_creator import umag_creator
+
+pentagon = np.array([[0., 0.], [0.8, -0.1], [1.0, 0.6], [0.4, 1.1], [-0.3, 0.5]])
+
+@pytest.mark.parametrize('axis', [0, 1, 2])
+def test_rectangle_prism_is_box(axis):
+	rng = np.random.default_rng(axis)
+	center = np.array([0.1, -0.2, 0.3])
+	dims = np.array([0.6, 1.0, 1.4])
+	magnetisation = np.array([100., -200., 300.])
+	positions = rng.uniform(-2, 2, (300, 3))
+
+	# the corners of the rectangle along the other two axes, in increasing order of the axes.
+	others = [i for i in range(3) if i != axis]
+	low, high = center[others] - dims[others]/2, center[others] + dims[others]/2
+	rectangle = np.array([[low[0], low[1]], [high[0], low[1]], [high[0], high[1]], [low[0], high[1]]])
+
+	B, J = prism_field(rectangle, axis, center[axis], dims[axis], magnetisation, positions, jacobian=True)
+	B_box, J_box = box_field(center[np.newaxis], dims[np.newaxis], magnetisation[np.newaxis], positions, jacobian=True)
+
+	np.testing.assert_allclose(B, B_box, rtol=1e-12, atol=1e-12*np.max(np.abs(B_box)))
+	np.testing.assert_allclose(J, J_box, rtol=1e-10, atol=1e-10*np.max(np.abs(J_box)))
+
+@pytest.mark.parametrize('axis', [0, 1, 2])
+def test_prism_jacobian(axis):
+	rng = np.random.default_rng(10 + axis)
+	magnetisation = np.array([300., 200., -100.])
+	level, height = 0.2, 0.5
+
+	# random points and points on the extensions of the edges along the extrusion axis.
+	positions = rng.uniform(-2, 2, (200, 3))
+	others = [i for i in range(3) if i != axis]
+	for corner in pentagon:
+		for w in (level - height, level + height):
+			point = np.zeros(3)
+			point[others] = corner
+			point[axis] = w
+			positions = np.concatenate([positions, [point]])
+
+	B, J = prism_field(pentagon, axis, level, height, magnetisation, positions, jacobian=True)
+	assert np.all(np.isfinite(J))
+
+	step = 1e-5
+	J_ref = np.zeros(J.shape)
+	for j in range(3):
+		shift = np.zeros(3)
+		shift[j] = step
+		J_ref[...,j] = (prism_field(pentagon, axis, level, height, magnetisation, positions + shift)
+			- prism_field(pentagon, axis, level, height, magnetisation, positions - shift))/(2*step)
+
+	error = np.linalg.norm(J - J_ref, axis=(1,2))/np.linalg.norm(J_ref, axis=(1,2))
+	assert np.max(error) < 1e-6
+
+def triangle_field(n_magnets):
+	umag = umag_creator()
+	umag.set_magnetisation(1, 0, 0)
+	umag.add_triangle(0, 0, 0, 200, 0, 0, 0, 300, 0, 'z', 100, n_magnets=n_magnets)
+	umag.add_electron_position(250, 250, -100)
+	umag.add_electron_position(-50, 100, -80)
+	return umag.generate_qubit_prop().field.field
+
+def test_staircase_convergence():
+	B_prism = triangle_field(None)
+	errors = [np.max(np.abs(triangle_field(n) - B_prism)) for n in (10, 20, 40)]
+	# the staircase of n boxes converges to the prism as 1/n^2.
+	np.testing.assert_allclose(np.array(errors[:-1])/errors[1:], 4, rtol=1e-2)
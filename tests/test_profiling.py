@@ -0,0 +1,74 @@
+import json
+
+import numpy as np
+import pytest
+
+from micromagnet_simulator.engine import profile, set_profiling, get_profiler
+from micromagnet_simulator.engine.profiling import stage
+from micromagnet_simulator.magnet_creator import umag_creator
+
+def make_view():
+	umag = umag_creator()
+	umag.set_magnetisation(1, 0, 0)
+	umag.add_cube(-300, 0, 100, 400, 300, 200)
+	umag.add_cube(300, 0, 100, 400, 300, 200)
+	view = umag.generate_view()
+	view.set_image('xz', -500, 500, 40, -200, -20, 10, 0)
+	view.field.chunk_size = 100
+	return view
+
+def test_profile(tmp_path):
+	view = make_view()
+	with profile(trace_memory=True) as profiler:
+		with stage('outer'):
+			view.field.field
+	assert get_profiler() is None
+
+	# the field is evaluated in 4 chunks of 100 points of 2 boxes, nested in the evaluation of the field.
+	report = profiler.report()
+	assert list(report) == ['fields.getB', 'field.evaluate', 'outer']
+	getB, evaluate, outer = report['fields.getB'], report['field.evaluate'], report['outer']
+	assert getB['calls'] == 4 and evaluate['calls'] == 1 and outer['calls'] == 1
+	assert getB['n_points'] == 400 and getB['n_sources'] == 2 and getB['n_pairs'] == 800
+	assert getB['time'] <= evaluate['time'] <= outer['time']
+	assert evaluate['self_time'] == pytest.approx(evaluate['time'] - getB['time'])
+	assert outer['self_time'] == pytest.approx(outer['time'] - evaluate['time'])
+	assert evaluate['peak_bytes'] >= 400*3*8
+
+	table = profiler.table().splitlines()
+	assert table[0].split()[:4] == ['stage', 'calls', 'time', '(s)']
+	assert sorted(line.split()[0] for line in table[1:]) == ['field.evaluate', 'fields.getB', 'outer']
+
+	profiler.save_json(str(tmp_path/'profile.json'))
+	with open(tmp_path/'profile.json') as f:
+		assert json.load(f) == json.loads(json.dumps(report))
+
+	# every call is an event, the nested calls lie within the calls that contain them.
+	profiler.save_chrome_trace(str(tmp_path/'trace.json'))
+	with open(tmp_path/'trace.json') as f:
+		events = json.load(f)['traceEvents']
+	assert sorted(event['name'] for event in events) == ['field.evaluate'] + ['fields.getB']*4 + ['outer']
+	assert all(event['ph'] == 'X' for event in events)
+	parent = {event['name'] : event for event in events}
+	for name, parent_name in (('fields.getB', 'field.evaluate'), ('field.evaluate', 'outer')):
+		for event in events:
+			if event['name'] == name:
+				assert parent[parent_name]['ts'] <= event['ts']
+				assert event['ts'] + event['dur'] <= parent[parent_name]['ts'] + parent[parent_name]['dur'] + 1e-3
+
+def test_set_profiling():
+	set_profiling(True)
+	try:
+		profiler = get_profiler()
+		make_view().field.field
+		assert profiler.report()['fields.getB']['calls'] == 4
+		assert profiler.report()['fields.getB']['peak_bytes'] == 0
+		profiler.clear()
+		assert profiler.report() == {}
+	finally:
+		set_profiling(False)
+	assert get_profiler() is None
+
+	# without a profiler nothing is recorded.
+	with stage('not recorded'):
+		np.zeros(3)
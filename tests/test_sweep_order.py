@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from micromagnet_simulator.engine import compiled
+from micromagnet_simulator.loop_control.looping import linspace, adaptive_linspace
+from micromagnet_simulator.magnet_creator import umag_creator
+
+def make_design(width, height):
+	umag = umag_creator()
+	umag.set_magnetisation(1, 0, 0)
+	umag.set_external_field(width*1e-4, 0, height*1e-4)
+	umag.add_cube(-width/2 - 50, 0, 50, width, 200, 100)
+	umag.add_cube(100, 0, 50, 100, height, 100)
+	umag.add_electron_position(0, 0, -60)
+	umag.add_electron_position(40, 20, -60)
+	return umag
+
+def single_design_field(width, height, linear):
+	field = make_design(width, height).generate_qubit_prop(linear=linear).field
+	return field.field, field.d_field
+
+def sweep_view(linear, n_workers=None, chunk_size=None):
+	widths = linspace(20, 80, 4, axis=0, name='width', unit='nm')
+	heights = linspace(100, 300, 3, axis=1, name='height', unit='nm')
+	return make_design(widths, heights).generate_qubit_prop(n_workers, chunk_size, linear)
+
+@pytest.mark.parametrize('linear', [False, True])
+def test_sweep_order(linear):
+	field = sweep_view(linear).field
+	assert field.field.shape == (4, 3, 2, 3)
+	assert field.d_field.shape == (3, 4, 3, 2, 3)
+
+	for i, width in enumerate(np.linspace(20, 80, 4)):
+		for j, height in enumerate(np.linspace(100, 300, 3)):
+			B, dB = single_design_field(width, height, linear)
+			np.testing.assert_allclose(field.field[i,j], B, rtol=1e-12, atol=1e-14)
+			np.testing.assert_allclose(field.d_field[:,i,j], dB, rtol=1e-12, atol=1e-16)
+
+def test_process_pool(monkeypatch):
+	# the workers are spawned (as after the compiled backend ran), forking after numba started its threads can hang.
+	monkeypatch.setattr(compiled, 'threads_started', True)
+	field = sweep_view(False).field
+	pool = sweep_view(False, n_workers=2, chunk_size=5).field
+
+	np.testing.assert_allclose(pool.field, field.field, rtol=1e-12, atol=1e-14)
+	np.testing.assert_allclose(pool.d_field, field.d_field, rtol=1e-12, atol=1e-16)
+
+def dense_sweep(n_widths, n_heights):
+	widths = linspace(20, 400, n_widths, axis=0, name='width', unit='nm')
+	heights = linspace(100, 300, n_heights, axis=1, name='height', unit='nm')
+	return make_design(widths, heights).generate_qubit_prop().field
+
+@pytest.mark.parametrize('gradient', [False, True])
+def test_adaptive_sweep_mixed(gradient):
+	# adaptive widths, all the heights are evaluated for every sampled width.
+	widths = adaptive_linspace(20, 400, 129, axis=0, name='width', unit='nm', tolerance=1e-3, n_cells=4)
+	heights = linspace(100, 300, 3, axis=1, name='height', unit='nm')
+	field = make_design(widths, heights).generate_qubit_prop().field
+	dense = dense_sweep(129, 3)
+
+	name = 'd_field' if gradient else 'field'
+	assert getattr(field, name).shape == getattr(dense, name).shape
+	assert np.max(np.abs(getattr(field, name) - getattr(dense, name))) < 1e-3*np.max(np.abs(getattr(dense, name)))
+	assert 0 < field.n_evaluations < 0.6*129*3
+
+	# the samples are points of the sweep, with the fields of all the heights.
+	setpoints, B, dB = field.samples()
+	assert len(setpoints)*3 == field.n_evaluations
+	i = np.searchsorted(np.linspace(20, 400, 129), setpoints[:,0])
+	np.testing.assert_allclose(B, dense.field[i], rtol=1e-12, atol=1e-14)
+	assert (dB is None) != gradient
+
+def test_adaptive_sweep_2d():
+	widths = adaptive_linspace(20, 400, 65, axis=0, name='width', unit='nm', tolerance=1e-2, n_cells=4)
+	heights = adaptive_linspace(100, 300, 65, axis=1, name='height', unit='nm', tolerance=1e-2, n_cells=4)
+	field = make_design(widths, heights).generate_qubit_prop().field
+	dense = dense_sweep(65, 65)
+
+	assert field.field.shape == dense.field.shape == (65, 65, 2, 3)
+	assert np.max(np.abs(field.field - dense.field)) < 1e-2*np.max(np.abs(dense.field))
+	assert 0 < field.n_evaluations < 0.2*65*65
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from micromagnet_simulator import sweep_runner
+from micromagnet_simulator.loop_control.looping import geomspace, linspace
+from micromagnet_simulator.magnet_creator import umag_creator
+from micromagnet_simulator.sweep_runner import load_sweep
+
+def make_design(lengths=None):
+	'''
+	sweep of the position of a cube (axis 0) and of the height of another cube (axis 1),
+	lengths is the length of a third cube, a second loop on axis 0 (the setpoints of axis 0 are the positions).
+	'''
+	umag = umag_creator()
+	umag.set_magnetisation(1, 0, 0)
+	if lengths is not None:
+		umag.add_cube(0, 300, 50, 100, lengths, 100)
+	umag.add_cube(linspace(-200, -50, 4, axis=0, name='x', unit='nm'), 0, 50, 100, 200, 100)
+	umag.add_cube(150, 0, 50, 100, linspace(100, 300, 3, axis=1, name='height', unit='nm'), 100)
+	umag.add_electron_position(0, 0, -60)
+	return umag
+
+def test_resume(tmp_path):
+	directory = str(tmp_path/'sweep')
+	make_design().generate_sweep_runner(directory, batch_size=5).run(n_batches=1)
+
+	runner = make_design().generate_sweep_runner(directory, batch_size=5)
+	assert runner.completed() == [0]
+	runner.run()
+
+	field = load_sweep(directory).field
+	reference = make_design().generate_qubit_prop().field
+	np.testing.assert_allclose(field.field, reference.field, rtol=1e-12, atol=1e-14)
+	np.testing.assert_allclose(field.d_field, reference.d_field, rtol=1e-12, atol=1e-16)
+
+def test_other_sweep(tmp_path):
+	directory = str(tmp_path/'sweep')
+	make_design(linspace(100, 300, 4, axis=0, name='length', unit='nm')).generate_sweep_runner(directory, batch_size=5).run(n_batches=1)
+
+	# the same setpoints and the same first and last sweep points, but other sweep points in between.
+	with pytest.raises(ValueError):
+		make_design(geomspace(100, 300, 4, axis=0, name='length', unit='nm')).generate_sweep_runner(directory, batch_size=5)
+	with pytest.raises(ValueError):
+		make_design(linspace(100, 300, 4, axis=0, name='length', unit='nm')).generate_sweep_runner(directory, batch_size=6)
+
+def test_streaming(tmp_path, monkeypatch):
+	packed = []
+	pack = sweep_runner.packed_sweep.from_data
+	def counting_pack(data_items):
+		sweep = pack(data_items)
+		packed.append(len(sweep))
+		return sweep
+	monkeypatch.setattr(sweep_runner.packed_sweep, 'from_data', counting_pack)
+
+	# the sweep is only packed batch by batch, also when the completed batches are checked on a resume.
+	directory = str(tmp_path/'sweep')
+	make_design().generate_sweep_runner(directory, batch_size=5).run(n_batches=2)
+	assert packed == [5, 5]
+	make_design().generate_sweep_runner(directory, batch_size=5).run()
+	assert packed == [5, 5, 5, 5, 2]
+
+def test_no_gradient(tmp_path):
+	directory = str(tmp_path/'sweep')
+	make_design().generate_sweep_runner(directory, batch_size=5, gradient=False).run()
+
+	field = load_sweep(directory).field
+	np.testing.assert_allclose(field.field, make_design().generate_qubit_prop().field.field, rtol=1e-12, atol=1e-14)
+	with pytest.raises(ValueError, match='gradient=False'):
+		field.d_field
@@ -0,0 +1,87 @@
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+from matplotlib.collections import PolyCollection, QuadMesh
+from matplotlib.image import AxesImage
+
+from micromagnet_simulator.loop_control.looping import geomspace, linspace
+from micromagnet_simulator.magnet_creator import umag_creator
+
+def make_design(width=400):
+	umag = umag_creator()
+	umag.set_magnetisation(1, 0.2, 0)
+	umag.add_cube(-300, 0, 100, width, 300, 200)
+	umag.add_cube(300, 50, 100, 400, 300, 200)
+	umag.add_electron_position(0, 0, -60)
+	return umag
+
+def image_view(n_x=100):
+	view = make_design().generate_view()
+	view.set_image('xz', -500, 500, n_x, -200, -20, 10, 0)
+	return view
+
+def maps(fig):
+	# the colour maps of the plots (the first axes), without the outlines of the magnets.
+	ax = fig.axes[0]
+	return ax.images + [c for c in ax.collections if isinstance(c, (QuadMesh, PolyCollection)) and c.get_array() is not None]
+
+def test_norm_cache():
+	view = image_view()
+	plt.close(view.plot_fields('x'))
+	norm = view._norms['Bx']
+	assert (norm.vmin, norm.vmax) == (np.min(view.field.Bx), np.max(view.field.Bx))
+	plt.close(view.plot_fields('x'))
+	assert view._norms['Bx'] is norm
+
+	# the colour scale follows the fields when they are changed in place.
+	view.field.ext_field = (0.5, 0, 0)
+	plt.close(view.plot_fields('x'))
+	assert view._norms['Bx'].vmin == pytest.approx(norm.vmin + 0.5)
+	view.unit = 'mT'
+	plt.close(view.plot_fields('x'))
+	assert view._norms['Bx'].vmax == pytest.approx(1e3*(norm.vmax + 0.5))
+
+	# a new field with the same values gets its own colour scale.
+	view.set_image('xz', -500, 500, 100, -200, -20, 10, 0)
+	plt.close(view.plot_fields('x'))
+	assert view._norms['Bx'].vmax == pytest.approx(1e3*norm.vmax)
+
+def test_render_image():
+	# more points than pixels, the image is decimated to the size of the axes.
+	view = image_view(4000)
+	fig = view.plot_fields('x')
+	(image,) = maps(fig)
+	assert isinstance(image, AxesImage)
+	assert image.get_array().shape[0] == 10 and image.get_array().shape[1] < 4000
+	np.testing.assert_allclose(image.get_extent()[:2], [-500, 500], atol=1000/image.get_array().shape[1])
+	plt.close(fig)
+
+	# every point is drawn as a polygon, the data is not decimated (the shading depends on the version of matplotlib).
+	view = image_view(50)
+	view.render = 'pcolor'
+	fig = view.plot_derivative('x', 'y')
+	(mesh,) = maps(fig)
+	assert isinstance(mesh, PolyCollection) and mesh.get_array().size >= 49*9
+	plt.close(fig)
+
+	with pytest.raises(ValueError):
+		view.render = 'svg'
+
+def test_render_sweep():
+	# irregular setpoints are drawn as a rasterized mesh.
+	umag = make_design(geomspace(100, 400, 6, axis=0, name='width', unit='nm'))
+	umag.set_magnetisation(linspace(0.5, 1.5, 4, axis=1, name='M', unit='T'), 0, 0)
+	view = umag.generate_qubit_prop(linear=True)
+	fig = view.plot_fields('x')
+	(mesh,) = maps(fig)
+	assert isinstance(mesh, QuadMesh) and mesh.get_rasterized()
+	np.testing.assert_allclose(mesh.get_array().reshape(4, 6), view.field.Bx[:,:,0].T)
+	plt.close(fig)
+
+	view.render = 'pcolor'
+	fig = view.plot_fields('x')
+	(mesh,) = maps(fig)
+	assert not mesh.get_rasterized()
+	plt.close(fig)